@@ -0,0 +1,181 @@
+import os
+import argparse
+import shutil
+import tempfile
+from pathlib import Path
+from dotenv import load_dotenv
+from backend.utils import log, get_conn, calcular_hash_documento
+
+load_dotenv()
+
+# Backend de armazenamento dos anexos e diretório raiz do backend local
+ANEXOS_BACKEND = os.getenv("ANEXOS_BACKEND", "local")
+ANEXOS_DIR = os.getenv("ANEXOS_DIR", str(Path(__file__).resolve().parent.parent / "anexos"))
+TAMANHO_BLOCO = 64 * 1024
+
+class ArmazenamentoAnexos:
+    """
+    Interface dos backends de anexos. O conteúdo é endereçado pelo SHA-256
+    (utils.calcular_hash_documento), então arquivos idênticos são gravados uma vez só.
+    """
+
+    def salvar(self, conteudo):
+        """Grava o conteúdo (se ainda não existir) e retorna o hash."""
+        hash_conteudo = calcular_hash_documento(conteudo)
+        if not self.existe(hash_conteudo):
+            self._gravar(hash_conteudo, conteudo)
+        return hash_conteudo
+
+    def salvar_arquivo(self, caminho, hash_conteudo):
+        """
+        Grava um arquivo já em disco (ex.: anexo temporário da captura) cujo hash
+        já foi calculado. O arquivo de origem pode ser movido ou removido.
+        """
+        if not self.existe(hash_conteudo):
+            self._gravar_arquivo(hash_conteudo, caminho)
+        return hash_conteudo
+
+    def existe(self, hash_conteudo):
+        raise NotImplementedError
+
+    def tamanho(self, hash_conteudo):
+        raise NotImplementedError
+
+    def abrir(self, hash_conteudo):
+        """Retorna um arquivo binário aberto para leitura."""
+        raise NotImplementedError
+
+    def _gravar(self, hash_conteudo, conteudo):
+        raise NotImplementedError
+
+    def _gravar_arquivo(self, hash_conteudo, caminho):
+        with open(caminho, "rb") as f:
+            self._gravar(hash_conteudo, f.read())
+
+    def ler_em_blocos(self, hash_conteudo, tamanho_bloco=TAMANHO_BLOCO, inicio=0, fim=None):
+        """Lê o conteúdo em blocos; `inicio`/`fim` (inclusivo) limitam a um intervalo de bytes."""
+        with self.abrir(hash_conteudo) as f:
+            if inicio:
+                f.seek(inicio)
+            restante = None if fim is None else fim - inicio + 1
+            while restante is None or restante > 0:
+                bloco = f.read(tamanho_bloco if restante is None else min(tamanho_bloco, restante))
+                if not bloco:
+                    break
+                if restante is not None:
+                    restante -= len(bloco)
+                yield bloco
+
+class ArmazenamentoLocal(ArmazenamentoAnexos):
+    """
+    Backend em sistema de arquivos: <raiz>/ab/cd/<hash>.
+    """
+
+    def __init__(self, raiz=None):
+        self.raiz = Path(raiz or ANEXOS_DIR)
+
+    def caminho(self, hash_conteudo):
+        return self.raiz / hash_conteudo[:2] / hash_conteudo[2:4] / hash_conteudo
+
+    def existe(self, hash_conteudo):
+        return self.caminho(hash_conteudo).exists()
+
+    def tamanho(self, hash_conteudo):
+        return self.caminho(hash_conteudo).stat().st_size
+
+    def abrir(self, hash_conteudo):
+        return open(self.caminho(hash_conteudo), "rb")
+
+    def _gravar_arquivo(self, hash_conteudo, caminho):
+        destino = self.caminho(hash_conteudo)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        # Move para um temporário ao lado do destino (copia se for outro disco) e renomeia
+        temporario = destino.parent / f".tmp-{os.path.basename(caminho)}"
+        try:
+            shutil.move(caminho, temporario)
+            os.replace(temporario, destino)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+    def _gravar(self, hash_conteudo, conteudo):
+        destino = self.caminho(hash_conteudo)
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        # Grava num temporário do mesmo diretório e renomeia: leitores nunca veem arquivo parcial
+        fd, temporario = tempfile.mkstemp(dir=destino.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(conteudo)
+            os.replace(temporario, destino)
+        except Exception:
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            raise
+
+BACKENDS = {
+    "local": ArmazenamentoLocal,
+}
+
+def registrar_backend(nome, classe):
+    BACKENDS[nome] = classe
+
+_armazenamento = None
+
+def get_armazenamento():
+    global _armazenamento
+    if _armazenamento is None:
+        if ANEXOS_BACKEND not in BACKENDS:
+            raise ValueError(f"Backend de anexos desconhecido: {ANEXOS_BACKEND}")
+        _armazenamento = BACKENDS[ANEXOS_BACKEND]()
+    return _armazenamento
+
+def migrar_anexos_bytea(lote=50):
+    """
+    Move o conteúdo bytea de anexos_email para o armazenamento, em lotes
+    com commit a cada lote. Pode ser interrompida e executada de novo.
+    """
+    armazenamento = get_armazenamento()
+    conn = get_conn()
+    cur = conn.cursor()
+
+    total = 0
+    ultimo_id = 0
+    try:
+        while True:
+            cur.execute("""
+                SELECT id_anexo, conteudo
+                FROM anexos_email
+                WHERE conteudo IS NOT NULL AND hash_conteudo IS NULL AND id_anexo > %s
+                ORDER BY id_anexo
+                LIMIT %s
+                FOR UPDATE SKIP LOCKED
+            """, (ultimo_id, lote))
+            linhas = cur.fetchall()
+            if not linhas:
+                break
+            for id_anexo, conteudo in linhas:
+                conteudo = bytes(conteudo)
+                hash_conteudo = armazenamento.salvar(conteudo)
+                cur.execute("""
+                    UPDATE anexos_email
+                    SET hash_conteudo = %s, tamanho = %s, conteudo = NULL
+                    WHERE id_anexo = %s
+                """, (hash_conteudo, len(conteudo), id_anexo))
+                ultimo_id = id_anexo
+            conn.commit()
+            total += len(linhas)
+            log(f"📦 {total} anexos migrados para o armazenamento (último id_anexo={ultimo_id})")
+    finally:
+        cur.close()
+        conn.close()
+    log(f"✅ Migração de anexos concluída: {total} anexos movidos.")
+    return total
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move anexos bytea para o armazenamento de blobs.")
+    parser.add_argument("--lote", type=int, default=50)
+    args = parser.parse_args()
+    from backend.migracoes import aplicar_migracoes
+    aplicar_migracoes()
+    migrar_anexos_bytea(lote=args.lote)
@@ -0,0 +1,95 @@
+import os
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend de LLM e endpoint compatível com a API da OpenAI (ex.: servidor_ia_simulado)
+IA_BACKEND = os.getenv("IA_BACKEND", "openai")
+IA_BASE_URL = os.getenv("IA_BASE_URL") or None
+IA_TIMEOUT = float(os.getenv("IA_TIMEOUT", "120"))
+IA_MAX_RETRIES = int(os.getenv("IA_MAX_RETRIES", "2"))
+
+@dataclass
+class RespostaIA:
+    conteudo: Optional[str]
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    recusa: Optional[str] = None
+
+    @property
+    def total_tokens(self):
+        if self.prompt_tokens is None and self.completion_tokens is None:
+            return None
+        return (self.prompt_tokens or 0) + (self.completion_tokens or 0)
+
+class BackendIA:
+    """
+    Interface dos backends de LLM usados por ia_validador. `completar` recebe
+    as mensagens no formato chat e devolve uma RespostaIA; erros de rede/API
+    são propagados como exceção.
+    """
+
+    def completar(self, mensagens, modelo, formato_resposta=None):
+        raise NotImplementedError
+
+class BackendOpenAI(BackendIA):
+    """
+    Cliente oficial da OpenAI. Com `base_url` (IA_BASE_URL) fala com qualquer
+    servidor compatível, inclusive o servidor_ia_simulado para testes de carga.
+    O cliente é criado só no primeiro uso.
+    """
+
+    def __init__(self, base_url=None, api_key=None):
+        self.base_url = base_url or IA_BASE_URL
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY")
+        self._client = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                timeout=IA_TIMEOUT,
+                max_retries=IA_MAX_RETRIES,
+            )
+        return self._client
+
+    def completar(self, mensagens, modelo, formato_resposta=None):
+        parametros = {"model": modelo, "messages": mensagens}
+        if formato_resposta:
+            parametros["response_format"] = formato_resposta
+        response = self.client.chat.completions.create(**parametros)
+        mensagem = response.choices[0].message
+        usage = getattr(response, "usage", None)
+        return RespostaIA(
+            conteudo=mensagem.content,
+            prompt_tokens=usage.prompt_tokens if usage else None,
+            completion_tokens=usage.completion_tokens if usage else None,
+            recusa=getattr(mensagem, "refusal", None),
+        )
+
+BACKENDS_IA = {
+    "openai": BackendOpenAI,
+}
+
+def registrar_backend_ia(nome, classe):
+    BACKENDS_IA[nome] = classe
+
+_backend_ia = None
+
+def get_backend_ia():
+    global _backend_ia
+    if _backend_ia is None:
+        if IA_BACKEND not in BACKENDS_IA:
+            raise ValueError(f"Backend de IA desconhecido: {IA_BACKEND}")
+        _backend_ia = BACKENDS_IA[IA_BACKEND]()
+    return _backend_ia
+
+def definir_backend_ia(backend):
+    """Troca o backend em uso (ex.: teste de carga contra o servidor simulado)."""
+    global _backend_ia
+    _backend_ia = backend
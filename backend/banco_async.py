@@ -0,0 +1,92 @@
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from psycopg.conninfo import make_conninfo
+from psycopg.rows import dict_row
+from psycopg_pool import AsyncConnectionPool
+from backend.utils import log, config_banco
+
+# Pool assíncrono (psycopg 3) usado pelos endpoints da API; jobs e CLIs seguem no pool psycopg2 de utils
+DB_ASYNC_POOL_MIN = int(os.getenv("DB_ASYNC_POOL_MIN", "2"))
+DB_ASYNC_POOL_MAX = int(os.getenv("DB_ASYNC_POOL_MAX", "20"))
+DB_ASYNC_POOL_TIMEOUT = float(os.getenv("DB_ASYNC_POOL_TIMEOUT", "30"))
+DB_ASYNC_POOL_OCIOSA_MAX = float(os.getenv("DB_ASYNC_POOL_OCIOSA_MAX", "300"))
+
+_pool = None
+_pool_lock = asyncio.Lock()
+
+async def get_pool_async():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                pool = AsyncConnectionPool(
+                    make_conninfo(**config_banco()),
+                    min_size=DB_ASYNC_POOL_MIN,
+                    max_size=DB_ASYNC_POOL_MAX,
+                    timeout=DB_ASYNC_POOL_TIMEOUT,
+                    max_idle=DB_ASYNC_POOL_OCIOSA_MAX,
+                    check=AsyncConnectionPool.check_connection,  # SELECT 1 antes de entregar
+                    name="api",
+                    open=False,
+                )
+                await pool.open()
+                _pool = pool
+                log(f"Pool assíncrono de conexões aberto (mín. {DB_ASYNC_POOL_MIN}, máx. {DB_ASYNC_POOL_MAX})")
+    return _pool
+
+async def fechar_pool_async():
+    global _pool
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+@asynccontextmanager
+async def conexao_async():
+    """
+    Conexão assíncrona do pool. Ao sair do bloco faz commit (ou rollback se
+    houve exceção) e devolve a conexão:
+
+        async with conexao_async() as conn:
+            cur = await conn.execute("SELECT ...", (param,))
+    """
+    pool = await get_pool_async()
+    async with pool.connection() as conn:
+        conn.row_factory = dict_row
+        yield conn
+
+# Os helpers abaixo usam os mesmos placeholders %s das consultas psycopg2
+async def buscar_todos(query, params=None):
+    async with conexao_async() as conn:
+        cur = await conn.execute(query, params)
+        return await cur.fetchall()
+
+async def buscar_um(query, params=None):
+    async with conexao_async() as conn:
+        cur = await conn.execute(query, params)
+        return await cur.fetchone()
+
+async def executar(query, params=None):
+    """Executa um comando e retorna o rowcount (commit automático)."""
+    async with conexao_async() as conn:
+        cur = await conn.execute(query, params)
+        return cur.rowcount
+
+def metricas_pool_async():
+    if _pool is None:
+        return {"aberto": False}
+    stats = _pool.get_stats()
+    return {
+        "aberto": True,
+        "minimo": _pool.min_size,
+        "maximo": _pool.max_size,
+        "abertas": stats.get("pool_size", 0),
+        "ociosas": stats.get("pool_available", 0),
+        "em_uso": stats.get("pool_size", 0) - stats.get("pool_available", 0),
+        "aguardando": stats.get("requests_waiting", 0),
+        "emprestimos": stats.get("requests_num", 0),
+        "espera_total_ms": stats.get("requests_wait_ms", 0),
+        "espera_media_ms": round(stats.get("requests_wait_ms", 0) / stats["requests_num"], 2) if stats.get("requests_num") else 0.0,
+        "timeouts": stats.get("requests_errors", 0),
+        "falhas_verificacao": stats.get("connections_lost", 0),
+    }
@@ -0,0 +1,90 @@
+import time
+import json
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor
+
+ENDPOINTS_PADRAO = [
+    "/api/protocolos?limite=50",
+    "/api/esteira?limite=50",
+    "/api/painel-controle/contagem-casos",
+    "/api/pipeline/status",
+]
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))]
+
+def _cliente(base, caminhos, fim, latencias, erros, lock, token=None):
+    """Um cliente com conexão keep-alive disparando requisições em sequência até `fim`."""
+    url = urlsplit(base)
+    classe = http.client.HTTPSConnection if url.scheme == "https" else http.client.HTTPConnection
+    conexao = classe(url.hostname, url.port, timeout=60)
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    i = 0
+    while time.monotonic() < fim:
+        caminho = url.path.rstrip("/") + caminhos[i % len(caminhos)]
+        i += 1
+        inicio = time.monotonic()
+        try:
+            conexao.request("GET", caminho, headers=headers)
+            resposta = conexao.getresponse()
+            resposta.read()
+            ok = resposta.status < 400
+        except (OSError, http.client.HTTPException):
+            conexao.close()
+            conexao = classe(url.hostname, url.port, timeout=60)
+            ok = False
+        with lock:
+            latencias.append(time.monotonic() - inicio)
+            erros[0] += not ok
+    conexao.close()
+
+def medir(base, caminhos, concorrencia, duracao, token=None):
+    """
+    Roda `concorrencia` clientes por `duracao` segundos contra a API em `base`
+    e retorna requisições/s e latências. Serve para comparar a API antes e
+    depois de uma mudança (ex.: handlers síncronos x banco_async).
+    """
+    latencias, erros, lock = [], [0], threading.Lock()
+    fim = time.monotonic() + duracao
+    inicio = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        for _ in range(concorrencia):
+            executor.submit(_cliente, base, caminhos, fim, latencias, erros, lock, token)
+    decorrido = time.monotonic() - inicio
+    return {
+        "concorrencia": concorrencia,
+        "requisicoes": len(latencias),
+        "erros": erros[0],
+        "req_s": round(len(latencias) / decorrido, 1) if decorrido else None,
+        "latencia_p50_ms": round(percentil(latencias, 50) * 1000, 1) if latencias else None,
+        "latencia_p95_ms": round(percentil(latencias, 95) * 1000, 1) if latencias else None,
+        "latencia_p99_ms": round(percentil(latencias, 99) * 1000, 1) if latencias else None,
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark de concorrência da API (rode contra a versão anterior e a atual para comparar)."
+    )
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--endpoint", action="append", help="caminho a exercitar (repetível)")
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 10, 50, 100])
+    parser.add_argument("--duracao", type=float, default=15, help="segundos por nível de concorrência")
+    parser.add_argument("--token", help="JWT, se os endpoints exigirem autenticação")
+    parser.add_argument("--saida", help="arquivo JSON para gravar os resultados")
+    args = parser.parse_args()
+
+    caminhos = args.endpoint or ENDPOINTS_PADRAO
+    resultados = []
+    for concorrencia in args.concorrencia:
+        resultado = medir(args.url, caminhos, concorrencia, args.duracao, args.token)
+        resultados.append(resultado)
+        print(resultado)
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"url": args.url, "endpoints": caminhos, "resultados": resultados}, f, indent=2)
@@ -0,0 +1,135 @@
+import os
+import json
+import hashlib
+import threading
+from backend.utils import log, get_conn
+
+# Cache persistente dos resultados da validação IA
+IA_CACHE = os.getenv("IA_CACHE", "true").lower() == "true"
+IA_CACHE_TTL_DIAS = int(os.getenv("IA_CACHE_TTL_DIAS", "30"))
+IA_CACHE_MAX_ENTRADAS = int(os.getenv("IA_CACHE_MAX_ENTRADAS", "20000"))
+# A limpeza (TTL + tamanho) roda a cada N gravações
+IA_CACHE_LIMPEZA_A_CADA = 100
+
+def normalizar(texto):
+    return " ".join(str(texto).split())
+
+def resultado_cacheavel(resultado):
+    """Só entram no cache respostas válidas da IA: erros e 'aguardar' são sempre refeitos."""
+    return (
+        isinstance(resultado, dict)
+        and not resultado.get("erro_ia")
+        and resultado.get("valido") is not None
+        and str(resultado.get("acao_sugerida") or "").lower() != "aguardar"
+    )
+
+class CacheValidacaoIA:
+    """
+    Cache dos resultados de validar_formal_ia na tabela cache_validacao_ia.
+
+    A chave é o SHA-256 de modelo + versão do template + prompt normalizado
+    (o prompt já contém assunto, corpo truncado, anexos e campos extraídos),
+    então reenvios idênticos do banco e reprocessamentos reaproveitam a resposta.
+    Entradas expiram após IA_CACHE_TTL_DIAS e as menos acessadas recentemente
+    são removidas acima de IA_CACHE_MAX_ENTRADAS.
+    """
+
+    def __init__(self, ttl_dias=None, max_entradas=None):
+        self.ttl_dias = ttl_dias or IA_CACHE_TTL_DIAS
+        self.max_entradas = max_entradas or IA_CACHE_MAX_ENTRADAS
+        self._lock = threading.Lock()
+        self._gravacoes = 0
+        self.acertos = 0
+        self.faltas = 0
+
+    def chave(self, modelo, versao_prompt, prompt):
+        base = "\x1f".join([modelo, versao_prompt, normalizar(prompt)])
+        return hashlib.sha256(base.encode("utf-8")).hexdigest()
+
+    def obter(self, chave):
+        conn = get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                UPDATE cache_validacao_ia
+                SET ultimo_acesso = NOW(), acessos = acessos + 1
+                WHERE chave = %s AND criado_em > NOW() - make_interval(days => %s)
+                RETURNING resultado
+            """, (chave, self.ttl_dias))
+            row = cur.fetchone()
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+        with self._lock:
+            if row:
+                self.acertos += 1
+            else:
+                self.faltas += 1
+        if not row:
+            return None
+        return row[0] if isinstance(row[0], dict) else json.loads(row[0])
+
+    def gravar(self, chave, modelo, versao_prompt, resultado):
+        if not resultado_cacheavel(resultado):
+            return False
+        conn = get_conn()
+        cur = conn.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO cache_validacao_ia (chave, modelo, versao_prompt, resultado)
+                VALUES (%s, %s, %s, %s)
+                ON CONFLICT (chave) DO UPDATE SET
+                    resultado = EXCLUDED.resultado,
+                    criado_em = NOW(),
+                    ultimo_acesso = NOW()
+            """, (chave, modelo, versao_prompt, json.dumps(resultado, ensure_ascii=False)))
+            with self._lock:
+                self._gravacoes += 1
+                limpar = self._gravacoes % IA_CACHE_LIMPEZA_A_CADA == 0
+            if limpar:
+                self._limpar(cur)
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+        return True
+
+    def _limpar(self, cur):
+        cur.execute(
+            "DELETE FROM cache_validacao_ia WHERE criado_em <= NOW() - make_interval(days => %s)",
+            (self.ttl_dias,)
+        )
+        expiradas = cur.rowcount
+        cur.execute("""
+            DELETE FROM cache_validacao_ia
+            WHERE chave IN (
+                SELECT chave FROM cache_validacao_ia
+                ORDER BY ultimo_acesso DESC
+                OFFSET %s
+            )
+        """, (self.max_entradas,))
+        excedentes = cur.rowcount
+        if expiradas or excedentes:
+            log(f"🧹 Cache IA: {expiradas} entradas expiradas e {excedentes} excedentes removidas.")
+
+    def limpar(self):
+        conn = get_conn()
+        cur = conn.cursor()
+        try:
+            self._limpar(cur)
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+
+    def estatisticas(self):
+        with self._lock:
+            consultas = self.acertos + self.faltas
+            return {
+                "acertos": self.acertos,
+                "faltas": self.faltas,
+                "taxa_acerto": round(self.acertos / consultas, 4) if consultas else None,
+            }
+
+cache_validacao_ia = CacheValidacaoIA()
@@ -1,15 +1,22 @@
 import os
+import json
 import email
+import argparse
+import functools
 import poplib
-import json
+import queue
 import socket
+import threading
 from email import policy
 from email.parser import BytesParser
 from email.header import decode_header
-from psycopg2 import connect
+import psycopg2.extras
 from datetime import datetime
 from dotenv import load_dotenv
 from backend.utils import log, get_conn
+from backend.armazenamento_anexos import get_armazenamento
+from backend.leitor_mime import LeitorMime
+from backend.progresso import progresso_captura
 
 socket.setdefaulttimeout(30)
 load_dotenv()
@@ -17,36 +24,31 @@ load_dotenv()
 POP3_HOST = os.getenv("IMAP_HOST")
 POP3_USER = os.getenv("IMAP_USER")
 POP3_PASS = os.getenv("IMAP_PASS")
+# Sessões POP3 simultâneas usadas no download (1 = modo sequencial)
+POP3_SESSOES = int(os.getenv("POP3_SESSOES", "1"))
+# Modo incremental: baixa apenas as mensagens cujo UIDL ainda não foi capturado
+POP3_INCREMENTAL = os.getenv("POP3_INCREMENTAL", "true").lower() == "true"
+# Pré-filtro: lê só os cabeçalhos (TOP n 0) antes de decidir pelo RETR completo
+POP3_PRE_FILTRO = os.getenv("POP3_PRE_FILTRO", "true").lower() == "true"
+# Streaming: interpreta o RETR enquanto chega e grava anexos em disco (memória limitada)
+CAPTURA_STREAMING = os.getenv("CAPTURA_STREAMING", "true").lower() == "true"
+# Tamanho dos lotes gravados de uma vez e intervalo (em mensagens) entre commits
+CAPTURA_LOTE = int(os.getenv("CAPTURA_LOTE", "50"))
+CAPTURA_CHECKPOINT = int(os.getenv("CAPTURA_CHECKPOINT", "200"))
 REMETENTE_ALVO = "respostaoficios@santander.com.br"
-PROGRESS_FILE = "progress_captura.json"
-LOG_FILE = "log_captura_tmp.json"
 
 def limpar_logs_anteriores():
-    if os.path.exists(LOG_FILE):
-        os.remove(LOG_FILE)
+    progresso_captura.iniciar()
 
 def log_frontend(msg, tipo="INFO"):
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    registro = {"tipo": tipo, "mensagem": msg, "timestamp": timestamp}
-    try:
-        with open(LOG_FILE, "a", encoding="utf-8") as f:
-            f.write(json.dumps(registro) + "\n")
-    except:
-        pass
+    progresso_captura.registrar_evento(msg, tipo)
     log(msg, tipo)
 
 def salvar_progresso(total, atual):
-    with open(PROGRESS_FILE, "w", encoding="utf-8") as f:
-        json.dump({"total": total, "atual": atual, "finalizado": False}, f)
-
-def finalizar_progresso():
-    if os.path.exists(PROGRESS_FILE):
-        with open(PROGRESS_FILE, "r+", encoding="utf-8") as f:
-            progresso = json.load(f)
-            progresso["finalizado"] = True
-            f.seek(0)
-            json.dump(progresso, f)
-            f.truncate()
+    progresso_captura.atualizar(total=total, atual=atual)
+
+def finalizar_progresso(status="finalizado"):
+    progresso_captura.finalizar(status)
 
 def decodificar(texto):
     if not texto:
@@ -58,132 +60,742 @@ def decodificar(texto):
     ])
 
 def pipeline_pausado():
+    with get_conn() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT valor FROM controle_pipeline WHERE chave = 'pausar_pipeline'")
+            row = cur.fetchone()
+    return row and row[0].lower() == "true"
+
+def listar_uidl(mail):
+    """
+    Retorna {numero: uidl} da sessão POP3 ou None se o servidor não suportar UIDL.
+    """
+    try:
+        _, linhas, _ = mail.uidl()
+    except poplib.error_proto as e:
+        log_frontend(f"⚠️ Servidor POP3 sem suporte a UIDL: {e}", "WARNING")
+        return None
+    uids = {}
+    for linha in linhas:
+        numero, uid = linha.decode("ascii", errors="ignore").split(None, 1)
+        uids[int(numero)] = uid.strip()
+    return uids
+
+def uidls_capturados(cur, uids):
+    if not uids:
+        return set()
+    cur.execute(
+        "SELECT uidl FROM emails_uidl WHERE conta = %s AND uidl = ANY(%s)",
+        (POP3_USER, list(uids))
+    )
+    return {row[0] for row in cur.fetchall()}
+
+STATUS_RETOMAVEIS = ("em_andamento", "interrompida", "cancelada")
+
+def chave_mensagem(numero, uid=None):
+    """Identifica a mensagem na execução: UIDL quando houver, senão o número POP3."""
+    return uid or f"#{numero}"
+
+def abrir_execucao(cur, parametros, id_execucao=None):
+    """
+    Registra uma nova execução de captura ou reabre `id_execucao` para retomada,
+    carregando as mensagens já tratadas e os totais gravados até o último checkpoint.
+    """
+    if id_execucao is None:
+        cur.execute("""
+            INSERT INTO capturas_execucao (conta, status, parametros)
+            VALUES (%s, 'em_andamento', %s)
+            RETURNING id_execucao
+        """, (POP3_USER, json.dumps(parametros)))
+        return {
+            "id_execucao": cur.fetchone()[0],
+            "tratados": set(),
+            "base": {"salvos": 0, "duplicados": 0},
+        }
+
+    cur.execute("""
+        SELECT salvos, duplicados FROM capturas_execucao
+        WHERE id_execucao = %s FOR UPDATE
+    """, (id_execucao,))
+    row = cur.fetchone()
+    if not row:
+        raise ValueError(f"Execução de captura {id_execucao} não encontrada.")
+    cur.execute("""
+        UPDATE capturas_execucao
+        SET status = 'em_andamento', atualizado_em = NOW(), finalizado_em = NULL
+        WHERE id_execucao = %s
+    """, (id_execucao,))
+    cur.execute("SELECT chave FROM capturas_execucao_itens WHERE id_execucao = %s", (id_execucao,))
+    return {
+        "id_execucao": id_execucao,
+        "tratados": {r[0] for r in cur.fetchall()},
+        "base": {"salvos": row[0], "duplicados": row[1]},
+    }
+
+def atualizar_execucao(cur, gravador, status):
+    """
+    Grava o checkpoint da execução. Deve rodar na mesma transação dos e-mails
+    gravados, para o checkpoint nunca apontar além do que foi commitado.
+    As falhas não se acumulam entre retomadas: as mensagens são tentadas de novo.
+    """
+    execucao = gravador.execucao
+    cur.execute("""
+        UPDATE capturas_execucao
+        SET status = %s,
+            ultimo_numero = GREATEST(ultimo_numero, %s),
+            salvos = %s,
+            duplicados = %s,
+            falhas = %s,
+            atualizado_em = NOW(),
+            finalizado_em = CASE WHEN %s = 'em_andamento' THEN NULL ELSE NOW() END
+        WHERE id_execucao = %s
+    """, (
+        status,
+        gravador.ultimo_numero,
+        execucao["base"]["salvos"] + gravador.salvos,
+        execucao["base"]["duplicados"] + gravador.duplicados,
+        gravador.falhas,
+        status,
+        execucao["id_execucao"],
+    ))
+
+def execucao_retomavel():
+    """Retorna a última execução de captura da conta, se ela não tiver sido concluída."""
     conn = get_conn()
     cur = conn.cursor()
-    cur.execute("SELECT valor FROM controle_pipeline WHERE chave = 'pausar_pipeline'")
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
-    return row and row[0].lower() == "true"
+    try:
+        cur.execute("""
+            SELECT id_execucao, status, parametros
+            FROM capturas_execucao
+            WHERE conta = %s
+            ORDER BY id_execucao DESC
+            LIMIT 1
+        """, (POP3_USER,))
+        row = cur.fetchone()
+    finally:
+        cur.close()
+        conn.close()
+    if not row or row[1] not in STATUS_RETOMAVEIS:
+        return None
+    return {"id_execucao": row[0], "status": row[1], "parametros": row[2] or {}}
+
+def conectar_pop3():
+    mail = poplib.POP3_SSL(POP3_HOST, 995)
+    mail.user(POP3_USER)
+    mail.pass_(POP3_PASS)
+    return mail
+
+def encerrar_pop3(mail):
+    if mail:
+        try:
+            mail.quit()
+        except Exception:
+            pass
+
+def remetente_alvo(cabecalho):
+    _, addr = email.utils.parseaddr(decodificar(cabecalho["From"]))
+    return addr.lower() == REMETENTE_ALVO
+
+def montar_dados(numero, msg, corpo_texto, anexos):
+    """
+    Monta os dados do e-mail a partir do cabeçalho já interpretado.
+    `anexos` é a lista de (nome, tipo, hash_conteudo, tamanho) já gravados no armazenamento.
+    """
+    _, addr = email.utils.parseaddr(decodificar(msg["From"]))
+    message_id = msg.get("Message-ID") or f"<POP3-MSG-{numero}>"
+    assunto = decodificar(msg.get("Subject", ""))
+
+    date_hdr = msg.get("Date", "")
+    try:
+        recebido_em = datetime.strptime(date_hdr[:31], "%a, %d %b %Y %H:%M:%S %z")
+    except:
+        recebido_em = datetime.now()
+
+    return {
+        "numero": numero,
+        "remetente": addr,
+        "message_id": message_id,
+        "assunto": assunto,
+        "corpo_texto": corpo_texto,
+        "recebido_em": recebido_em,
+        "anexos": anexos,
+    }
+
+def interpretar_mensagem(numero, lines):
+    """
+    Converte as linhas retornadas pelo RETR nos dados do e-mail.
+    Retorna None quando o remetente não é o REMETENTE_ALVO.
+    """
+    raw_email = b"\n".join(lines)
+    msg = BytesParser(policy=policy.default).parsebytes(raw_email)
+    if not remetente_alvo(msg):
+        return None
+
+    corpo = msg.get_body(preferencelist=('plain', 'html'))
+    corpo_texto = corpo.get_content().strip() if corpo else None
+
+    armazenamento = get_armazenamento()
+    anexos = []
+    for part in msg.iter_attachments():
+        nome = decodificar(part.get_filename() or "sem_nome")
+        tipo = part.get_content_type()
+        conteudo = part.get_payload(decode=True)
+        if conteudo:
+            anexos.append((nome, tipo, armazenamento.salvar(conteudo), len(conteudo)))
+
+    return montar_dados(numero, msg, corpo_texto, anexos)
+
+def retr_em_fluxo(mail, numero, consumir):
+    """
+    RETR linha a linha: cada linha (sem terminador e sem o dot-stuffing) é
+    entregue a `consumir` assim que chega, sem acumular a mensagem inteira.
+    """
+    mail._shortcmd(f"RETR {numero}")
+    erro_consumidor = None
+    linha, _ = mail._getline()
+    while linha != b".":
+        if linha.startswith(b".."):
+            linha = linha[1:]
+        if erro_consumidor is None:
+            try:
+                consumir(linha)
+            except Exception as e:
+                # Continua lendo até o fim para não dessincronizar a sessão POP3
+                erro_consumidor = e
+        linha, _ = mail._getline()
+    if erro_consumidor is not None:
+        raise erro_consumidor
+
+def baixar_mensagem_em_fluxo(mail, numero, num_msgs):
+    """
+    Versão em streaming de baixar_mensagem: o e-mail é interpretado enquanto
+    chega e os anexos vão de arquivos temporários direto para o armazenamento.
+    """
+    log_frontend(f"Baixando e-mail {numero}/{num_msgs}")
+    leitor = LeitorMime(filtro_cabecalho=remetente_alvo)
+    try:
+        try:
+            retr_em_fluxo(mail, numero, leitor.alimentar)
+        except Exception as e:
+            log_frontend(f"Timeout ou erro ao baixar e-mail #{numero}: {e}", "ERROR")
+            return numero, None, e
+        try:
+            resultado = leitor.finalizar()
+            if leitor.descartar:
+                return numero, None, None
+            armazenamento = get_armazenamento()
+            anexos = [
+                (decodificar(a.nome), a.tipo, armazenamento.salvar_arquivo(a.caminho, a.hash_conteudo), a.tamanho)
+                for a in resultado["anexos"]
+            ]
+            return numero, montar_dados(numero, resultado["cabecalho"], resultado["corpo_texto"], anexos), None
+        except Exception as e:
+            log_frontend(f"❌ Erro ao processar e-mail #{numero}: {e}", "ERROR")
+            return numero, None, e
+    finally:
+        leitor.descartar_anexos()
+
+class GravadorCaptura:
+    """
+    Gravador único da captura. Acumula os e-mails em lotes e grava cada lote
+    com uma consulta de deduplicação (= ANY) e inserts via execute_values.
+    O commit acontece a cada `checkpoint` mensagens e no fechamento.
+    """
+
+    def __init__(self, conn, tamanho_lote=None, checkpoint=None):
+        self.conn = conn
+        self.cur = conn.cursor()
+        self.tamanho_lote = tamanho_lote or CAPTURA_LOTE
+        self.checkpoint = checkpoint or CAPTURA_CHECKPOINT
+        self.lote = []
+        self.tratados = []
+        self.desde_commit = 0
+        self.salvos = 0
+        self.duplicados = 0
+        self.falhas = 0
+        self.execucao = None
+        self.ultimo_numero = None
+
+    def adicionar(self, dados, uid=None):
+        self.lote.append((dados, uid))
+        if len(self.lote) >= self.tamanho_lote:
+            self.descarregar()
+
+    def registrar_tratado(self, numero, uid=None, message_id=None):
+        """Marca como tratada uma mensagem descartada sem gravação."""
+        self.tratados.append((numero, uid, message_id))
+        self.desde_commit += 1
+        if len(self.tratados) >= self.tamanho_lote:
+            self.descarregar()
+
+    def descarregar(self):
+        if not self.lote and not self.tratados:
+            return
+        lote, self.lote = self.lote, []
+        tratados, self.tratados = self.tratados, []
+        self.cur.execute("SAVEPOINT lote_captura")
+        try:
+            self._gravar_lote(lote, tratados)
+            self.cur.execute("RELEASE SAVEPOINT lote_captura")
+        except Exception as e:
+            # Os UIDs do lote não são registrados: as mensagens voltam na próxima execução
+            self.cur.execute("ROLLBACK TO SAVEPOINT lote_captura")
+            self.falhas += len(lote)
+            log_frontend(f"❌ Erro ao gravar lote de {len(lote)} e-mails: {e}", "ERROR")
+        self.desde_commit += len(lote)
+        if self.desde_commit >= self.checkpoint:
+            self.commit()
+
+    def _gravar_lote(self, lote, tratados):
+        existentes = message_ids_existentes(self.cur, {d["message_id"] for d, _ in lote})
+        novos = []
+        vistos = set()
+        for dados, uid in lote:
+            message_id = dados["message_id"]
+            if message_id in existentes or message_id in vistos:
+                self.duplicados += 1
+                log_frontend(f"🔁 E-mail #{dados['numero']} já registrado — ignorado.")
+            else:
+                vistos.add(message_id)
+                novos.append(dados)
+            tratados.append((dados["numero"], uid, message_id))
+
+        ids = {}
+        if novos:
+            linhas = psycopg2.extras.execute_values(self.cur, """
+                INSERT INTO emails (remetente, assunto, recebido_em, message_id, corpo_email)
+                VALUES %s
+                RETURNING id_email, message_id
+            """, [
+                (d["remetente"], d["assunto"], d["recebido_em"], d["message_id"], d["corpo_texto"])
+                for d in novos
+            ], fetch=True)
+            ids = {message_id: id_email for id_email, message_id in linhas}
+
+        anexos = []
+        respostas = []
+        for dados in novos:
+            id_email = ids[dados["message_id"]]
+            recebido_em = dados["recebido_em"]
+            corpo_texto = dados["corpo_texto"]
+            for nome, tipo, hash_conteudo, tamanho in dados["anexos"]:
+                anexos.append((id_email, nome, tipo, hash_conteudo, tamanho))
 
-def capturar_emails():
+            if not dados["anexos"]:
+                obs = "E-mail sem anexo. Não é possível realizar análise completa."
+                respostas.append((
+                    id_email, "sem_anexo", "erro", False, [obs], recebido_em, "sem_anexo"
+                ))
+                log_frontend(f"⚠️ E-mail {id_email} salvo sem anexo.", "WARNING")
+
+            elif not corpo_texto or len(corpo_texto.strip()) < 20:
+                obs = "Corpo da mensagem está vazio ou fora do padrão esperado."
+                respostas.append((
+                    id_email, "fora_do_padrao", "erro", False, [obs], recebido_em, "fora_do_padrao"
+                ))
+                log_frontend(f"⚠️ E-mail {id_email} com corpo fora do padrão.", "WARNING")
+
+        if anexos:
+            # O conteúdo fica no armazenamento de anexos; a tabela guarda só o hash
+            psycopg2.extras.execute_values(self.cur, """
+                INSERT INTO anexos_email (id_email, nome_arquivo, tipo_arquivo, hash_conteudo, tamanho)
+                VALUES %s
+            """, anexos)
+        if respostas:
+            psycopg2.extras.execute_values(self.cur, """
+                INSERT INTO respostas (
+                    id_email, tipo_resposta, status_validacao, validado, erros, data_chegada, status
+                ) VALUES %s
+            """, respostas)
+        uidls = [(POP3_USER, uid, message_id) for _, uid, message_id in tratados if uid]
+        if uidls:
+            psycopg2.extras.execute_values(self.cur, """
+                INSERT INTO emails_uidl (conta, uidl, message_id)
+                VALUES %s
+                ON CONFLICT (conta, uidl) DO NOTHING
+            """, uidls)
+        if self.execucao and tratados:
+            psycopg2.extras.execute_values(self.cur, """
+                INSERT INTO capturas_execucao_itens (id_execucao, chave)
+                VALUES %s
+                ON CONFLICT DO NOTHING
+            """, [
+                (self.execucao["id_execucao"], chave_mensagem(numero, uid))
+                for numero, uid, _ in tratados
+            ])
+
+        self.salvos += len(novos)
+        if tratados:
+            self.ultimo_numero = max([self.ultimo_numero or 0] + [numero for numero, _, _ in tratados])
+
+    def commit(self):
+        # O checkpoint da execução vai na mesma transação dos dados que ele descreve
+        if self.execucao:
+            atualizar_execucao(self.cur, self, "em_andamento")
+        self.conn.commit()
+        self.desde_commit = 0
+
+    def fechar(self):
+        try:
+            self.descarregar()
+        finally:
+            self.commit()
+            self.cur.close()
+
+def baixar_mensagem(mail, numero, num_msgs):
+    """
+    Executa o RETR de uma mensagem e devolve (numero, dados, erro).
+    """
+    log_frontend(f"Baixando e-mail {numero}/{num_msgs}")
+    try:
+        response, lines, octets = mail.retr(numero)
+    except Exception as e:
+        log_frontend(f"Timeout ou erro ao baixar e-mail #{numero}: {e}", "ERROR")
+        return numero, None, e
+    try:
+        return numero, interpretar_mensagem(numero, lines), None
+    except Exception as e:
+        log_frontend(f"❌ Erro ao processar e-mail #{numero}: {e}", "ERROR")
+        return numero, None, e
+
+def sondar_cabecalho(mail, numero):
+    """
+    Busca apenas os cabeçalhos da mensagem (TOP n 0) e devolve
+    (numero, {"remetente", "message_id", "octetos"}, erro).
+    """
+    try:
+        _, linhas, octetos = mail.top(numero, 0)
+        cabecalho = BytesParser(policy=policy.default).parsebytes(
+            b"\r\n".join(linhas), headersonly=True
+        )
+        _, addr = email.utils.parseaddr(decodificar(cabecalho["From"]))
+        return numero, {
+            "remetente": addr.lower(),
+            "message_id": cabecalho.get("Message-ID") or f"<POP3-MSG-{numero}>",
+            "octetos": octetos,
+        }, None
+    except Exception as e:
+        log_frontend(f"⚠️ Falha ao sondar cabeçalho do e-mail #{numero}: {e}", "WARNING")
+        return numero, None, e
+
+def executar_sequencial(mail, numeros, operacao):
+    for numero in numeros:
+        yield operacao(mail, numero)
+
+def _worker_pop3(numeros, operacao, fila, parar, uids=None):
+    """
+    Worker POP3: abre sua própria sessão, aplica `operacao` a cada mensagem
+    e envia o resultado para a fila consumida pela thread principal.
+
+    Quando `uids` é informado, a mensagem é localizada pelo UIDL na sessão do
+    worker, pois a numeração pode mudar entre sessões se a caixa for alterada.
+    """
+    mail = None
+    enviados = 0
+    try:
+        mail = conectar_pop3()
+        numeros_locais = None
+        uids_locais = listar_uidl(mail) if uids else None
+        if uids_locais is not None:
+            numeros_locais = {uid: n for n, uid in uids_locais.items()}
+        for numero in numeros:
+            if parar.is_set():
+                break
+            if numeros_locais is None:
+                fila.put(operacao(mail, numero))
+            else:
+                numero_local = numeros_locais.get(uids[numero])
+                if numero_local is None:
+                    log_frontend(f"⚠️ E-mail #{numero} não está mais na caixa — ignorado.", "WARNING")
+                    fila.put((numero, None, None))
+                else:
+                    _, resultado, erro = operacao(mail, numero_local)
+                    fila.put((numero, resultado, erro))
+            enviados += 1
+    except Exception as e:
+        log_frontend(f"❌ Erro na sessão POP3 do worker: {e}", "ERROR")
+        for numero in numeros[enviados:]:
+            if parar.is_set():
+                break
+            fila.put((numero, None, e))
+    finally:
+        encerrar_pop3(mail)
+        fila.put(None)
+
+def executar_em_sessoes(numeros, operacao, sessoes, uids=None):
+    """
+    Distribui os números das mensagens entre `sessoes` workers POP3 e
+    entrega os resultados, na ordem em que chegam, para um único consumidor.
+    """
+    fila = queue.Queue(maxsize=sessoes * 4)
+    parar = threading.Event()
+    fatias = [numeros[k::sessoes] for k in range(sessoes)]
+    workers = [
+        threading.Thread(target=_worker_pop3, args=(fatia, operacao, fila, parar, uids), daemon=True)
+        for fatia in fatias if fatia
+    ]
+    for worker in workers:
+        worker.start()
+
+    ativos = len(workers)
+    try:
+        while ativos:
+            item = fila.get()
+            if item is None:
+                ativos -= 1
+                continue
+            yield item
+    finally:
+        # Se o consumidor parar antes do fim, libera os workers bloqueados na fila
+        parar.set()
+        while ativos:
+            if fila.get() is None:
+                ativos -= 1
+
+def message_ids_existentes(cur, message_ids):
+    if not message_ids:
+        return set()
+    cur.execute(
+        "SELECT message_id FROM emails WHERE message_id = ANY(%s)",
+        (list(message_ids),)
+    )
+    return {row[0] for row in cur.fetchall()}
+
+def filtrar_por_cabecalho(gravador, mail, numeros, tamanhos, sessoes, uids, cancelar=None):
+    """
+    Etapa de sondagem: lê só os cabeçalhos e descarta, antes do RETR,
+    mensagens de outros remetentes ou com Message-ID já registrado.
+    Retorna (numeros_para_baixar, duplicados, bytes_economizados).
+    """
+    log_frontend(f"🔎 Sondando cabeçalhos de {len(numeros)} e-mails (TOP n 0)")
+    if sessoes > 1:
+        sondagens = executar_em_sessoes(numeros, sondar_cabecalho, sessoes, uids)
+    else:
+        sondagens = executar_sequencial(mail, numeros, sondar_cabecalho)
+
+    cabecalhos = {}
+    descartados = []
+    for numero, cabecalho, erro in sondagens:
+        if cancelar is not None and cancelar.is_set():
+            sondagens.close()
+            break
+        if erro is not None:
+            # Sem cabeçalho não dá para decidir: segue para o RETR completo
+            cabecalhos[numero] = None
+        elif cabecalho is None:
+            descartados.append((numero, None))
+        elif cabecalho["remetente"] != REMETENTE_ALVO:
+            descartados.append((numero, cabecalho))
+        else:
+            cabecalhos[numero] = cabecalho
+
+    existentes = message_ids_existentes(
+        gravador.cur, {c["message_id"] for c in cabecalhos.values() if c}
+    )
+    duplicados = 0
+    for numero, cabecalho in list(cabecalhos.items()):
+        if cabecalho and cabecalho["message_id"] in existentes:
+            descartados.append((numero, cabecalho))
+            del cabecalhos[numero]
+            duplicados += 1
+
+    bytes_economizados = 0
+    for numero, cabecalho in descartados:
+        octetos = cabecalho["octetos"] if cabecalho else 0
+        bytes_economizados += max(tamanhos.get(numero, 0) - octetos, 0)
+        gravador.registrar_tratado(
+            numero, uids.get(numero) if uids else None, cabecalho and cabecalho["message_id"]
+        )
+
+    numeros = [n for n in numeros if n in cabecalhos]
+    log_frontend(
+        f"🔎 {len(numeros)} e-mails relevantes e novos; {len(descartados)} descartados "
+        f"pelo cabeçalho ({bytes_economizados / 1024 / 1024:.1f} MB não baixados)"
+    )
+    return numeros, duplicados, bytes_economizados
+
+def capturar_emails(sessoes=None, incremental=None, pre_filtro=None, cancelar=None, id_execucao=None):
+    """
+    Captura os e-mails da caixa POP3. `cancelar` (threading.Event) permite
+    interromper a execução entre mensagens; o que já foi processado é gravado.
+
+    Cada execução fica registrada em capturas_execucao, com checkpoint a cada
+    commit do gravador. Com `id_execucao`, retoma uma execução interrompida
+    pulando as mensagens que ela já tratou.
+    """
     if pipeline_pausado():
         log_frontend("🚫 Pipeline pausado. Captura de e-mails cancelada.", "WARNING")
+        finalizar_progresso("cancelado")
         return {"mensagem": "Pipeline pausado. Captura cancelada."}
 
+    sessoes = max(1, sessoes or POP3_SESSOES)
+    incremental = POP3_INCREMENTAL if incremental is None else incremental
+    pre_filtro = POP3_PRE_FILTRO if pre_filtro is None else pre_filtro
     limpar_logs_anteriores()
     conn = get_conn()
-    cur = conn.cursor()
+    gravador = GravadorCaptura(conn)
+    cur = gravador.cur
 
-    total_salvos = 0
-    total_duplicados = 0
-    total_falhas = 0
+    total_conhecidos = 0
+    total_retomados = 0
+    bytes_economizados = 0
+    concluido = False
     mail = None
 
     try:
-        mail = poplib.POP3_SSL(POP3_HOST, 995)
-        mail.user(POP3_USER)
-        mail.pass_(POP3_PASS)
+        gravador.execucao = abrir_execucao(cur, {
+            "sessoes": sessoes, "incremental": incremental, "pre_filtro": pre_filtro,
+        }, id_execucao)
+        conn.commit()
+        if id_execucao is not None:
+            log_frontend(
+                f"♻️ Retomando a execução #{id_execucao} "
+                f"({len(gravador.execucao['tratados'])} mensagens já tratadas)"
+            )
+
+        mail = conectar_pop3()
 
-        num_msgs = len(mail.list()[1])
-        salvar_progresso(num_msgs, 0)
+        listagem = mail.list()[1]
+        num_msgs = len(listagem)
+        tamanhos = {}
+        for linha in listagem:
+            numero, octetos = linha.split()[:2]
+            tamanhos[int(numero)] = int(octetos)
         log_frontend(f"📨 {num_msgs} e-mails encontrados via POP3")
 
-        for i in range(num_msgs):
-            salvar_progresso(num_msgs, i)
-            try:
-                log_frontend(f"Baixando e-mail {i+1}/{num_msgs}")
-                try:
-                    response, lines, octets = mail.retr(i + 1)
-                except Exception as e:
-                    log_frontend(f"Timeout ou erro ao baixar e-mail #{i+1}: {e}", "ERROR")
-                    total_falhas += 1
-                    continue
-
-                raw_email = b"\n".join(lines)
-                msg = BytesParser(policy=policy.default).parsebytes(raw_email)
-
-                hdr_from = decodificar(msg["From"])
-                _, addr = email.utils.parseaddr(hdr_from)
-                if addr.lower() != REMETENTE_ALVO:
-                    continue
-
-                message_id = msg.get("Message-ID") or f"<POP3-MSG-{i+1}>"
-                cur.execute("SELECT 1 FROM emails WHERE message_id = %s", (message_id,))
-                if cur.fetchone():
-                    total_duplicados += 1
-                    log_frontend(f"🔁 E-mail #{i+1} já registrado — ignorado.")
-                    continue
-
-                assunto = decodificar(msg.get("Subject", ""))
-                corpo = msg.get_body(preferencelist=('plain', 'html'))
-                corpo_texto = corpo.get_content().strip() if corpo else None
-
-                date_hdr = msg.get("Date", "")
-                try:
-                    recebido_em = datetime.strptime(date_hdr[:31], "%a, %d %b %Y %H:%M:%S %z")
-                except:
-                    recebido_em = datetime.now()
-
-                cur.execute("""
-                    INSERT INTO emails (remetente, assunto, recebido_em, message_id, corpo_email)
-                    VALUES (%s, %s, %s, %s, %s)
-                    RETURNING id_email
-                """, (addr, assunto, recebido_em, message_id, corpo_texto))
-                id_email = cur.fetchone()[0]
-
-                total_anexos = 0
-                for part in msg.iter_attachments():
-                    nome = decodificar(part.get_filename() or "sem_nome")
-                    tipo = part.get_content_type()
-                    conteudo = part.get_payload(decode=True)
-                    if conteudo:
-                        cur.execute("""
-                            INSERT INTO anexos_email (id_email, nome_arquivo, tipo_arquivo, conteudo)
-                            VALUES (%s, %s, %s, %s)
-                        """, (id_email, nome, tipo, conteudo))
-                        total_anexos += 1
-
-                if total_anexos == 0:
-                    obs = "E-mail sem anexo. Não é possível realizar análise completa."
-                    cur.execute("""
-                        INSERT INTO respostas (
-                            id_email, tipo_resposta, status_validacao, validado, erros, data_chegada, status
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        id_email, "sem_anexo", "erro", False, [obs], recebido_em, "sem_anexo"
-                    ))
-                    log_frontend(f"⚠️ E-mail {id_email} salvo sem anexo.", "WARNING")
-
-                elif not corpo_texto or len(corpo_texto.strip()) < 20:
-                    obs = "Corpo da mensagem está vazio ou fora do padrão esperado."
-                    cur.execute("""
-                        INSERT INTO respostas (
-                            id_email, tipo_resposta, status_validacao, validado, erros, data_chegada, status
-                        ) VALUES (%s, %s, %s, %s, %s, %s, %s)
-                    """, (
-                        id_email, "fora_do_padrao", "erro", False, [obs], recebido_em, "fora_do_padrao"
-                    ))
-                    log_frontend(f"⚠️ E-mail {id_email} com corpo fora do padrão.", "WARNING")
-
-                total_salvos += 1
+        numeros = list(range(1, num_msgs + 1))
+        uids = None
+        if incremental:
+            uids = listar_uidl(mail)
+        if uids:
+            conhecidos = uidls_capturados(cur, uids.values())
+            numeros = [n for n in numeros if uids.get(n) not in conhecidos]
+            total_conhecidos = num_msgs - len(numeros)
+            log_frontend(f"🆕 {len(numeros)} e-mails novos ({total_conhecidos} já capturados via UIDL)")
 
-            except Exception as e:
-                total_falhas += 1
-                log_frontend(f"❌ Erro ao processar e-mail #{i+1}: {e}", "ERROR")
+        tratados = gravador.execucao["tratados"]
+        if tratados:
+            restantes = [
+                n for n in numeros
+                if chave_mensagem(n, uids.get(n) if uids else None) not in tratados
+            ]
+            total_retomados = len(numeros) - len(restantes)
+            numeros = restantes
+
+        sessoes = min(sessoes, len(numeros)) or 1
+        if sessoes > 1:
+            # Libera a caixa antes de abrir as sessões dos workers
+            encerrar_pop3(mail)
+            mail = None
+            log_frontend(f"⚡ Download paralelo com {sessoes} sessões POP3")
+
+        if pre_filtro and numeros:
+            numeros, duplicados, bytes_economizados = filtrar_por_cabecalho(
+                gravador, mail, numeros, tamanhos, sessoes, uids, cancelar
+            )
+            gravador.duplicados += duplicados
+            sessoes = min(sessoes, len(numeros)) or 1
+
+        salvar_progresso(len(numeros), 0)
+        baixar = functools.partial(
+            baixar_mensagem_em_fluxo if CAPTURA_STREAMING else baixar_mensagem,
+            num_msgs=num_msgs
+        )
+        if mail is None:
+            mensagens = executar_em_sessoes(numeros, baixar, sessoes, uids)
+        else:
+            mensagens = executar_sequencial(mail, numeros, baixar)
+
+        processados = 0
+        for numero, dados, erro in mensagens:
+            if cancelar is not None and cancelar.is_set():
+                # Fecha o gerador para os workers pararem de baixar
+                mensagens.close()
+                break
+            salvar_progresso(len(numeros), processados)
+            processados += 1
+            if erro is not None:
+                # Falhas não são marcadas como tratadas: voltam na retomada/próxima execução
+                gravador.falhas += 1
+                continue
+            uid = uids.get(numero) if uids else None
+            if dados is not None:
+                gravador.adicionar(dados, uid)
+            else:
+                gravador.registrar_tratado(numero, uid)
+        concluido = True
 
     except Exception as e:
         log_frontend(f"❌ Erro na conexão POP3: {e}", "CRITICAL")
 
     finally:
-        conn.commit()
-        cur.close()
+        cancelado = cancelar is not None and cancelar.is_set()
+        try:
+            gravador.descarregar()
+            if gravador.execucao:
+                if cancelado:
+                    status = "cancelada"
+                elif concluido:
+                    status = "concluida"
+                else:
+                    status = "interrompida"
+                atualizar_execucao(cur, gravador, status)
+                if status == "concluida":
+                    # Execução completa: a lista de mensagens tratadas não é mais necessária
+                    cur.execute(
+                        "DELETE FROM capturas_execucao_itens WHERE id_execucao = %s",
+                        (gravador.execucao["id_execucao"],)
+                    )
+            conn.commit()
+        except Exception as e:
+            log_frontend(f"❌ Erro ao gravar e-mails capturados: {e}", "CRITICAL")
+        gravador.cur.close()
         conn.close()
-        if mail:
-            try:
-                mail.quit()
-            except Exception:
-                pass
+        encerrar_pop3(mail)
+
+        total_salvos = gravador.salvos
+        total_duplicados = gravador.duplicados
+        total_falhas = gravador.falhas
+
+        if cancelado:
+            log_frontend("⛔ Captura interrompida a pedido do usuário.", "WARNING")
+        finalizar_progresso("cancelado" if cancelado else "finalizado")
+        log_frontend(f"📊 RESUMO FINAL\n✔️ E-mails salvos: {total_salvos}\n🔁 Duplicados ignorados: {total_duplicados}\n⏭️ Já capturados (UIDL): {total_conhecidos}\n♻️ Já tratados na execução retomada: {total_retomados}\n📉 Bytes não baixados (pré-filtro): {bytes_economizados}\n❌ Falhas: {total_falhas}")
+
+    return {
+        "id_execucao": gravador.execucao and gravador.execucao["id_execucao"],
+        "salvos": total_salvos,
+        "duplicados": total_duplicados,
+        "conhecidos": total_conhecidos,
+        "retomados": total_retomados,
+        "bytes_economizados": bytes_economizados,
+        "falhas": total_falhas,
+        "cancelado": cancelado,
+    }
+
+def retomar_captura(cancelar=None):
+    """
+    Retoma a última execução de captura não concluída (queda do processo,
+    erro de conexão ou cancelamento), com os mesmos parâmetros dela.
+    """
+    execucao = execucao_retomavel()
+    if execucao is None:
+        log_frontend("ℹ️ Nenhuma execução de captura pendente para retomar.")
+        finalizar_progresso("finalizado")
+        return {"mensagem": "Nenhuma execução de captura pendente."}
+    return capturar_emails(
+        cancelar=cancelar, id_execucao=execucao["id_execucao"], **execucao["parametros"]
+    )
 
-        finalizar_progresso()
-        log_frontend(f"📊 RESUMO FINAL\n✔️ E-mails salvos: {total_salvos}\n🔁 Duplicados ignorados: {total_duplicados}\n❌ Falhas: {total_falhas}")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Captura os e-mails da caixa POP3.")
+    parser.add_argument("--sessoes", type=int, default=None)
+    parser.add_argument("--retomar", action="store_true",
+                        help="retoma a última execução não concluída")
+    args = parser.parse_args()
+    from backend.migracoes import aplicar_migracoes
+    aplicar_migracoes()
+    if args.retomar:
+        print(retomar_captura())
+    else:
+        print(capturar_emails(sessoes=args.sessoes))
@@ -1,31 +1,11 @@
 import psycopg2
 import bcrypt
-import os
-from dotenv import load_dotenv
 import logging
+from backend.utils import get_conn, DB_CONFIG
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-load_dotenv()
-
-DB_CONFIG = {
-    "host": os.getenv("DB_HOST", "localhost"),
-    "port": os.getenv("DB_PORT", "5433"),
-    "dbname": os.getenv("DB_NAME", "esteira_protocolo"),
-    "user": os.getenv("DB_USER", "postgres"),
-    "password": os.getenv("DB_PASS", "486975"),
-}
-
-def get_conn():
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        logger.info("Conexão com o banco estabelecida")
-        return conn
-    except psycopg2.Error as e:
-        logger.critical(f"Erro ao conectar ao banco: {str(e)}")
-        raise
-
 def autenticar_usuario(username, senha):
     try:
         with get_conn() as conn:
@@ -0,0 +1,281 @@
+import io
+import os
+import re
+import html
+import time
+import argparse
+import zipfile
+import threading
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from backend.utils import log
+from backend.armazenamento_anexos import get_armazenamento
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # extração de PDF desativada sem o pypdf
+    PdfReader = None
+
+# Processos usados na extração (0 = todos os núcleos)
+EXTRACAO_PROCESSOS = int(os.getenv("EXTRACAO_PROCESSOS", "0")) or os.cpu_count() or 1
+# Páginas lidas por PDF e caracteres guardados por anexo
+EXTRACAO_MAX_PAGINAS = int(os.getenv("EXTRACAO_MAX_PAGINAS", "30"))
+EXTRACAO_LIMITE_TEXTO = int(os.getenv("EXTRACAO_LIMITE_TEXTO", "100000"))
+# Tamanho da prévia enviada à IA: por anexo e somando todos os anexos do e-mail
+PREVIA_POR_ANEXO = int(os.getenv("PREVIA_POR_ANEXO", "1500"))
+PREVIA_TOTAL = int(os.getenv("PREVIA_TOTAL", "6000"))
+# Proteção contra ZIPs aninhados/gigantes
+ZIP_PROFUNDIDADE = 2
+ZIP_MAX_MEMBRO = 50 * 1024 * 1024
+
+def _tipo(nome, tipo):
+    nome = (nome or "").lower()
+    tipo = (tipo or "").lower()
+    if nome.endswith(".pdf") or tipo == "application/pdf":
+        return "pdf"
+    if nome.endswith(".docx") or "wordprocessingml" in tipo:
+        return "docx"
+    if nome.endswith(".zip") or "zip" in tipo:
+        return "zip"
+    if nome.endswith((".txt", ".csv")) or tipo.startswith("text/"):
+        return "txt"
+    return None
+
+def _texto_pdf(conteudo):
+    if PdfReader is None:
+        raise RuntimeError("pypdf não instalado")
+    leitor = PdfReader(io.BytesIO(conteudo))
+    paginas = leitor.pages[:EXTRACAO_MAX_PAGINAS]
+    return "\n".join(p.extract_text() or "" for p in paginas), len(paginas)
+
+def _texto_docx(conteudo):
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as z:
+        xml = z.read("word/document.xml").decode("utf-8", errors="ignore")
+    xml = re.sub(r"</w:p>|<w:br[^>]*/>|<w:tab[^>]*/>", "\n", xml)
+    return html.unescape(re.sub(r"<[^>]+>", "", xml)), 0
+
+def _texto_txt(conteudo):
+    try:
+        return conteudo.decode("utf-8"), 0
+    except UnicodeDecodeError:
+        return conteudo.decode("latin-1"), 0
+
+def _texto_zip(conteudo, profundidade):
+    partes = []
+    paginas = 0
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as z:
+        for info in z.infolist():
+            if info.is_dir() or info.file_size > ZIP_MAX_MEMBRO:
+                continue
+            if _tipo(info.filename, None) is None:
+                continue
+            texto, pags, _ = extrair_texto(z.read(info), info.filename, None, profundidade + 1)
+            if texto:
+                partes.append(f"[{info.filename}]\n{texto}")
+            paginas += pags
+    return "\n".join(partes), paginas
+
+def extrair_texto(conteudo, nome, tipo, profundidade=0):
+    """
+    Extrai o texto de PDF, DOCX, TXT e dos membros de ZIP.
+    Retorna (texto, paginas, extrator); tipos não suportados retornam texto vazio.
+    """
+    extrator = _tipo(nome, tipo)
+    if extrator == "pdf":
+        texto, paginas = _texto_pdf(conteudo)
+    elif extrator == "docx":
+        texto, paginas = _texto_docx(conteudo)
+    elif extrator == "txt":
+        texto, paginas = _texto_txt(conteudo)
+    elif extrator == "zip" and profundidade < ZIP_PROFUNDIDADE:
+        texto, paginas = _texto_zip(conteudo, profundidade)
+    else:
+        return "", 0, extrator
+    texto = re.sub(r"[ \t\r\f\v]+", " ", texto)
+    texto = re.sub(r"\n\s*\n+", "\n", texto).strip()
+    return texto[:EXTRACAO_LIMITE_TEXTO], paginas, extrator
+
+def _extrair_do_armazenamento(hash_conteudo, nome, tipo):
+    # Roda no processo do pool: lê o arquivo do armazenamento em vez de receber os bytes
+    try:
+        with get_armazenamento().abrir(hash_conteudo) as f:
+            conteudo = f.read()
+        texto, paginas, extrator = extrair_texto(conteudo, nome, tipo)
+        return hash_conteudo, texto, paginas, extrator, None
+    except Exception as e:
+        return hash_conteudo, "", 0, _tipo(nome, tipo), str(e)
+
+# Erro gravado para o arquivo cuja extração derrubou o processo do pool
+ERRO_PROCESSO_MORTO = "processo de extração morreu (falta de memória ou falha do leitor)"
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _pool_extracao():
+    """
+    Pool de processos da extração, criado uma vez e reaproveitado entre os lotes.
+    Usa spawn: o pipeline roda em threads da API, e um fork herdaria os sockets
+    do pool de conexões e locks presos por outras threads.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=EXTRACAO_PROCESSOS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _executor
+
+def fechar_pool_extracao():
+    global _executor
+    with _executor_lock:
+        executor, _executor = _executor, None
+    if executor is not None:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+def _extrair_em_pool(pendentes, extrair=None):
+    """
+    Extrai `pendentes` ({hash: (nome, tipo)}) no pool. Se um processo morrer
+    (falta de memória, falha do leitor de PDF), o pool é recriado e cada arquivo
+    afetado é tentado sozinho: o que derrubar o processo de novo fica com `erro`
+    e o restante do lote segue normalmente. `extrair` substitui
+    _extrair_do_armazenamento (ex.: testes).
+    """
+    extrair = extrair or _extrair_do_armazenamento
+    futuros = {}
+    afetados = []
+    for h, (nome, tipo) in pendentes.items():
+        try:
+            futuros[h] = _pool_extracao().submit(extrair, h, nome, tipo)
+        except BrokenProcessPool:
+            afetados.append(h)
+    resultados = {}
+    for h, futuro in futuros.items():
+        try:
+            resultados[h] = futuro.result()
+        except BrokenProcessPool:
+            afetados.append(h)
+    if afetados:
+        fechar_pool_extracao()
+        log(f"⚠️ Processo de extração morreu; tentando {len(afetados)} anexos um a um", "WARNING")
+    for h in afetados:
+        nome, tipo = pendentes[h]
+        try:
+            resultados[h] = _pool_extracao().submit(extrair, h, nome, tipo).result()
+        except BrokenProcessPool:
+            fechar_pool_extracao()
+            log(f"❌ Extração do anexo {nome} ({h}) derrubou o processo", "ERROR")
+            resultados[h] = (h, "", 0, _tipo(nome, tipo), ERRO_PROCESSO_MORTO)
+    return [resultados[h] for h in pendentes]
+
+def textos_extraidos(cur, hashes):
+    """Textos já extraídos com sucesso; os que falharam (erro) são extraídos de novo."""
+    if not hashes:
+        return {}
+    cur.execute(
+        "SELECT hash_conteudo, texto FROM textos_anexo WHERE hash_conteudo = ANY(%s) AND erro IS NULL",
+        (list(hashes),)
+    )
+    return {row[0]: row[1] for row in cur.fetchall()}
+
+def extrair_textos(cur, anexos):
+    """
+    Garante o texto dos anexos na tabela textos_anexo e retorna {hash_conteudo: texto}.
+    `anexos` é uma lista de (hash_conteudo, nome, tipo). Cada arquivo é extraído
+    uma única vez (chave SHA-256); falhas ficam registradas em `erro` e são
+    tentadas de novo na próxima vez. Os novos são processados em paralelo num
+    pool de processos. Anexos legados sem hash (bytea) ficam sem texto até a migração.
+    """
+    pendentes = {}
+    for hash_conteudo, nome, tipo in anexos:
+        if hash_conteudo and _tipo(nome, tipo):
+            pendentes.setdefault(hash_conteudo, (nome, tipo))
+    textos = textos_extraidos(cur, pendentes.keys())
+    pendentes = {h: v for h, v in pendentes.items() if h not in textos}
+    if not pendentes:
+        return textos
+
+    processos = min(EXTRACAO_PROCESSOS, len(pendentes))
+    inicio = time.monotonic()
+    if processos > 1:
+        resultados = _extrair_em_pool(pendentes)
+    else:
+        resultados = [_extrair_do_armazenamento(h, n, t) for h, (n, t) in pendentes.items()]
+
+    erros = 0
+    for hash_conteudo, texto, paginas, extrator, erro in resultados:
+        cur.execute("""
+            INSERT INTO textos_anexo (hash_conteudo, texto, paginas, extrator, erro)
+            VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (hash_conteudo) DO UPDATE SET
+                texto = EXCLUDED.texto,
+                paginas = EXCLUDED.paginas,
+                extrator = EXCLUDED.extrator,
+                erro = EXCLUDED.erro,
+                extraido_em = NOW()
+            WHERE textos_anexo.erro IS NOT NULL
+        """, (hash_conteudo, texto, paginas, extrator, erro))
+        textos[hash_conteudo] = texto
+        erros += bool(erro)
+    log(
+        f"📄 Texto extraído de {len(resultados)} anexos em {time.monotonic() - inicio:.1f}s "
+        f"({processos} processos, {erros} com erro)"
+    )
+    return textos
+
+def previas(textos, por_anexo=None, total=None):
+    """
+    Prévias para o prompt: cada texto limitado a `por_anexo` caracteres e
+    o conjunto a `total`, dividido igualmente entre os anexos com texto.
+    """
+    por_anexo = por_anexo or PREVIA_POR_ANEXO
+    total = total or PREVIA_TOTAL
+    com_texto = sum(1 for t in textos if t)
+    limite = min(por_anexo, total // com_texto) if com_texto else 0
+    return [" ".join(t.split())[:limite] if t else "" for t in textos]
+
+def benchmark(diretorio, processos=None):
+    """
+    Mede páginas/s na extração dos PDFs de `diretorio`: serial e com o pool,
+    frio (inclui subir os processos) e quente (pool já criado, como o
+    _pool_extracao reaproveitado entre os lotes). Amostra: tests/amostras/pdf.
+    """
+    if PdfReader is None:
+        print("pypdf não instalado: pip install pypdf")
+        return
+    arquivos = sorted(Path(diretorio).glob("**/*.pdf"))
+    if not arquivos:
+        print(f"Nenhum PDF em {diretorio}")
+        return
+    conteudos = [(f.read_bytes(), f.name) for f in arquivos]
+    processos = processos or EXTRACAO_PROCESSOS
+
+    def medir(mapear):
+        inicio = time.monotonic()
+        resultados = list(mapear(
+            extrair_texto, [c for c, _ in conteudos], [nome for _, nome in conteudos], [None] * len(conteudos)
+        ))
+        duracao = time.monotonic() - inicio
+        return sum(r[1] for r in resultados), duracao
+
+    def mostrar(rotulo, paginas, duracao):
+        print(f"{rotulo:<22} {len(arquivos)} PDFs, {paginas} páginas em {duracao:.2f}s "
+              f"= {paginas / duracao if duracao else 0:.1f} páginas/s")
+
+    mostrar("1 processo (serial):", *medir(map))
+    if processos > 1:
+        with ProcessPoolExecutor(max_workers=processos, mp_context=multiprocessing.get_context("spawn")) as executor:
+            mostrar(f"{processos} processos, frio:", *medir(executor.map))
+            mostrar(f"{processos} processos, quente:", *medir(executor.map))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extração de texto dos anexos.")
+    parser.add_argument("--benchmark", metavar="DIR", help="diretório com PDFs de amostra")
+    parser.add_argument("--processos", type=int, default=None)
+    args = parser.parse_args()
+    if args.benchmark:
+        benchmark(args.benchmark, args.processos)
+    else:
+        parser.print_help()
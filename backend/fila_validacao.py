@@ -0,0 +1,202 @@
+import os
+import uuid
+import socket
+import threading
+from backend.utils import filtro_dia, get_conn, log
+
+# Validade das reivindicações: passado esse tempo sem liberação (worker caiu), o e-mail volta à fila
+FILA_LEASE_SEGUNDOS = int(os.getenv("FILA_LEASE_SEGUNDOS", "900"))
+# Novas tentativas após erro transitório da IA: espera base * 2^(n-1), até o máximo
+IA_MAX_TENTATIVAS = int(os.getenv("IA_MAX_TENTATIVAS", "5"))
+IA_BACKOFF_SEGUNDOS = int(os.getenv("IA_BACKOFF_SEGUNDOS", "60"))
+IA_BACKOFF_MAX_SEGUNDOS = int(os.getenv("IA_BACKOFF_MAX_SEGUNDOS", str(6 * 3600)))
+
+def identificador_worker():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+def reivindicar_emails(cur, worker, quantidade=None, data=None, excluir_em_lote=False, lease=None):
+    """
+    Reivindica até `quantidade` e-mails 'protocolo' sem protocolo para `worker`
+    e retorna as linhas (e.*, status_captura). O commit fica com quem chama e
+    deve vir logo em seguida, para a reivindicação valer para os outros workers.
+
+    Os e-mails candidatos são travados com FOR UPDATE SKIP LOCKED, então workers
+    concorrentes (processos/hosts) nunca pegam o mesmo e-mail; reivindicações de
+    outro worker só são tomadas depois de expiradas. E-mails com falha da IA só
+    voltam depois do backoff e os que estão no dead-letter ficam de fora. Com `excluir_em_lote`,
+    ignora os e-mails que aguardam um lote IA offline (tabelas de lote_ia).
+    """
+    filtros = ""
+    params = []
+    if excluir_em_lote:
+        filtros += """
+            AND NOT EXISTS (
+                SELECT 1 FROM lotes_ia_itens li
+                JOIN lotes_ia l ON l.id_lote = li.id_lote
+                WHERE li.id_email = e.id_email AND l.status IN ('preparado', 'enviado', 'em_andamento')
+            )
+        """
+    if data:
+        filtro_data, params_data = filtro_dia("e.recebido_em", data)
+        filtros += filtro_data
+        params += params_data
+    params += [quantidade, worker, lease or FILA_LEASE_SEGUNDOS]
+
+    cur.execute(f"""
+        WITH candidatos AS (
+            SELECT e.id_email
+            FROM emails e
+            LEFT JOIN protocolos p ON p.id_email = e.id_email
+            LEFT JOIN claims_validacao c ON c.id_email = e.id_email
+            LEFT JOIN tentativas_validacao t ON t.id_email = e.id_email
+            WHERE p.id_email IS NULL
+            AND e.tipo_email = 'protocolo'
+            AND (c.id_email IS NULL OR c.expira_em < NOW())
+            AND (t.id_email IS NULL OR (t.status = 'aguardando' AND t.proxima_tentativa <= NOW()))
+            {filtros}
+            ORDER BY e.id_email
+            LIMIT %s
+            FOR UPDATE OF e SKIP LOCKED
+        )
+        INSERT INTO claims_validacao (id_email, worker, expira_em)
+        SELECT id_email, %s, NOW() + make_interval(secs => %s) FROM candidatos
+        ON CONFLICT (id_email) DO UPDATE SET
+            worker = EXCLUDED.worker,
+            reivindicado_em = NOW(),
+            expira_em = EXCLUDED.expira_em
+        WHERE claims_validacao.expira_em < NOW()
+        RETURNING id_email
+    """, tuple(params))
+    ids = [_valor(row, "id_email") for row in cur.fetchall()]
+    if not ids:
+        return []
+    cur.execute("""
+        SELECT e.*, r.status AS status_captura
+        FROM emails e
+        LEFT JOIN respostas r ON r.id_email = e.id_email
+        WHERE e.id_email = ANY(%s)
+        ORDER BY e.id_email
+    """, (ids,))
+    return cur.fetchall()
+
+def _valor(row, coluna):
+    return row[coluna] if isinstance(row, dict) else row[0]
+
+def renovar_claims(cur, worker, ids, lease=None):
+    if ids:
+        cur.execute("""
+            UPDATE claims_validacao SET expira_em = NOW() + make_interval(secs => %s)
+            WHERE worker = %s AND id_email = ANY(%s)
+        """, (lease or FILA_LEASE_SEGUNDOS, worker, list(ids)))
+
+def confirmar_claim(cur, worker, id_email):
+    """
+    Consome a reivindicação do e-mail dentro da transação que grava o resultado.
+    Retorna False se ela não é mais deste worker (o lease expirou e outro worker
+    pegou o e-mail); nesse caso quem chama não deve gravar nada.
+    """
+    cur.execute(
+        "DELETE FROM claims_validacao WHERE id_email = %s AND worker = %s RETURNING id_email",
+        (id_email, worker)
+    )
+    return cur.fetchone() is not None
+
+class RenovadorClaims:
+    """
+    Heartbeat das reivindicações: enquanto o lote é processado (extração de
+    texto, chamadas lentas à IA), renova o lease dos e-mails ainda pendentes a
+    cada `intervalo` segundos (padrão: metade de FILA_LEASE_SEGUNDOS), numa
+    thread e numa conexão próprias. Usado como context manager.
+    """
+
+    def __init__(self, worker, ids, intervalo=None, lease=None):
+        self.worker = worker
+        self.lease = lease
+        self.intervalo = intervalo or FILA_LEASE_SEGUNDOS / 2
+        self.pendentes = set(ids)
+        self.renovacoes = 0
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+        self._thread = threading.Thread(target=self._rodar, name="renovador-claims", daemon=True)
+
+    def concluir(self, id_email):
+        with self._lock:
+            self.pendentes.discard(id_email)
+
+    def renovar(self):
+        with self._lock:
+            ids = list(self.pendentes)
+        if not ids:
+            return
+        conn = get_conn()
+        try:
+            cur = conn.cursor()
+            renovar_claims(cur, self.worker, ids, self.lease)
+            conn.commit()
+            cur.close()
+            self.renovacoes += 1
+        except Exception as e:
+            conn.rollback()
+            log(f"Falha ao renovar as reivindicações de {self.worker}: {e}", "WARNING")
+        finally:
+            conn.close()
+
+    def _rodar(self):
+        while not self._parar.wait(self.intervalo):
+            self.renovar()
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._parar.set()
+        self._thread.join()
+
+def liberar_emails(cur, worker, ids):
+    if ids:
+        cur.execute(
+            "DELETE FROM claims_validacao WHERE worker = %s AND id_email = ANY(%s)",
+            (worker, list(ids))
+        )
+
+def registrar_falha(cur, id_email, erro, max_tentativas=None):
+    """
+    Agenda nova tentativa do e-mail com backoff exponencial. Ao atingir
+    `max_tentativas` o e-mail vai para o dead-letter (view validacao_dead_letter).
+    Retorna (tentativas, status).
+    """
+    cur.execute("""
+        INSERT INTO tentativas_validacao (id_email, tentativas, status, ultimo_erro, proxima_tentativa)
+        VALUES (
+            %(id_email)s, 1,
+            CASE WHEN %(max)s <= 1 THEN 'dead' ELSE 'aguardando' END,
+            %(erro)s, NOW() + make_interval(secs => LEAST(%(teto)s, %(base)s))
+        )
+        ON CONFLICT (id_email) DO UPDATE SET
+            tentativas = tentativas_validacao.tentativas + 1,
+            status = CASE WHEN tentativas_validacao.tentativas + 1 >= %(max)s THEN 'dead' ELSE 'aguardando' END,
+            ultimo_erro = EXCLUDED.ultimo_erro,
+            proxima_tentativa = NOW() + make_interval(
+                secs => LEAST(%(teto)s, %(base)s * POWER(2, tentativas_validacao.tentativas))
+            ),
+            atualizado_em = NOW()
+        RETURNING tentativas, status
+    """, {
+        "id_email": id_email,
+        "erro": erro,
+        "max": max_tentativas or IA_MAX_TENTATIVAS,
+        "base": IA_BACKOFF_SEGUNDOS,
+        "teto": IA_BACKOFF_MAX_SEGUNDOS,
+    })
+    row = cur.fetchone()
+    return (row["tentativas"], row["status"]) if isinstance(row, dict) else tuple(row)
+
+def limpar_falhas(cur, id_email):
+    cur.execute("DELETE FROM tentativas_validacao WHERE id_email = %s", (id_email,))
+
+def dead_letter(cur, limite=100):
+    cur.execute("""
+        SELECT * FROM validacao_dead_letter ORDER BY atualizado_em DESC LIMIT %s
+    """, (limite,))
+    return cur.fetchall()
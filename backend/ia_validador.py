@@ -1,31 +1,61 @@
 import os
 import json
 import re
-from openai import OpenAI
 from dotenv import load_dotenv
+from backend.backends_ia import get_backend_ia
+from backend.limitador_taxa import LimitadorTaxa
+from backend.cache_ia import IA_CACHE, cache_validacao_ia
+from backend.utils import log
+from backend.orcamento_prompt import IA_ORCAMENTO_PROMPT, contar_tokens, truncar_tokens, distribuir_orcamento
 
 load_dotenv()
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 
-def prompt_formal_ia(assunto, corpo, nomes_anexos, textos_anexos, campos_extraidos):
-    return f"""
-Você é um assistente jurídico especializado na gestão de ofícios judiciais de uma instituição financeira de abrangência nacional. O setor de Gerência de Ofícios (GOF) é responsável por receber e responder ordens judiciais encaminhadas por juízes de todo o Brasil, que podem requerer informações detalhadas, envio de documentos (extrato, contrato, termo, comprovante, etc.) ou ações concretas (bloqueio/desbloqueio de valores, transferência, liberação de gravame, etc).
+# Limites da conta OpenAI (0 = sem limite), compartilhados por todas as threads
+IA_RPM = int(os.getenv("IA_RPM", "60"))
+IA_TPM = int(os.getenv("IA_TPM", "30000"))
+# Reserva de tokens para a resposta, somada à estimativa do prompt
+IA_TOKENS_RESPOSTA = 400
+limitador_ia = LimitadorTaxa(requisicoes_minuto=IA_RPM, tokens_minuto=IA_TPM)
 
-Seu papel é **validar a formalidade da resposta** (e-mail, anexos, minuta) para o protocolo, indicando de forma clara se está APTO para protocolo, deve ser REVISADO, ou REJEITADO.
+def estimar_tokens(*textos):
+    # Contagem local do prompt (tiktoken, se instalado) mais a reserva da resposta
+    return sum(contar_tokens(t) for t in textos) + IA_TOKENS_RESPOSTA
 
-**Atenção:**  
-- Sempre inicie sua resposta com: "AÇÃO: Protocolar.", "AÇÃO: Revisar.", ou "AÇÃO: Rejeitar."  
-- Logo em seguida, justifique de forma objetiva sua decisão.  
-- Finalize explicando, em frase única, o que o banco está efetivamente respondendo ou cumprindo neste caso.
+# Versão do template do prompt: altere ao mudar o texto para invalidar o cache IA
+PROMPT_VERSAO = "2"
+SISTEMA_VALIDADOR = "Você é um assistente jurídico validador formal de ofícios bancários."
 
-### Dados recebidos:
-- Assunto do e-mail: "{assunto}"
-- Corpo do e-mail: "{corpo[:800]}"
-- Nomes dos anexos recebidos: {nomes_anexos}
-- Resumo dos anexos (prévia do texto): {textos_anexos}
+# Saída estruturada: o modelo é obrigado a responder neste schema (sem JSON inválido)
+SCHEMA_VALIDACAO = {
+    "type": "object",
+    "properties": {
+        "valido": {"type": "boolean"},
+        "campos_faltantes": {"type": "array", "items": {"type": "string"}},
+        "coerencia": {"type": "boolean"},
+        "motivo": {"type": "string"},
+        "acao_sugerida": {"type": "string", "enum": ["protocolar", "revisar", "rejeitar"]},
+    },
+    "required": ["valido", "campos_faltantes", "coerencia", "motivo", "acao_sugerida"],
+    "additionalProperties": False,
+}
+FORMATO_RESPOSTA = {
+    "type": "json_schema",
+    "json_schema": {"name": "validacao_formal", "strict": True, "schema": SCHEMA_VALIDACAO},
+}
 
-### Campos extraídos do assunto/processamento automático:
-{json.dumps(campos_extraidos, ensure_ascii=False)}
+# Peso de cada campo variável na divisão do orçamento de tokens do prompt
+PESOS_PROMPT = {
+    "assunto": 1,
+    "corpo": 4,
+    "campos": 0.5,
+    "nomes_anexos": 1.5,
+    "textos_anexos": 6,
+}
+
+INSTRUCOES_VALIDACAO = """
+Você é um assistente jurídico especializado na gestão de ofícios judiciais de uma instituição financeira de abrangência nacional. O setor de Gerência de Ofícios (GOF) é responsável por receber e responder ordens judiciais encaminhadas por juízes de todo o Brasil, que podem requerer informações detalhadas, envio de documentos (extrato, contrato, termo, comprovante, etc.) ou ações concretas (bloqueio/desbloqueio de valores, transferência, liberação de gravame, etc).
+
+Seu papel é **validar a formalidade da resposta** (e-mail, anexos, minuta) para o protocolo, indicando de forma clara se está APTO para protocolo, deve ser REVISADO, ou REJEITADO.
 
 ### Critérios práticos:
 - Toda resposta deve conter, no mínimo:
@@ -43,63 +73,139 @@ Seu papel é **validar a formalidade da resposta** (e-mail, anexos, minuta) para
 ### Perguntas para análise (responda na justificativa, mas NÃO repita as perguntas!):
 1. A minuta está presente, com conteúdo coerente e identificadores corretos?
 2. Há comprovante de assinatura da minuta?
-3. Se mencionados, os documentos adicionais estão presentes?
-4. Há inconsistência entre o que é mencionado no corpo/minuta e o que foi anexado?
-5. Está apto a ser protocolado, deve ser revisado, ou rejeitado?
+3. Todos os nomes de anexos são compatíveis com o assunto e os identificadores aparecem nos anexos ou no texto?
+4. Se mencionados, os documentos adicionais estão presentes, sem inconsistência entre o que é citado e o que foi anexado?
+5. O que o banco está efetivamente informando ou cumprindo na resposta?
 
-### Perguntas para análise (responda na justificativa, mas NÃO repita as perguntas!):
-1. Explique sucintamente o que o banco está informando ou cumprindo na resposta.
-2. Todos os nomes de anexos são compatíveis com o que está descrito no assunto?
-3. Todos os identificadores do assunto aparecem corretamente nos anexos ou no texto?
-4. Faltam anexos ou documentos obrigatórios (minuta, comprovante de assinatura, documento citado, etc)?
-5. Há inconsistências formais ou entre menção e presença de anexos?
-
-Responda obrigatoriamente em JSON, conforme exemplo:
-
-{{
-  "valido": true,
-  "campos_faltantes": [],
-  "coerencia": true,
-  "motivo": "AÇÃO: Protocolar. Minuta de resposta identificada, todos os identificadores conferem, e comprovante de assinatura está anexo. O banco presta informação sobre bloqueio judicial e anexa extratos conforme determinação.",
-  "acao_sugerida": "protocolar"
-}}
+### Formato da resposta (JSON):
+- "motivo": comece com "AÇÃO: Protocolar.", "AÇÃO: Revisar." ou "AÇÃO: Rejeitar.", justifique de forma objetiva e termine, em frase única, com o que o banco está respondendo ou cumprindo.
+- "acao_sugerida": "protocolar", "revisar" ou "rejeitar" (a mesma ação do motivo).
+- "valido": true somente se a ação for protocolar.
+- "campos_faltantes": documentos ou identificadores ausentes (lista vazia se nada faltar).
+- "coerencia": se o conteúdo do e-mail e dos anexos é coerente entre si.
+"""
+
+def prompt_formal_ia(assunto, corpo, nomes_anexos, textos_anexos, campos_extraidos, orcamento=None):
+    """
+    Monta o prompt dentro de um orçamento de tokens (IA_ORCAMENTO_PROMPT) para
+    os campos variáveis: cada campo recebe uma parte proporcional a PESOS_PROMPT
+    e o que um campo curto não usa fica para os demais.
+    """
+    orcamento = orcamento or IA_ORCAMENTO_PROMPT
+    nomes_anexos = [str(n or "sem_nome") for n in nomes_anexos]
+    textos_anexos = list(textos_anexos or []) + [""] * (len(nomes_anexos) - len(textos_anexos or []))
+    campos = json.dumps(campos_extraidos, ensure_ascii=False)
+    lista_nomes = "\n".join(f"{i}. {n}" for i, n in enumerate(nomes_anexos, 1))
+
+    tamanhos = {
+        "assunto": contar_tokens(assunto),
+        "corpo": contar_tokens(corpo),
+        "campos": contar_tokens(campos),
+        "nomes_anexos": contar_tokens(lista_nomes),
+        "textos_anexos": sum(contar_tokens(t) for t in textos_anexos),
+    }
+    limites = distribuir_orcamento(tamanhos, PESOS_PROMPT, orcamento)
+
+    # A parte das prévias é dividida entre os anexos pela mesma regra
+    tamanhos_textos = {i: contar_tokens(t) for i, t in enumerate(textos_anexos)}
+    limites_textos = distribuir_orcamento(
+        tamanhos_textos, {i: 1 for i in tamanhos_textos}, limites["textos_anexos"]
+    )
+    previas = [
+        truncar_tokens(" ".join(t.split()), limites_textos[i]) for i, t in enumerate(textos_anexos)
+    ]
+    anexos = "\n".join(
+        f"{i}. {nome}" + (f"\n   Prévia: {previa}" if previa else "")
+        for i, (nome, previa) in enumerate(zip(nomes_anexos, previas), 1)
+    ) if nomes_anexos else "(nenhum)"
+    if tamanhos["nomes_anexos"] > limites["nomes_anexos"]:
+        anexos = truncar_tokens(anexos, limites["nomes_anexos"] + limites["textos_anexos"])
+
+    return f"""{INSTRUCOES_VALIDACAO}
+### Dados recebidos:
+- Assunto do e-mail: "{truncar_tokens(assunto, limites["assunto"])}"
+- Corpo do e-mail: "{truncar_tokens(corpo, limites["corpo"])}"
+
+### Anexos recebidos ({len(nomes_anexos)}):
+{anexos}
+
+### Campos extraídos do assunto/processamento automático:
+{truncar_tokens(campos, limites["campos"])}
 """
 
-def validar_formal_ia(assunto, corpo, nomes_anexos, textos_anexos, campos_extraidos, model="gpt-4o"):
+def validar_formal_ia(assunto, corpo, nomes_anexos, textos_anexos, campos_extraidos, model="gpt-4o", usar_cache=True):
     prompt = prompt_formal_ia(assunto, corpo, nomes_anexos, textos_anexos, campos_extraidos)
+    if not (usar_cache and IA_CACHE):
+        return consultar_ia(prompt, model)
+
+    chave = cache_validacao_ia.chave(model, PROMPT_VERSAO, SISTEMA_VALIDADOR + prompt)
+    try:
+        resultado = cache_validacao_ia.obter(chave)
+    except Exception as e:
+        log(f"⚠️ Cache IA indisponível: {e}", "WARNING")
+        return consultar_ia(prompt, model)
+    if resultado is not None:
+        return resultado
+
+    resultado = consultar_ia(prompt, model)
+    try:
+        cache_validacao_ia.gravar(chave, model, PROMPT_VERSAO, resultado)
+    except Exception as e:
+        log(f"⚠️ Falha ao gravar no cache IA: {e}", "WARNING")
+    return resultado
+
+def mensagens_validacao(prompt):
+    return [
+        {"role": "system", "content": SISTEMA_VALIDADOR},
+        {"role": "user", "content": prompt}
+    ]
+
+def resultado_erro(erro_ia, motivo):
+    return {
+        "valido": None,
+        "erro_ia": erro_ia,
+        "campos_faltantes": [],
+        "coerencia": None,
+        "motivo": motivo,
+        "acao_sugerida": "aguardar"
+    }
+
+def interpretar_resposta(content):
+    """
+    Converte o texto devolvido pelo modelo no dict de resultado. Com a saída
+    estruturada o conteúdo já é o JSON do schema; a limpeza de markdown fica
+    para backends/modelos sem suporte a json_schema.
+    """
+    content = (content or "").strip()
+
+    # Corrige formatação em markdown tipo ```json\n...\n```
+    if content.startswith("```json"):
+        content = re.sub(r"^```json\s*", "", content)
+    if content.endswith("```"):
+        content = re.sub(r"\s*```$", "", content)
+
+    try:
+        return json.loads(content)
+    except json.JSONDecodeError:
+        return resultado_erro(
+            "json_decode_error", f"IA não respondeu em JSON válido. Conteúdo bruto: {content}"
+        )
+
+def consultar_ia(prompt, model="gpt-4o"):
+    tokens_estimados = estimar_tokens(SISTEMA_VALIDADOR, prompt)
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Você é um assistente jurídico validador formal de ofícios bancários."},
-                {"role": "user", "content": prompt}
-            ]
+        limitador_ia.adquirir(tokens_estimados)
+        resposta = get_backend_ia().completar(
+            mensagens_validacao(prompt), model, formato_resposta=FORMATO_RESPOSTA
         )
-        content = response.choices[0].message.content.strip()
-
-        # Corrige formatação em markdown tipo ```json\n...\n```
-        if content.startswith("```json"):
-            content = re.sub(r"^```json\s*", "", content)
-        if content.endswith("```"):
-            content = re.sub(r"\s*```$", "", content)
-
-        try:
-            return json.loads(content)
-        except json.JSONDecodeError:
-            return {
-                "valido": None,
-                "erro_ia": "json_decode_error",
-                "campos_faltantes": [],
-                "coerencia": None,
-                "motivo": f"IA não respondeu em JSON válido. Conteúdo bruto: {content}",
-                "acao_sugerida": "aguardar"
-            }
+        limitador_ia.registrar_uso(tokens_estimados, resposta.total_tokens)
+        if resposta.total_tokens is not None:
+            log(
+                f"🔢 Tokens IA ({model}): prompt={resposta.prompt_tokens} "
+                f"completion={resposta.completion_tokens} (estimado={tokens_estimados})"
+            )
+        if resposta.recusa:
+            return resultado_erro("recusa", f"IA recusou a validação: {resposta.recusa}")
+        return interpretar_resposta(resposta.conteudo)
     except Exception as e:
-        return {
-            "valido": None,
-            "erro_ia": str(e),
-            "campos_faltantes": [],
-            "coerencia": None,
-            "motivo": f"IA não executada — erro de API: {str(e)}",
-            "acao_sugerida": "aguardar"
-        }
+        return resultado_erro(str(e), f"IA não executada — erro de API: {str(e)}")
@@ -0,0 +1,185 @@
+import json
+import uuid
+import threading
+from datetime import datetime
+from backend.utils import log, get_conn, nova_conexao
+
+class JobEmExecucao(Exception):
+    def __init__(self, tipo, id_job):
+        super().__init__(f"Já existe um job '{tipo}' em execução ({id_job or 'outro processo'}).")
+        self.tipo = tipo
+        self.id_job = id_job
+
+class GerenciadorJobs:
+    """
+    Executa rotinas longas (captura, validação IA) em threads de fundo.
+
+    - Apenas um job por tipo roda por vez: trava em memória no processo e
+      advisory lock do Postgres entre processos/hosts.
+    - O cancelamento é cooperativo: a rotina recebe `cancelar` (threading.Event)
+      e deve verificá-lo entre uma mensagem e outra.
+    - Status, resultado e histórico ficam na tabela execucoes_job.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ativos = {}
+
+    def iniciar(self, tipo, funcao, preparar=None, **parametros):
+        """
+        Registra e dispara o job. `preparar` roda depois de garantida a
+        exclusividade e antes da thread começar (ex.: zerar o progresso).
+        """
+        with self._lock:
+            if tipo in self._ativos:
+                raise JobEmExecucao(tipo, self._ativos[tipo]["id_job"])
+
+            # Conexão fora do pool: o advisory lock vive na sessão até o fim do job
+            conn_lock = nova_conexao()
+            cur = conn_lock.cursor()
+            cur.execute("SELECT pg_try_advisory_lock(hashtext(%s))", (f"job:{tipo}",))
+            if not cur.fetchone()[0]:
+                cur.close()
+                conn_lock.close()
+                raise JobEmExecucao(tipo, None)
+            conn_lock.commit()
+            cur.close()
+
+            job = {
+                "id_job": uuid.uuid4().hex,
+                "tipo": tipo,
+                "status": "pendente",
+                "parametros": parametros,
+                "cancelar": threading.Event(),
+                "conn_lock": conn_lock,
+            }
+            try:
+                self._inserir(job)
+            except Exception:
+                conn_lock.close()
+                raise
+            self._ativos[tipo] = job
+            if preparar:
+                preparar()
+
+        threading.Thread(target=self._executar, args=(job, funcao), daemon=True).start()
+        return self._publico(job)
+
+    def _executar(self, job, funcao):
+        resultado = None
+        erro = None
+        try:
+            self._atualizar(job, status="em_execucao", iniciado_em=datetime.now())
+            resultado = funcao(cancelar=job["cancelar"], **job["parametros"])
+            status = "cancelado" if job["cancelar"].is_set() else "concluido"
+        except Exception as e:
+            status = "erro"
+            erro = str(e)
+            log(f"❌ Job {job['tipo']} ({job['id_job']}) falhou: {e}", "ERROR")
+        finally:
+            with self._lock:
+                self._ativos.pop(job["tipo"], None)
+            try:
+                self._atualizar(job, status=status, resultado=resultado, erro=erro, finalizado_em=datetime.now())
+            finally:
+                try:
+                    job["conn_lock"].close()  # libera o advisory lock
+                except Exception:
+                    pass
+
+    def cancelar(self, tipo=None, id_job=None):
+        with self._lock:
+            for job in self._ativos.values():
+                if (tipo and job["tipo"] == tipo) or (id_job and job["id_job"] == id_job):
+                    job["cancelar"].set()
+                    job["status"] = "cancelando"
+                    return self._publico(job)
+        return None
+
+    def ativo(self, tipo):
+        with self._lock:
+            job = self._ativos.get(tipo)
+            return self._publico(job) if job else None
+
+    def status(self, id_job):
+        with self._lock:
+            for job in self._ativos.values():
+                if job["id_job"] == id_job:
+                    return self._publico(job)
+        historico = self._consultar("WHERE id_job = %s", (id_job,), 1)
+        return historico[0] if historico else None
+
+    def historico(self, tipo=None, limite=20):
+        if tipo:
+            return self._consultar("WHERE tipo = %s", (tipo,), limite)
+        return self._consultar("", (), limite)
+
+    def _publico(self, job):
+        return {
+            chave: valor for chave, valor in job.items()
+            if chave not in ("cancelar", "conn_lock")
+        }
+
+    def _inserir(self, job):
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            INSERT INTO execucoes_job (id_job, tipo, status, parametros)
+            VALUES (%s, %s, %s, %s)
+        """, (job["id_job"], job["tipo"], job["status"], json.dumps(job["parametros"], default=str)))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    def _atualizar(self, job, **campos):
+        job.update(campos)
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute("""
+            UPDATE execucoes_job
+            SET status = %s, resultado = %s, erro = %s, iniciado_em = %s, finalizado_em = %s
+            WHERE id_job = %s
+        """, (
+            job["status"],
+            json.dumps(job.get("resultado"), default=str) if job.get("resultado") is not None else None,
+            job.get("erro"), job.get("iniciado_em"), job.get("finalizado_em"), job["id_job"]
+        ))
+        conn.commit()
+        cur.close()
+        conn.close()
+
+    def _consultar(self, filtro, params, limite):
+        conn = get_conn()
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT id_job, tipo, status, parametros, resultado, erro, criado_em, iniciado_em, finalizado_em
+            FROM execucoes_job
+            {filtro}
+            ORDER BY criado_em DESC
+            LIMIT %s
+        """, (*params, limite))
+        colunas = [c[0] for c in cur.description]
+        linhas = [dict(zip(colunas, row)) for row in cur.fetchall()]
+        cur.close()
+        conn.close()
+        return linhas
+
+gerenciador_jobs = GerenciadorJobs()
+
+def iniciar_captura(**parametros):
+    from backend.captura_emails import capturar_emails
+    from backend.progresso import progresso_captura
+    # Zera o progresso antes de responder, para o cliente SSE não ver a execução anterior
+    return gerenciador_jobs.iniciar(
+        "captura", capturar_emails, preparar=progresso_captura.iniciar, **parametros
+    )
+
+def iniciar_retomada_captura():
+    from backend.captura_emails import retomar_captura
+    from backend.progresso import progresso_captura
+    # Mesmo tipo da captura: retomada e captura nova nunca rodam juntas
+    return gerenciador_jobs.iniciar("captura", retomar_captura, preparar=progresso_captura.iniciar)
+
+def iniciar_validacao_ia(**parametros):
+    from backend.pipeline import pipeline
+    return gerenciador_jobs.iniciar("validacao_ia", pipeline, **parametros)
@@ -0,0 +1,294 @@
+import os
+import base64
+import binascii
+import hashlib
+import tempfile
+from email import policy
+from email.parser import BytesHeaderParser
+
+# Diretório dos arquivos temporários dos anexos (None = temporário do sistema)
+CAPTURA_DIR_TEMP = os.getenv("CAPTURA_DIR_TEMP") or None
+# Limite de bytes mantidos em memória para o corpo texto/html
+LIMITE_CORPO = int(os.getenv("CAPTURA_LIMITE_CORPO", str(2 * 1024 * 1024)))
+
+class AnexoTemporario:
+    """
+    Destino de um anexo: grava o conteúdo decodificado em arquivo temporário,
+    calculando SHA-256 e tamanho à medida que os blocos chegam.
+    """
+
+    def __init__(self, nome, tipo):
+        self.nome = nome
+        self.tipo = tipo
+        self.sha256 = hashlib.sha256()
+        self.tamanho = 0
+        fd, self.caminho = tempfile.mkstemp(dir=CAPTURA_DIR_TEMP, prefix="anexo-")
+        self.arquivo = os.fdopen(fd, "wb")
+
+    def escrever(self, dados):
+        if dados:
+            self.arquivo.write(dados)
+            self.sha256.update(dados)
+            self.tamanho += len(dados)
+
+    def fechar(self):
+        if not self.arquivo.closed:
+            self.arquivo.close()
+
+    @property
+    def hash_conteudo(self):
+        return self.sha256.hexdigest()
+
+    def remover(self):
+        self.fechar()
+        if os.path.exists(self.caminho):
+            os.remove(self.caminho)
+
+class _Texto:
+    def __init__(self, subtipo, charset):
+        self.subtipo = subtipo
+        self.charset = charset or "utf-8"
+        self.partes = []
+        self.tamanho = 0
+
+    def escrever(self, dados):
+        if dados and self.tamanho < LIMITE_CORPO:
+            self.partes.append(dados)
+            self.tamanho += len(dados)
+
+    def fechar(self):
+        pass
+
+    def texto(self):
+        conteudo = b"".join(self.partes)[:LIMITE_CORPO]
+        try:
+            return conteudo.decode(self.charset, errors="replace")
+        except LookupError:
+            return conteudo.decode("utf-8", errors="replace")
+
+class _Destinos:
+    """Parte que é anexo e também candidata a corpo (ex.: 2º text/plain de um multipart/mixed)."""
+
+    def __init__(self, *destinos):
+        self.destinos = destinos
+
+    def escrever(self, dados):
+        for destino in self.destinos:
+            destino.escrever(dados)
+
+    def fechar(self):
+        for destino in self.destinos:
+            destino.fechar()
+
+# Tipos que o get_body/iter_attachments do stdlib tratam como corpo, não como anexo
+_TIPOS_CORPO = {("text", "plain"), ("text", "html"), ("multipart", "related"), ("multipart", "alternative")}
+
+class _Parte:
+    def __init__(self):
+        self.linhas_cabecalho = []
+        self.cabecalho = None
+        self.fronteira = None
+        self.destino = None
+        self.codificacao = "7bit"
+        self.resto_base64 = b""
+        self.quebra_pendente = False
+        # Classificação (multipart): subtipo, parâmetro start, filhos já vistos e
+        # se a parte está no caminho de busca do corpo (get_body)
+        self.subtipo = None
+        self.start = None
+        self.filhos = 0
+        self.vistos = []
+        self.no_corpo = False
+
+class LeitorMime:
+    """
+    Parser MIME incremental. Recebe o e-mail linha a linha (sem o terminador),
+    mantém em memória apenas cabeçalhos e corpo de texto e grava os anexos
+    decodificados direto em arquivos temporários. Corpo e anexos seguem as
+    mesmas regras de get_body/iter_attachments do parser completo
+    (interpretar_mensagem), para as duas capturas gravarem o mesmo resultado.
+
+    `filtro_cabecalho(cabecalho)` é chamado assim que o cabeçalho principal
+    termina; se retornar False o restante da mensagem é descartado.
+    """
+
+    def __init__(self, filtro_cabecalho=None):
+        self.filtro_cabecalho = filtro_cabecalho
+        self.cabecalho = None
+        self.descartar = False
+        self.textos = []
+        self.anexos = []
+        self.pilha = [_Parte()]
+
+    def alimentar(self, linha):
+        if self.descartar or not self.pilha:
+            return
+        parte = self.pilha[-1]
+
+        if parte.cabecalho is None:
+            if linha.strip():
+                parte.linhas_cabecalho.append(linha)
+            else:
+                self._iniciar_corpo(parte)
+            return
+
+        marcador = self._fronteira(linha)
+        if marcador is not None:
+            self._tratar_fronteira(*marcador)
+            return
+
+        if parte.fronteira is not None:
+            # Preâmbulo/epílogo de multipart: ignorado
+            return
+        self._escrever_linha(parte, linha)
+
+    def finalizar(self):
+        if len(self.pilha) == 1 and self.pilha[0].cabecalho is None:
+            # Mensagem sem corpo: só cabeçalho
+            self._iniciar_corpo(self.pilha[0])
+        while self.pilha:
+            self._encerrar_parte(self.pilha.pop())
+        corpo = None
+        for subtipo in ("plain", "html"):
+            corpo = next((t for t in self.textos if t.subtipo == subtipo), None)
+            if corpo:
+                break
+        return {
+            "cabecalho": self.cabecalho,
+            "corpo_texto": corpo.texto().strip() if corpo else None,
+            "anexos": [a for a in self.anexos if a.tamanho > 0],
+        }
+
+    def descartar_anexos(self):
+        for anexo in self.anexos:
+            anexo.remover()
+
+    def _fronteira(self, linha):
+        if not linha.startswith(b"--"):
+            return None
+        candidato = linha.rstrip()
+        for indice in range(len(self.pilha) - 1, -1, -1):
+            fronteira = self.pilha[indice].fronteira
+            if fronteira is None:
+                continue
+            if candidato == b"--" + fronteira:
+                return indice, False
+            if candidato == b"--" + fronteira + b"--":
+                return indice, True
+        return None
+
+    def _tratar_fronteira(self, indice, fim):
+        # Fecha as partes abertas dentro do multipart dono da fronteira
+        while len(self.pilha) - 1 > indice:
+            self._encerrar_parte(self.pilha.pop())
+        if fim:
+            self.pilha[indice].fronteira = None
+        else:
+            self.pilha.append(_Parte())
+
+    def _iniciar_corpo(self, parte):
+        cabecalho = BytesHeaderParser(policy=policy.default).parsebytes(
+            b"\r\n".join(parte.linhas_cabecalho) + b"\r\n\r\n"
+        )
+        parte.cabecalho = cabecalho
+        parte.linhas_cabecalho = []
+
+        if self.cabecalho is None:
+            self.cabecalho = cabecalho
+            if self.filtro_cabecalho and not self.filtro_cabecalho(cabecalho):
+                self.descartar = True
+                return
+
+        tipo = cabecalho.get_content_type()
+        maintipo = cabecalho.get_content_maintype()
+        parte.subtipo = cabecalho.get_content_subtype()
+        declarado_anexo = cabecalho.get_content_disposition() == "attachment"
+        mae = self.pilha[-2] if len(self.pilha) > 1 else None
+        if mae is None:
+            parte.no_corpo = not declarado_anexo
+            anexo = False
+        else:
+            raiz = self._raiz_related(mae, cabecalho)
+            parte.no_corpo = mae.no_corpo and not declarado_anexo and (mae.subtipo != "related" or raiz)
+            anexo = mae is self.pilha[0] and self._anexo(mae, maintipo, parte.subtipo, declarado_anexo, raiz)
+            mae.filhos += 1
+
+        if maintipo == "multipart":
+            fronteira = cabecalho.get_boundary()
+            parte.fronteira = fronteira.encode("ascii", errors="ignore") if fronteira else None
+            parte.start = cabecalho.get_param("start")
+            return
+
+        parte.codificacao = str(cabecalho.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+        if maintipo == "message":
+            # Mesmo comportamento do parser completo: get_payload(decode=True) não decodifica message/*
+            return
+        destinos = []
+        if anexo:
+            destinos.append(AnexoTemporario(cabecalho.get_filename() or "sem_nome", tipo))
+            self.anexos.append(destinos[-1])
+        if parte.no_corpo and maintipo == "text" and parte.subtipo in ("plain", "html"):
+            destinos.append(_Texto(parte.subtipo, cabecalho.get_content_charset()))
+            self.textos.append(destinos[-1])
+        if destinos:
+            parte.destino = destinos[0] if len(destinos) == 1 else _Destinos(*destinos)
+
+    @staticmethod
+    def _raiz_related(mae, cabecalho):
+        # Raiz de um multipart/related: a parte indicada por start ou, sem start, a primeira
+        if mae.start:
+            return cabecalho.get("Content-ID") == mae.start
+        return mae.filhos == 0
+
+    @staticmethod
+    def _anexo(mae, maintipo, subtipo, declarado_anexo, raiz):
+        """
+        Mesmas regras de EmailMessage.iter_attachments: só os filhos diretos do
+        multipart principal são anexos; em alternative nenhum, em related todos
+        menos a raiz (imagens inline de assinatura ficam de fora) e nos demais
+        tudo, exceto o primeiro texto/alternative/related de cada subtipo.
+        """
+        if mae.subtipo == "alternative":
+            return False
+        if mae.subtipo == "related":
+            return not raiz
+        if (maintipo, subtipo) in _TIPOS_CORPO and not declarado_anexo and subtipo not in mae.vistos:
+            mae.vistos.append(subtipo)
+            return False
+        return True
+
+    def _escrever_linha(self, parte, linha):
+        destino = parte.destino
+        if destino is None:
+            return
+        if parte.codificacao == "base64":
+            dados = parte.resto_base64 + b"".join(linha.split())
+            util = len(dados) - len(dados) % 4
+            parte.resto_base64 = dados[util:]
+            if util:
+                try:
+                    destino.escrever(base64.b64decode(dados[:util]))
+                except binascii.Error:
+                    pass
+            return
+
+        # A quebra antes da fronteira pertence à fronteira, por isso é adiada
+        if parte.quebra_pendente:
+            destino.escrever(b"\n")
+        if parte.codificacao == "quoted-printable":
+            suave = linha.endswith(b"=")
+            destino.escrever(binascii.a2b_qp(linha[:-1] if suave else linha))
+            parte.quebra_pendente = not suave
+        else:
+            destino.escrever(linha)
+            parte.quebra_pendente = True
+
+    def _encerrar_parte(self, parte):
+        if parte.destino is None:
+            return
+        if parte.resto_base64:
+            try:
+                parte.destino.escrever(base64.b64decode(parte.resto_base64 + b"=" * (-len(parte.resto_base64) % 4)))
+            except binascii.Error:
+                pass
+        parte.destino.fechar()
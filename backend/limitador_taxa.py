@@ -0,0 +1,58 @@
+import time
+import threading
+
+class BaldeTokens:
+    """
+    Token bucket thread-safe: `capacidade` tokens, repostos continuamente
+    a `por_segundo`. `consumir` bloqueia até haver saldo suficiente.
+    """
+
+    def __init__(self, capacidade, por_segundo):
+        self.capacidade = float(capacidade)
+        self.por_segundo = float(por_segundo)
+        self._saldo = float(capacidade)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self._saldo = min(self.capacidade, self._saldo + (agora - self._ultimo) * self.por_segundo)
+        self._ultimo = agora
+
+    def consumir(self, quantidade=1):
+        # Pedido maior que o balde nunca caberia: limita à capacidade
+        quantidade = min(float(quantidade), self.capacidade)
+        while True:
+            with self._lock:
+                self._repor()
+                if self._saldo >= quantidade:
+                    self._saldo -= quantidade
+                    return
+                espera = (quantidade - self._saldo) / self.por_segundo
+            time.sleep(espera)
+
+    def ajustar(self, diferenca):
+        """Corrige o saldo depois do consumo real (o saldo pode ficar negativo)."""
+        with self._lock:
+            self._repor()
+            self._saldo = min(self.capacidade, self._saldo - diferenca)
+
+class LimitadorTaxa:
+    """
+    Limita requisições e tokens por minuto de uma API (ex.: OpenAI).
+    Valores <= 0 desativam o respectivo limite.
+    """
+
+    def __init__(self, requisicoes_minuto=0, tokens_minuto=0):
+        self.requisicoes = BaldeTokens(requisicoes_minuto, requisicoes_minuto / 60) if requisicoes_minuto > 0 else None
+        self.tokens = BaldeTokens(tokens_minuto, tokens_minuto / 60) if tokens_minuto > 0 else None
+
+    def adquirir(self, tokens_estimados=0):
+        if self.requisicoes:
+            self.requisicoes.consumir(1)
+        if self.tokens and tokens_estimados:
+            self.tokens.consumir(tokens_estimados)
+
+    def registrar_uso(self, tokens_estimados, tokens_usados):
+        if self.tokens and tokens_usados is not None:
+            self.tokens.ajustar(tokens_usados - tokens_estimados)
@@ -0,0 +1,366 @@
+import os
+import json
+import uuid
+import shutil
+import argparse
+from datetime import datetime
+from pathlib import Path
+import psycopg2.extras
+from dotenv import load_dotenv
+from backend.utils import log, get_conn
+from backend.ia_validador import (
+    prompt_formal_ia, mensagens_validacao, interpretar_resposta, resultado_erro, FORMATO_RESPOSTA
+)
+from backend.validacao_regras import pre_validar
+from backend.pipeline import (
+    preparar_emails, anexar_textos, gravar_resultado, gravar_ou_reagendar
+)
+from backend.fila_validacao import (
+    identificador_worker, reivindicar_emails, confirmar_claim, liberar_emails, RenovadorClaims
+)
+
+load_dotenv()
+
+# Backend do modo lote (openai = Batch API; local = substituto em arquivo, sem rede)
+LOTE_IA_BACKEND = os.getenv("LOTE_IA_BACKEND", "openai")
+LOTE_IA_DIR = os.getenv("LOTE_IA_DIR", str(Path(__file__).resolve().parent.parent / "lotes_ia"))
+LOTE_IA_MODELO = os.getenv("LOTE_IA_MODELO", "gpt-4o")
+# Veredito devolvido pelo backend local para todas as requisições
+LOTE_IA_RESPOSTA_LOCAL = os.getenv("LOTE_IA_RESPOSTA_LOCAL", json.dumps({
+    "valido": False,
+    "campos_faltantes": [],
+    "coerencia": None,
+    "motivo": "AÇÃO: Revisar. Resposta simulada pelo backend de lote local.",
+    "acao_sugerida": "revisar",
+}, ensure_ascii=False))
+CAMADA_IA_LOTE = "ia_lote"
+
+class BackendLote:
+    """
+    Interface dos backends de lote. Recebe um JSONL no formato da Batch API
+    da OpenAI ({custom_id, method, url, body} por linha) e devolve outro JSONL
+    com {custom_id, response: {status_code, body}, error} por linha.
+    """
+
+    def enviar(self, arquivo_requisicoes):
+        """Submete o arquivo e retorna o id externo do lote."""
+        raise NotImplementedError
+
+    def consultar(self, id_externo):
+        """Retorna 'em_andamento', 'concluido' ou 'erro'."""
+        raise NotImplementedError
+
+    def baixar_resultados(self, id_externo, destino):
+        """Grava o JSONL de resultados em `destino`."""
+        raise NotImplementedError
+
+class BackendLoteOpenAI(BackendLote):
+    """Batch API da OpenAI (janela de 24h, custo reduzido)."""
+
+    STATUS = {
+        "completed": "concluido",
+        "failed": "erro",
+        "expired": "erro",
+        "cancelled": "erro",
+    }
+
+    def __init__(self, client=None):
+        if client is None:
+            from backend.backends_ia import BackendOpenAI
+            client = BackendOpenAI().client
+        self.client = client
+
+    def enviar(self, arquivo_requisicoes):
+        with open(arquivo_requisicoes, "rb") as f:
+            arquivo = self.client.files.create(file=f, purpose="batch")
+        lote = self.client.batches.create(
+            input_file_id=arquivo.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+        return lote.id
+
+    def consultar(self, id_externo):
+        lote = self.client.batches.retrieve(id_externo)
+        return self.STATUS.get(lote.status, "em_andamento")
+
+    def baixar_resultados(self, id_externo, destino):
+        lote = self.client.batches.retrieve(id_externo)
+        with open(destino, "wb") as f:
+            # Linhas com erro vêm num arquivo separado; os dois usam o mesmo formato
+            for id_arquivo in (lote.output_file_id, lote.error_file_id):
+                if id_arquivo:
+                    f.write(self.client.files.content(id_arquivo).content)
+
+class BackendArquivoLocal(BackendLote):
+    """
+    Substituto local da Batch API, sem rede: responde todas as requisições no
+    envio e grava o JSONL de resultados em <diretorio>/<id>.jsonl. O veredito vem
+    de `responder(body)`; por padrão é o JSON fixo de LOTE_IA_RESPOSTA_LOCAL.
+    """
+
+    def __init__(self, diretorio=None, responder=None):
+        self.diretorio = Path(diretorio or Path(LOTE_IA_DIR) / "local")
+        self.responder = responder or (lambda body: LOTE_IA_RESPOSTA_LOCAL)
+
+    def enviar(self, arquivo_requisicoes):
+        id_externo = f"local-{uuid.uuid4().hex}"
+        self.diretorio.mkdir(parents=True, exist_ok=True)
+        with open(arquivo_requisicoes, encoding="utf-8") as entrada, \
+                open(self.diretorio / f"{id_externo}.jsonl", "w", encoding="utf-8") as saida:
+            for linha in entrada:
+                if not linha.strip():
+                    continue
+                requisicao = json.loads(linha)
+                conteudo = self.responder(requisicao["body"])
+                saida.write(json.dumps({
+                    "id": f"resp-{uuid.uuid4().hex}",
+                    "custom_id": requisicao["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {"choices": [{"message": {"role": "assistant", "content": conteudo}}]},
+                    },
+                    "error": None,
+                }, ensure_ascii=False) + "\n")
+        return id_externo
+
+    def consultar(self, id_externo):
+        return "concluido" if (self.diretorio / f"{id_externo}.jsonl").exists() else "erro"
+
+    def baixar_resultados(self, id_externo, destino):
+        shutil.copyfile(self.diretorio / f"{id_externo}.jsonl", destino)
+
+BACKENDS_LOTE = {
+    "openai": BackendLoteOpenAI,
+    "local": BackendArquivoLocal,
+}
+
+def registrar_backend_lote(nome, classe):
+    BACKENDS_LOTE[nome] = classe
+
+def get_backend_lote(nome=None):
+    nome = nome or LOTE_IA_BACKEND
+    if nome not in BACKENDS_LOTE:
+        raise ValueError(f"Backend de lote desconhecido: {nome}")
+    return BACKENDS_LOTE[nome]()
+
+def escrever_requisicoes(caminho, entradas, modelo=None):
+    """Grava o JSONL de requisições; o custom_id identifica o e-mail."""
+    modelo = modelo or LOTE_IA_MODELO
+    with open(caminho, "w", encoding="utf-8") as f:
+        for entrada in entradas:
+            prompt = prompt_formal_ia(
+                entrada["assunto"], entrada["corpo"], entrada["nomes_anexos"],
+                entrada["textos_anexos"], entrada["campos_extraidos"]
+            )
+            f.write(json.dumps({
+                "custom_id": f"email-{entrada['id_email']}",
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": modelo,
+                    "messages": mensagens_validacao(prompt),
+                    "response_format": FORMATO_RESPOSTA,
+                },
+            }, ensure_ascii=False) + "\n")
+
+def ler_resultados(caminho):
+    """
+    Retorna {custom_id: resultado} a partir do JSONL de resultados do backend.
+    Linhas sem custom_id são ignoradas (não há como ligá-las a um e-mail);
+    custom_ids desconhecidos são descartados na ingestão, que só procura os itens do lote.
+    """
+    resultados = {}
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            if not linha.strip():
+                continue
+            item = json.loads(linha)
+            if not item.get("custom_id"):
+                log(f"⚠️ Resultado de lote sem custom_id ignorado: {linha.strip()[:200]}", "WARNING")
+                continue
+            resposta = item.get("response") or {}
+            if item.get("error") or resposta.get("status_code") != 200:
+                erro = item.get("error") or resposta.get("body", {}).get("error")
+                resultados[item["custom_id"]] = resultado_erro(
+                    str(erro), f"IA não executada — erro no lote: {erro}"
+                )
+                continue
+            conteudo = resposta["body"]["choices"][0]["message"]["content"]
+            resultados[item["custom_id"]] = interpretar_resposta(conteudo)
+    return resultados
+
+def enviar_lote(limite=None, data=None, backend=None, modelo=None):
+    """
+    Prepara os e-mails pendentes (mesma etapa do pipeline), grava na hora os
+    decididos pelas regras e envia o restante num único lote ao backend.
+    """
+    nome_backend = backend or LOTE_IA_BACKEND
+    modelo = modelo or LOTE_IA_MODELO
+    worker = identificador_worker()
+    ids = []
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        # Reivindicados como no pipeline; depois de registrados no lote, os itens já os excluem da fila
+        emails = reivindicar_emails(cur, worker, limite, data, excluir_em_lote=True)
+        conn.commit()
+        ids = [email["id_email"] for email in emails]
+        with RenovadorClaims(worker, ids):
+            entradas = preparar_emails(cur, emails)
+            anexar_textos(conn, entradas)
+
+        para_ia = []
+        por_regras = 0
+        for entrada in entradas:
+            resultado = pre_validar(entrada)
+            if resultado is None:
+                para_ia.append(entrada)
+            elif confirmar_claim(cur, worker, entrada["id_email"]):
+                gravar_resultado(cur, entrada, resultado)
+                por_regras += 1
+        conn.commit()
+
+        if not para_ia:
+            log(f"📦 Nenhum e-mail para o lote IA ({por_regras} decididos pelas regras).")
+            return {"id_lote": None, "enviados": 0, "regras": por_regras}
+
+        Path(LOTE_IA_DIR).mkdir(parents=True, exist_ok=True)
+        arquivo = Path(LOTE_IA_DIR) / f"lote-{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:6]}.jsonl"
+        escrever_requisicoes(arquivo, para_ia, modelo)
+
+        cur.execute("""
+            INSERT INTO lotes_ia (backend, status, modelo, total, arquivo_requisicoes)
+            VALUES (%s, 'preparado', %s, %s, %s)
+            RETURNING id_lote
+        """, (nome_backend, modelo, len(para_ia), str(arquivo)))
+        id_lote = cur.fetchone()["id_lote"]
+        psycopg2.extras.execute_values(cur, """
+            INSERT INTO lotes_ia_itens (id_lote, custom_id, id_email, entrada) VALUES %s
+        """, [
+            (id_lote, f"email-{e['id_email']}", e["id_email"], json.dumps(e, ensure_ascii=False, default=str))
+            for e in para_ia
+        ])
+        conn.commit()
+
+        try:
+            id_externo = get_backend_lote(nome_backend).enviar(arquivo)
+        except Exception as e:
+            cur.execute("""
+                UPDATE lotes_ia SET status = 'erro', erro = %s, atualizado_em = NOW() WHERE id_lote = %s
+            """, (str(e), id_lote))
+            conn.commit()
+            log(f"❌ Falha ao enviar o lote IA {id_lote}: {e}", "ERROR")
+            raise
+        cur.execute("""
+            UPDATE lotes_ia SET status = 'enviado', id_externo = %s, atualizado_em = NOW() WHERE id_lote = %s
+        """, (id_externo, id_lote))
+        conn.commit()
+        log(f"📦 Lote IA {id_lote} enviado ({nome_backend}: {id_externo}) com {len(para_ia)} e-mails; {por_regras} decididos pelas regras.")
+        return {"id_lote": id_lote, "id_externo": id_externo, "enviados": len(para_ia), "regras": por_regras}
+    finally:
+        conn.rollback()
+        liberar_emails(cur, worker, ids)
+        conn.commit()
+        cur.close()
+        conn.close()
+
+def ingerir_lote(id_lote):
+    """
+    Consulta o lote no backend e, se concluído, grava os resultados em
+    respostas/protocolos. E-mails que ganharam protocolo nesse meio-tempo
+    (ex.: validação em tempo real) são ignorados.
+    """
+    conn = get_conn()
+    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    try:
+        cur.execute("SELECT * FROM lotes_ia WHERE id_lote = %s FOR UPDATE", (id_lote,))
+        lote = cur.fetchone()
+        if not lote or lote["status"] not in ("enviado", "em_andamento"):
+            conn.rollback()
+            return {"id_lote": id_lote, "status": lote and lote["status"], "ingeridos": 0}
+
+        backend = get_backend_lote(lote["backend"])
+        status = backend.consultar(lote["id_externo"])
+        if status != "concluido":
+            cur.execute("""
+                UPDATE lotes_ia SET status = %s, atualizado_em = NOW() WHERE id_lote = %s
+            """, (status, id_lote))
+            conn.commit()
+            return {"id_lote": id_lote, "status": status, "ingeridos": 0}
+
+        arquivo = Path(LOTE_IA_DIR) / f"lote-{id_lote}-resultados.jsonl"
+        arquivo.parent.mkdir(parents=True, exist_ok=True)
+        backend.baixar_resultados(lote["id_externo"], arquivo)
+        resultados = ler_resultados(arquivo)
+
+        cur.execute("""
+            SELECT li.custom_id, li.entrada
+            FROM lotes_ia_itens li
+            LEFT JOIN protocolos p ON p.id_email = li.id_email
+            WHERE li.id_lote = %s AND p.id_email IS NULL
+            ORDER BY li.id_email
+        """, (id_lote,))
+        ingeridos = 0
+        reagendados = 0
+        sem_resultado = 0
+        for item in cur.fetchall():
+            resultado = resultados.get(item["custom_id"])
+            if resultado is None:
+                # Sem resposta: o e-mail volta a ficar pendente para o próximo lote/pipeline
+                sem_resultado += 1
+                continue
+            # Erros da IA no lote seguem a mesma fila de novas tentativas do pipeline
+            if gravar_ou_reagendar(cur, item["entrada"], {**resultado, "camada": CAMADA_IA_LOTE}):
+                ingeridos += 1
+            else:
+                reagendados += 1
+
+        cur.execute("""
+            UPDATE lotes_ia
+            SET status = 'ingerido', ingeridos = %s, arquivo_resultados = %s,
+                atualizado_em = NOW(), ingerido_em = NOW()
+            WHERE id_lote = %s
+        """, (ingeridos, str(arquivo), id_lote))
+        conn.commit()
+        log(
+            f"📥 Lote IA {id_lote} ingerido: {ingeridos} resultados gravados, "
+            f"{reagendados} reagendados, {sem_resultado} sem resultado."
+        )
+        return {
+            "id_lote": id_lote, "status": "ingerido", "ingeridos": ingeridos,
+            "reagendados": reagendados, "sem_resultado": sem_resultado,
+        }
+    finally:
+        cur.close()
+        conn.close()
+
+def ingerir_lotes_pendentes():
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id_lote FROM lotes_ia WHERE status IN ('enviado', 'em_andamento') ORDER BY id_lote
+    """)
+    ids = [row[0] for row in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return [ingerir_lote(id_lote) for id_lote in ids]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Validação IA em lote (offline).")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_enviar = sub.add_parser("enviar", help="envia os e-mails pendentes num lote")
+    p_enviar.add_argument("--limite", type=int, default=None)
+    p_enviar.add_argument("--data", default=None)
+    p_enviar.add_argument("--backend", default=None, choices=sorted(BACKENDS_LOTE))
+    p_ingerir = sub.add_parser("ingerir", help="ingere os lotes concluídos")
+    p_ingerir.add_argument("--id-lote", type=int, default=None)
+    args = parser.parse_args()
+    from backend.migracoes import aplicar_migracoes
+    aplicar_migracoes()
+    if args.comando == "enviar":
+        print(enviar_lote(limite=args.limite, data=args.data, backend=args.backend))
+    elif args.id_lote:
+        print(ingerir_lote(args.id_lote))
+    else:
+        print(ingerir_lotes_pendentes())
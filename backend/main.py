@@ -1,5 +1,6 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
@@ -8,6 +9,10 @@ import os
 from backend.dashboard_auth_utils import autenticar_usuario, buscar_usuario
 from backend.routers import protocolos
 from backend.routers.protocolos import download_anexo_publico  # ✅ nova rota pública
+from backend.utils import get_pool, fechar_pool
+from backend.banco_async import get_pool_async, fechar_pool_async
+from backend.migracoes import aplicar_migracoes
+from backend.extracao_textos import fechar_pool_extracao
 
 # Configurações do JWT
 SECRET_KEY = os.getenv("SECRET_KEY", "segredo-muito-seguro")
@@ -17,6 +22,20 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60
 # Inicializa o app
 app = FastAPI()
 
+# Pools de conexões (assíncrono da API e psycopg2 dos jobs): abrem no startup e fecham no shutdown.
+# Antes deles, as migrações pendentes (advisory lock: vários workers subindo juntos aplicam uma vez só)
+@app.on_event("startup")
+async def abrir_pools_banco():
+    await run_in_threadpool(aplicar_migracoes)
+    await get_pool_async()
+    get_pool()
+
+@app.on_event("shutdown")
+async def fechar_pools_banco():
+    await fechar_pool_async()
+    fechar_pool()
+    await run_in_threadpool(fechar_pool_extracao)
+
 # Middleware CORS
 app.add_middleware(
     CORSMiddleware,
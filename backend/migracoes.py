@@ -0,0 +1,370 @@
+import re
+import sys
+import json
+import argparse
+from collections import namedtuple
+from backend.utils import log, nova_conexao, SQL_ANEXOS_EMAILS
+
+# Migrações versionadas do esquema. Cada uma roda uma única vez (registrada em
+# schema_migracoes), em ordem de versão, sob advisory lock para que vários
+# processos subindo juntos não apliquem a mesma migração duas vezes.
+# `transacional=False` roda comando a comando em autocommit (CREATE INDEX CONCURRENTLY
+# não pode rodar dentro de transação e não bloqueia escrita em tabelas grandes).
+# É o único caminho de DDL: os módulos não criam nem alteram tabelas em tempo de
+# execução. Mudança de esquema = nova migração com a próxima versão (nunca editar
+# uma já aplicada).
+Migracao = namedtuple("Migracao", "versao nome sql transacional")
+
+DDL_SCHEMA_MIGRACOES = """
+    CREATE TABLE IF NOT EXISTS schema_migracoes (
+        versao INTEGER PRIMARY KEY,
+        nome TEXT NOT NULL,
+        aplicada_em TIMESTAMP NOT NULL DEFAULT NOW()
+    )
+"""
+LOCK_MIGRACOES = "schema_migracoes"
+
+# Migração 1, congelada como foi aplicada (antes montada a partir dos DDL_* de cada módulo).
+# Não editar: mudança de esquema entra numa nova migração.
+SQL_MIGRACAO_1 = """
+    ALTER TABLE anexos_email
+        ADD COLUMN IF NOT EXISTS hash_conteudo TEXT,
+        ADD COLUMN IF NOT EXISTS tamanho BIGINT,
+        ALTER COLUMN conteudo DROP NOT NULL;
+    CREATE TABLE IF NOT EXISTS emails_uidl (
+        conta TEXT NOT NULL,
+        uidl TEXT NOT NULL,
+        message_id TEXT,
+        capturado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (conta, uidl)
+    );
+    CREATE TABLE IF NOT EXISTS capturas_execucao (
+        id_execucao SERIAL PRIMARY KEY,
+        conta TEXT NOT NULL,
+        status TEXT NOT NULL,
+        parametros JSONB,
+        ultimo_numero INTEGER,
+        salvos INTEGER NOT NULL DEFAULT 0,
+        duplicados INTEGER NOT NULL DEFAULT 0,
+        falhas INTEGER NOT NULL DEFAULT 0,
+        iniciado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        atualizado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        finalizado_em TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS capturas_execucao_itens (
+        id_execucao INTEGER NOT NULL REFERENCES capturas_execucao (id_execucao) ON DELETE CASCADE,
+        chave TEXT NOT NULL,
+        PRIMARY KEY (id_execucao, chave)
+    );
+    CREATE TABLE IF NOT EXISTS execucoes_job (
+        id_job TEXT PRIMARY KEY,
+        tipo TEXT NOT NULL,
+        status TEXT NOT NULL,
+        parametros JSONB,
+        resultado JSONB,
+        erro TEXT,
+        criado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        iniciado_em TIMESTAMP,
+        finalizado_em TIMESTAMP
+    );
+    ALTER TABLE respostas ADD COLUMN IF NOT EXISTS camada_validacao TEXT;
+    CREATE TABLE IF NOT EXISTS claims_validacao (
+        id_email INTEGER PRIMARY KEY,
+        worker TEXT NOT NULL,
+        reivindicado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        expira_em TIMESTAMP NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS tentativas_validacao (
+        id_email INTEGER PRIMARY KEY,
+        tentativas INTEGER NOT NULL,
+        status TEXT NOT NULL,
+        ultimo_erro TEXT,
+        proxima_tentativa TIMESTAMP,
+        primeira_falha_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        atualizado_em TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    CREATE OR REPLACE VIEW validacao_dead_letter AS
+        SELECT t.id_email, t.tentativas, t.ultimo_erro, t.primeira_falha_em, t.atualizado_em,
+               e.assunto, e.recebido_em
+        FROM tentativas_validacao t
+        JOIN emails e ON e.id_email = t.id_email
+        WHERE t.status = 'dead';
+    CREATE TABLE IF NOT EXISTS cache_validacao_ia (
+        chave TEXT PRIMARY KEY,
+        modelo TEXT NOT NULL,
+        versao_prompt TEXT NOT NULL,
+        resultado JSONB NOT NULL,
+        criado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        ultimo_acesso TIMESTAMP NOT NULL DEFAULT NOW(),
+        acessos INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS idx_cache_validacao_ia_ultimo_acesso
+        ON cache_validacao_ia (ultimo_acesso);
+    CREATE TABLE IF NOT EXISTS textos_anexo (
+        hash_conteudo TEXT PRIMARY KEY,
+        texto TEXT NOT NULL,
+        paginas INTEGER NOT NULL DEFAULT 0,
+        extrator TEXT,
+        erro TEXT,
+        extraido_em TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    CREATE TABLE IF NOT EXISTS lotes_ia (
+        id_lote SERIAL PRIMARY KEY,
+        backend TEXT NOT NULL,
+        id_externo TEXT,
+        status TEXT NOT NULL,
+        modelo TEXT NOT NULL,
+        total INTEGER NOT NULL DEFAULT 0,
+        ingeridos INTEGER NOT NULL DEFAULT 0,
+        arquivo_requisicoes TEXT,
+        arquivo_resultados TEXT,
+        erro TEXT,
+        criado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        atualizado_em TIMESTAMP NOT NULL DEFAULT NOW(),
+        ingerido_em TIMESTAMP
+    );
+    CREATE TABLE IF NOT EXISTS lotes_ia_itens (
+        id_lote INTEGER NOT NULL REFERENCES lotes_ia (id_lote) ON DELETE CASCADE,
+        custom_id TEXT NOT NULL,
+        id_email INTEGER NOT NULL,
+        entrada JSONB NOT NULL,
+        PRIMARY KEY (id_lote, custom_id)
+    )
+"""
+
+# Índice deixado INVALID por um CREATE INDEX CONCURRENTLY que falhou
+INDICE_CONCORRENTE_RE = re.compile(
+    r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+IF\s+NOT\s+EXISTS\s+(\w+)", re.IGNORECASE
+)
+
+def remover_indice_invalido(cur, comando):
+    """
+    Um CREATE INDEX CONCURRENTLY interrompido deixa o índice criado mas INVALID
+    (pg_index.indisvalid = false), e o IF NOT EXISTS da nova tentativa o pularia.
+    Remove o índice inválido para o comando recriá-lo. Roda em autocommit.
+    """
+    achado = INDICE_CONCORRENTE_RE.search(comando)
+    if not achado:
+        return False
+    nome = achado.group(1)
+    cur.execute("SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (nome,))
+    row = cur.fetchone()
+    if not (row and row[0]):
+        return False
+    log(f"🛠️ Removendo índice inválido {nome} (criação anterior interrompida)", "WARNING")
+    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {nome}")
+    return True
+
+def migracoes():
+    return [
+        Migracao(1, "tabelas_auxiliares", SQL_MIGRACAO_1, True),
+        Migracao(2, "indices_consultas_quentes", """
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_emails_recebido
+                ON emails (recebido_em DESC, id_email DESC);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_emails_tipo_recebido
+                ON emails (tipo_email, recebido_em DESC, id_email DESC);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_emails_message_id
+                ON emails (message_id);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_protocolos_id_email
+                ON protocolos (id_email);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_protocolos_criado
+                ON protocolos (criado_em DESC, id_protocolo DESC);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_protocolos_status
+                ON protocolos (status);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_anexos_email_id_email
+                ON anexos_email (id_email, id_anexo);
+            CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_divergencias_id_protocolo
+                ON divergencias (id_protocolo)
+        """, False),
+        # Um protocolo por e-mail: barra a gravação duplicada de um worker cujo lease expirou.
+        # Falha se já houver duplicados em protocolos; resolva-os antes de aplicar.
+        Migracao(3, "protocolos_id_email_unico", """
+            CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_protocolos_id_email
+                ON protocolos (id_email);
+            DROP INDEX CONCURRENTLY IF EXISTS idx_protocolos_id_email
+        """, False),
+    ]
+
+def _comandos(sql):
+    return [c.strip() for c in sql.split(";") if c.strip()]
+
+def versoes_aplicadas(cur):
+    cur.execute(DDL_SCHEMA_MIGRACOES)
+    cur.execute("SELECT versao FROM schema_migracoes")
+    return {row[0] for row in cur.fetchall()}
+
+def aplicar_migracoes(ate=None):
+    """Aplica as migrações pendentes (até a versão `ate`) e retorna as versões aplicadas."""
+    conn = nova_conexao()
+    cur = conn.cursor()
+    aplicadas = []
+    try:
+        cur.execute("SELECT pg_advisory_lock(hashtext(%s))", (LOCK_MIGRACOES,))
+        feitas = versoes_aplicadas(cur)
+        conn.commit()
+        for migracao in sorted(migracoes(), key=lambda m: m.versao):
+            if migracao.versao in feitas or (ate is not None and migracao.versao > ate):
+                continue
+            log(f"🛠️ Aplicando migração {migracao.versao} ({migracao.nome})")
+            if migracao.transacional:
+                cur.execute(migracao.sql)
+            else:
+                conn.autocommit = True
+                try:
+                    for comando in _comandos(migracao.sql):
+                        remover_indice_invalido(cur, comando)
+                        cur.execute(comando)
+                finally:
+                    conn.autocommit = False
+            cur.execute(
+                "INSERT INTO schema_migracoes (versao, nome) VALUES (%s, %s)",
+                (migracao.versao, migracao.nome)
+            )
+            conn.commit()
+            aplicadas.append(migracao.versao)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            cur.execute("SELECT pg_advisory_unlock(hashtext(%s))", (LOCK_MIGRACOES,))
+            conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+    return aplicadas
+
+def status_migracoes():
+    conn = nova_conexao()
+    cur = conn.cursor()
+    feitas = versoes_aplicadas(cur)
+    conn.commit()
+    cur.close()
+    conn.close()
+    return [
+        {"versao": m.versao, "nome": m.nome, "aplicada": m.versao in feitas}
+        for m in sorted(migracoes(), key=lambda m: m.versao)
+    ]
+
+# --- VERIFICAÇÃO DE PLANOS (EXPLAIN) ---
+TABELAS_SEM_SEQ_SCAN = ("emails", "protocolos", "anexos_email", "respostas")
+
+# Formas representativas das consultas dos endpoints/pipeline, com parâmetros típicos
+CONSULTAS_QUENTES = {
+    "protocolos_pagina": ("""
+        SELECT p.id_protocolo
+        FROM protocolos p
+        JOIN emails e ON e.id_email = p.id_email
+        WHERE e.tipo_email = %s AND (p.criado_em, p.id_protocolo) < (NOW(), 2147483647)
+        ORDER BY p.criado_em DESC, p.id_protocolo DESC
+        LIMIT 51
+    """, ("protocolo",)),
+    "esteira_pagina": ("""
+        SELECT e.id_email, p.id_protocolo, r.status_final
+        FROM emails e
+        LEFT JOIN protocolos p ON p.id_email = e.id_email
+        LEFT JOIN respostas r ON r.id_resposta = p.id_resposta
+        WHERE e.tipo_email = %s
+        ORDER BY e.recebido_em DESC, e.id_email DESC
+        LIMIT 51
+    """, ("protocolo",)),
+    "emails_por_dia": ("""
+        SELECT e.id_email FROM emails e
+        WHERE e.recebido_em >= CURRENT_DATE - 1 AND e.recebido_em < CURRENT_DATE
+    """, ()),
+    "anexos_por_emails": (SQL_ANEXOS_EMAILS, ([1, 2, 3],)),
+    "emails_por_message_id": (
+        "SELECT id_email FROM emails WHERE message_id = ANY(%s)", (["<a@b>", "<c@d>"],)
+    ),
+}
+
+def semear_dados(cur, quantidade):
+    """
+    Popula emails/anexos/respostas/protocolos com `quantidade` e-mails sintéticos e roda
+    ANALYZE. Feito dentro da transação da verificação, que é desfeita no fim.
+    """
+    cur.execute("""
+        WITH novos AS (
+            INSERT INTO emails (remetente, assunto, recebido_em, message_id, corpo_email, tipo_email)
+            SELECT 'seed@exemplo', 'RESPOSTA FINAL - Ofício ' || g, NOW() - g * INTERVAL '7 minutes',
+                   '<seed-' || g || '@exemplo>', 'corpo', CASE WHEN g %% 5 = 0 THEN 'comunicacao' ELSE 'protocolo' END
+            FROM generate_series(1, %s) g
+            RETURNING id_email, recebido_em
+        ), anexos AS (
+            INSERT INTO anexos_email (id_email, nome_arquivo, tipo_arquivo)
+            SELECT id_email, 'minuta_' || id_email || '.pdf', 'application/pdf' FROM novos
+            UNION ALL
+            SELECT id_email, 'assinatura_' || id_email || '.pdf', 'application/pdf' FROM novos
+        )
+        INSERT INTO protocolos (id_email, status, criado_em, ultima_atualizacao)
+        SELECT id_email, 'pending', recebido_em, recebido_em FROM novos
+    """, (quantidade,))
+    cur.execute("""
+        WITH respostas_seed AS (
+            INSERT INTO respostas (id_email, tipo_resposta, data_chegada, status)
+            SELECT e.id_email, 'RESPOSTA FINAL', e.recebido_em, 'capturado'
+            FROM emails e WHERE e.remetente = 'seed@exemplo'
+            RETURNING id_resposta, id_email
+        )
+        UPDATE protocolos p SET id_resposta = r.id_resposta
+        FROM respostas_seed r WHERE r.id_email = p.id_email
+    """)
+    for tabela in TABELAS_SEM_SEQ_SCAN:
+        cur.execute(f"ANALYZE {tabela}")
+
+def _seq_scans(plano, encontrados=None):
+    encontrados = [] if encontrados is None else encontrados
+    if plano.get("Node Type") == "Seq Scan" and plano.get("Relation Name") in TABELAS_SEM_SEQ_SCAN:
+        encontrados.append(plano["Relation Name"])
+    for filho in plano.get("Plans", []):
+        _seq_scans(filho, encontrados)
+    return encontrados
+
+def verificar_planos(semear=0):
+    """
+    Roda EXPLAIN nas CONSULTAS_QUENTES e retorna {consulta: [tabelas com Seq Scan]}.
+    Com `semear`, insere dados sintéticos antes (tudo é desfeito com rollback).
+    Em tabelas quase vazias o planejador prefere Seq Scan de qualquer forma,
+    então rode contra uma base com volume real ou use `semear`.
+    """
+    conn = nova_conexao()
+    cur = conn.cursor()
+    resultado = {}
+    try:
+        if semear:
+            semear_dados(cur, semear)
+        for nome, (query, params) in CONSULTAS_QUENTES.items():
+            cur.execute("EXPLAIN (FORMAT JSON) " + query, params or None)
+            plano = cur.fetchone()[0]
+            if isinstance(plano, str):
+                plano = json.loads(plano)
+            resultado[nome] = _seq_scans(plano[0]["Plan"])
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+    return resultado
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações versionadas do esquema e verificação de planos.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_aplicar = sub.add_parser("aplicar", help="aplica as migrações pendentes")
+    p_aplicar.add_argument("--ate", type=int, help="aplica só até esta versão")
+    sub.add_parser("status", help="lista as migrações e se já foram aplicadas")
+    p_explain = sub.add_parser("explain", help="falha se as consultas quentes usarem Seq Scan")
+    p_explain.add_argument("--semear", type=int, default=0, help="e-mails sintéticos a inserir antes (desfeito no fim)")
+    args = parser.parse_args()
+
+    if args.comando == "aplicar":
+        aplicadas = aplicar_migracoes(args.ate)
+        print(f"Migrações aplicadas: {aplicadas or 'nenhuma pendente'}")
+    elif args.comando == "status":
+        for item in status_migracoes():
+            print(f"{item['versao']:>4}  {'✅' if item['aplicada'] else '⏳'}  {item['nome']}")
+    else:
+        falhas = {nome: tabelas for nome, tabelas in verificar_planos(args.semear).items() if tabelas}
+        for nome, tabelas in falhas.items():
+            print(f"❌ {nome}: Seq Scan em {', '.join(tabelas)}")
+        if not falhas:
+            print("✅ Nenhum Seq Scan nas consultas quentes.")
+        sys.exit(1 if falhas else 0)
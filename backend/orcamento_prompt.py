@@ -0,0 +1,65 @@
+import os
+
+try:
+    import tiktoken
+except ImportError:  # sem o tiktoken a contagem usa ~4 caracteres por token
+    tiktoken = None
+
+# Tokens disponíveis para os campos variáveis do prompt (assunto, corpo, anexos...)
+IA_ORCAMENTO_PROMPT = int(os.getenv("IA_ORCAMENTO_PROMPT", "3000"))
+CARACTERES_POR_TOKEN = 4
+
+_codificador = None
+
+def _get_codificador():
+    global _codificador
+    if _codificador is None and tiktoken is not None:
+        try:
+            _codificador = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _codificador = tiktoken.get_encoding("cl100k_base")
+    return _codificador
+
+def contar_tokens(texto):
+    if not texto:
+        return 0
+    codificador = _get_codificador()
+    if codificador is None:
+        return -(-len(texto) // CARACTERES_POR_TOKEN)
+    return len(codificador.encode(texto, disallowed_special=()))
+
+def truncar_tokens(texto, limite, sufixo=" […]"):
+    """Corta `texto` em até `limite` tokens, marcando o corte com `sufixo`."""
+    if not texto or contar_tokens(texto) <= limite:
+        return texto or ""
+    if limite <= 0:
+        return ""
+    codificador = _get_codificador()
+    if codificador is None:
+        return texto[:limite * CARACTERES_POR_TOKEN].rstrip() + sufixo
+    tokens = codificador.encode(texto, disallowed_special=())
+    return codificador.decode(tokens[:limite]).rstrip() + sufixo
+
+def distribuir_orcamento(tamanhos, pesos, total):
+    """
+    Divide `total` tokens entre os campos conforme `pesos`. Campos menores que
+    a sua parte ficam inteiros e a sobra é redistribuída entre os demais.
+    `tamanhos` e `pesos` são dicts {campo: tokens} e {campo: peso}; retorna {campo: limite}.
+    """
+    limites = {}
+    pendentes = {c for c in tamanhos if tamanhos[c] > 0}
+    restante = total
+    while pendentes:
+        soma_pesos = sum(pesos[c] for c in pendentes) or 1
+        cabem = {c for c in pendentes if tamanhos[c] <= restante * pesos[c] / soma_pesos}
+        if not cabem:
+            for c in pendentes:
+                limites[c] = int(restante * pesos[c] / soma_pesos)
+            break
+        for c in cabem:
+            limites[c] = tamanhos[c]
+            restante -= tamanhos[c]
+        pendentes -= cabem
+    for c in tamanhos:
+        limites.setdefault(c, 0)
+    return limites
@@ -0,0 +1,56 @@
+import os
+import json
+import base64
+import binascii
+from datetime import datetime
+
+# Tamanho de página das listagens da API (keyset pagination)
+PAGINA_PADRAO = int(os.getenv("PAGINA_PADRAO", "50"))
+PAGINA_MAX = int(os.getenv("PAGINA_MAX", "200"))
+
+class CursorInvalido(ValueError):
+    pass
+
+def codificar_cursor(momento, id_registro):
+    """Token opaco (base64url) com a chave da última linha entregue: (timestamp ou None, id)."""
+    bruto = json.dumps([momento.isoformat() if momento is not None else None, id_registro], separators=(",", ":"))
+    return base64.urlsafe_b64encode(bruto.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decodificar_cursor(token):
+    try:
+        bruto = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        momento, id_registro = json.loads(bruto)
+        return (datetime.fromisoformat(momento) if momento is not None else None), int(id_registro)
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as e:
+        raise CursorInvalido(f"Cursor inválido: {token}") from e
+
+def filtro_keyset(coluna_momento, coluna_id, cursor):
+    """
+    Condição SQL e parâmetros para continuar depois do cursor numa listagem
+    ordenada por (coluna_momento DESC, coluna_id DESC). Sem cursor, ("", []).
+
+    coluna_momento pode ser NULL: no DESC do PostgreSQL essas linhas vêm
+    primeiro (NULLS FIRST, a ordem dos índices), então um cursor com momento
+    NULL termina as NULL pelo id e depois segue para todas as demais. Com
+    momento preenchido, a comparação de linha já exclui as NULL.
+    """
+    if not cursor:
+        return "", []
+    momento, id_registro = decodificar_cursor(cursor)
+    if momento is None:
+        return (
+            f" AND (({coluna_momento} IS NULL AND {coluna_id} < %s) OR {coluna_momento} IS NOT NULL)",
+            [id_registro],
+        )
+    return f" AND ({coluna_momento}, {coluna_id}) < (%s, %s)", [momento, id_registro]
+
+def paginar(rows, limite, campo_momento, campo_id):
+    """
+    Recebe até `limite` + 1 linhas (a consulta pede uma a mais para saber se há
+    próxima página) e retorna (linhas da página, próximo cursor ou None).
+    """
+    if len(rows) <= limite:
+        return rows, None
+    rows = rows[:limite]
+    ultima = rows[-1]
+    return rows, codificar_cursor(ultima[campo_momento], ultima[campo_id])
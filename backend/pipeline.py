@@ -11,12 +11,26 @@ import re
 import logging
 from dotenv import load_dotenv
 from backend.dashboard_auth_utils import autenticar_usuario
-from backend.utils import get_conn, extrair_campos, extrair_referencias_assunto, validar_contexto_email
+from backend.utils import get_conn, extrair_campos, extrair_referencias_assunto, validar_contexto_email, buscar_anexos_emails, filtro_dia
 from backend.ia_validador import validar_formal_ia
+from backend.cache_ia import cache_validacao_ia
+from backend.extracao_textos import extrair_textos, previas
+from backend.fila_validacao import (
+    identificador_worker, reivindicar_emails, confirmar_claim, liberar_emails,
+    registrar_falha, limpar_falhas, RenovadorClaims
+)
+from backend.validacao_regras import pre_validar, CAMADA_REGRAS, CAMADA_IA
 import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 load_dotenv()
 
+# Chamadas simultâneas à IA durante a validação (1 = serial)
+IA_CONCORRENCIA = int(os.getenv("IA_CONCORRENCIA", "4"))
+# E-mails reivindicados (e gravados/commitados) por vez em cada worker
+PIPELINE_LOTE = int(os.getenv("PIPELINE_LOTE", "20"))
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -38,114 +52,283 @@ def tem_pdf(nome: str) -> bool:
     return nome.endswith(".pdf") if nome else False
 
 # --- pipeline principal com validação IA ---
-def pipeline(limite=None, data=None):
+def preparar_emails(cur, emails):
+    """Monta as entradas da validação IA do lote, com os anexos de todos os e-mails numa consulta."""
+    anexos = buscar_anexos_emails(cur, [email["id_email"] for email in emails])
+    return [preparar_email(email, anexos[email["id_email"]]) for email in emails]
+
+def preparar_email(email, anexos):
+    """Monta as entradas da validação IA de um e-mail a partir dos seus anexos (metadados)."""
+    id_email = email['id_email']
+    assunto = email.get('assunto') or ""
+    corpo = email.get('corpo_email') or ""
+
+    nomes_anexos = [a["nome_arquivo"] for a in anexos]
+    # Preenchido depois, em lote, por extracao_textos (ver pipeline)
+    textos_anexos = [""] * len(anexos)
+
+    # Usa utils para extrair campos relevantes
+    processo, opaj, identificador = extrair_campos(f"{assunto} {corpo}")
+    campos_extraidos = {
+        "processo": processo,
+        "opaj": opaj,
+        "identificador": identificador
+    }
+    return {
+        "id_email": id_email,
+        "assunto": assunto,
+        "corpo": corpo,
+        "status_captura": email.get("status_captura"),
+        "anexos": [
+            {"nome_arquivo": a["nome_arquivo"] or "", "tipo": a["tipo_arquivo"] or "",
+             "hash_conteudo": a["hash_conteudo"]} for a in anexos
+        ],
+        "nomes_anexos": nomes_anexos,
+        "textos_anexos": textos_anexos,
+        "campos_extraidos": campos_extraidos,
+    }
+
+def anexar_textos(conn, entradas):
+    """Extrai (ou reaproveita) o texto de todos os anexos do lote e monta as prévias do prompt."""
+    cur = conn.cursor()
+    textos = extrair_textos(cur, [
+        (a["hash_conteudo"], a["nome_arquivo"], a["tipo"])
+        for entrada in entradas for a in entrada["anexos"]
+    ])
+    conn.commit()
+    cur.close()
+    for entrada in entradas:
+        entrada["textos_anexos"] = previas([
+            textos.get(a["hash_conteudo"], "") for a in entrada["anexos"]
+        ])
+
+def validar_email(entrada):
+    """
+    Validação em camadas; roda nas threads do pool, sem acesso ao banco.
+    As regras determinísticas decidem os casos inequívocos e só o restante vai à IA.
+    """
+    resultado = pre_validar(entrada)
+    if resultado is not None:
+        return resultado
+    resultado = validar_formal_ia(
+        entrada["assunto"], entrada["corpo"], entrada["nomes_anexos"],
+        entrada["textos_anexos"], entrada["campos_extraidos"]
+    )
+    return {**resultado, "camada": CAMADA_IA}
+
+def gravar_resultado(cur, entrada, resultado_ia):
+    """Grava a resposta IA em 'respostas' e cria o protocolo do e-mail."""
+    id_email = entrada["id_email"]
+    campos = entrada["campos_extraidos"]
+    processo, opaj, identificador = campos["processo"], campos["opaj"], campos["identificador"]
+    nomes_anexos = entrada["nomes_anexos"]
+
+    status = "pending" if resultado_ia.get("valido") else "invalid"
+    motivo_invalido = None if resultado_ia.get("valido") else resultado_ia.get("motivo")
+    observacao = resultado_ia.get("motivo")
+    coerente = resultado_ia.get("coerencia")
+    campos_faltantes = resultado_ia.get("campos_faltantes", [])  # <-- LISTA DIRETA!
+    acao_sugerida = resultado_ia.get("acao_sugerida")
+    status_validacao = resultado_ia.get("acao_sugerida")
+    resumo_ia = resultado_ia.get("motivo")
+    camada = resultado_ia.get("camada")
+
+    # Insere/atualiza em respostas
+    cur.execute("""
+        INSERT INTO respostas (
+            id_email, tipo_resposta, processo, opaj, coerente, erros,
+            identificador, status, status_validacao, validado,
+            data_chegada, nomes_anexos, resumo_ia, observacao, camada_validacao
+        ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s, %s)
+        ON CONFLICT (id_email) DO UPDATE SET
+            tipo_resposta = EXCLUDED.tipo_resposta,
+            processo = EXCLUDED.processo,
+            opaj = EXCLUDED.opaj,
+            coerente = EXCLUDED.coerente,
+            erros = EXCLUDED.erros,
+            identificador = EXCLUDED.identificador,
+            status = EXCLUDED.status,
+            status_validacao = EXCLUDED.status_validacao,
+            validado = EXCLUDED.validado,
+            nomes_anexos = EXCLUDED.nomes_anexos,
+            resumo_ia = EXCLUDED.resumo_ia,
+            observacao = EXCLUDED.observacao,
+            camada_validacao = EXCLUDED.camada_validacao,
+            data_chegada = EXCLUDED.data_chegada
+    """, (
+        id_email, acao_sugerida, processo, opaj, coerente, campos_faltantes,
+        identificador, status, status_validacao, resultado_ia.get("valido"),
+        nomes_anexos, resumo_ia, observacao, camada
+    ))
+
+    # (Opcional: insere também em protocolos para controle/fluxo/fila)
+    cur.execute("""
+        INSERT INTO protocolos (
+            id_email, status, motivo_invalido, criado_em, ultima_atualizacao,
+            observacao, acao_usuario, hash_documento
+        ) VALUES (%s, %s, %s, NOW(), NOW(), %s, %s, %s)
+    """, (
+        id_email, status, motivo_invalido, observacao, acao_sugerida, identificador
+    ))
+
+    logger.info(f"Resposta ({camada}) salva e protocolo criado para e-mail {id_email} com status '{status}'.")
+    return status
+
+def gravar_ou_reagendar(cur, entrada, resultado_ia):
+    """
+    Grava o resultado do e-mail ou, se a IA falhou (erro de API/JSON) ou a
+    gravação deu erro, agenda nova tentativa com backoff (fila_validacao).
+    Se o e-mail já tem protocolo (índice único em protocolos.id_email, ex.:
+    gravado por outro worker ou pela ingestão de um lote), não grava nem reagenda.
+    Retorna True se o e-mail foi gravado. Não faz commit.
+    """
+    id_email = entrada["id_email"]
+    erro = resultado_ia.get("erro_ia")
+    if not erro:
+        cur.execute("SAVEPOINT gravar_email")
+        try:
+            gravar_resultado(cur, entrada, resultado_ia)
+            limpar_falhas(cur, id_email)
+            cur.execute("RELEASE SAVEPOINT gravar_email")
+            return True
+        except psycopg2.errors.UniqueViolation:
+            cur.execute("ROLLBACK TO SAVEPOINT gravar_email")
+            logger.warning(f"E-mail {id_email} já tem protocolo; resultado descartado.")
+            return False
+        except Exception as e:
+            cur.execute("ROLLBACK TO SAVEPOINT gravar_email")
+            erro = f"erro ao gravar: {e}"
+    tentativas, status = registrar_falha(cur, id_email, erro)
+    if status == "dead":
+        logger.error(f"E-mail {id_email} enviado ao dead-letter após {tentativas} tentativas: {erro}")
+    else:
+        logger.warning(f"E-mail {id_email} reagendado (tentativa {tentativas}): {erro}")
+    return False
+
+def validar_em_paralelo(entradas, concorrencia, cancelar=None, validar=None):
+    """
+    Valida as entradas com até `concorrencia` chamadas à IA em andamento
+    (limitadas também por ia_validador.limitador_ia) e devolve
+    (entrada, resultado) na MESMA ordem de `entradas`, para a gravação
+    continuar sequencial e igual à do modo serial.
+
+    Com cancelamento, nenhuma chamada nova é disparada; as que já estão
+    em andamento terminam e seus resultados são entregues. `validar`
+    substitui validar_email (ex.: teste de carga sem banco).
+    """
+    validar = validar or validar_email
+    entradas = iter(entradas)
+    with ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="validacao-ia") as executor:
+        em_andamento = deque()
+        while True:
+            while len(em_andamento) < concorrencia and not (cancelar is not None and cancelar.is_set()):
+                entrada = next(entradas, None)
+                if entrada is None:
+                    break
+                em_andamento.append((entrada, executor.submit(validar, entrada)))
+            if not em_andamento:
+                break
+            entrada, futuro = em_andamento.popleft()
+            yield entrada, futuro.result()
+
+def pipeline(limite=None, data=None, cancelar=None, concorrencia=None, tamanho_lote=None):
     """
-    1. Busca e-mails tipo 'protocolo' sem protocolo criado.
+    1. Reivindica e-mails tipo 'protocolo' sem protocolo criado (fila_validacao).
     2. Faz parsing, validação IA e salva status/resultados.
     3. Insere em 'protocolos' com status, IA, motivo e campos extras.
+
+    Trabalha em lotes de `tamanho_lote` e-mails reivindicados com SKIP LOCKED,
+    então vários processos/hosts podem rodar o pipeline ao mesmo tempo sem
+    duplicar protocolos; cada lote é gravado e liberado com um commit.
+    Um heartbeat (RenovadorClaims) renova o lease dos e-mails do lote enquanto
+    ele é processado, e cada gravação confirma que a reivindicação ainda é
+    deste worker antes de criar o protocolo.
+    As chamadas à IA rodam em paralelo (`concorrencia`, padrão IA_CONCORRENCIA);
+    a gravação no banco continua em ordem, numa única conexão.
+    `cancelar` (threading.Event) interrompe o laço entre um e-mail e outro.
     """
-    logger.info(f"Iniciando pipeline de validação de e-mails (limite={limite}, data={data})")
+    concorrencia = max(1, concorrencia or IA_CONCORRENCIA)
+    tamanho_lote = max(1, tamanho_lote or PIPELINE_LOTE)
+    worker = identificador_worker()
+    logger.info(
+        f"Iniciando pipeline de validação de e-mails (limite={limite}, data={data}, "
+        f"concorrencia={concorrencia}, worker={worker})"
+    )
     conn = get_conn()
     cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
 
-    query = """
-        SELECT e.*
-        FROM emails e
-        LEFT JOIN protocolos p ON e.id_email = p.id_email
-        WHERE p.id_email IS NULL
-        AND e.tipo_email = 'protocolo'
-    """
-    params = []
-    if data:
-        query += " AND DATE(e.recebido_em) = %s"
-        params.append(data)
-    if limite:
-        query += f" LIMIT {limite}"
-
-    cur.execute(query, tuple(params))
-    emails = cur.fetchall()
-
-    if not emails:
-        logger.info("Nenhum e-mail novo para processar.")
+    cache_antes = cache_validacao_ia.estatisticas()
+    processados = 0
+    falhas = 0
+    perdidos = 0
+    camadas = {CAMADA_REGRAS: 0, CAMADA_IA: 0}
+    try:
+        while not (cancelar is not None and cancelar.is_set()):
+            tratados = processados + falhas + perdidos
+            quantidade = min(tamanho_lote, limite - tratados) if limite else tamanho_lote
+            if quantidade <= 0:
+                break
+            emails = reivindicar_emails(cur, worker, quantidade, data)
+            conn.commit()
+            if not emails:
+                break
+            ids = [email["id_email"] for email in emails]
+            try:
+                with RenovadorClaims(worker, ids) as renovador:
+                    entradas = preparar_emails(cur, emails)
+                    anexar_textos(conn, entradas)
+                    for entrada, resultado_ia in validar_em_paralelo(entradas, concorrencia, cancelar):
+                        renovador.concluir(entrada["id_email"])
+                        # Um commit por e-mail: um erro não descarta as chamadas à IA já pagas.
+                        # A reivindicação é consumida na mesma transação da gravação.
+                        if not confirmar_claim(cur, worker, entrada["id_email"]):
+                            logger.warning(
+                                f"Reivindicação do e-mail {entrada['id_email']} expirou e foi "
+                                f"tomada por outro worker; resultado descartado."
+                            )
+                            perdidos += 1
+                        elif gravar_ou_reagendar(cur, entrada, resultado_ia):
+                            camadas[resultado_ia["camada"]] += 1
+                            processados += 1
+                        else:
+                            falhas += 1
+                        conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                # Não processados (cancelamento/erro) voltam para a fila na hora
+                liberar_emails(cur, worker, ids)
+                conn.commit()
+    finally:
         cur.close()
         conn.close()
-        return
-
-    for email in emails:
-        id_email = email['id_email']
-        assunto = email.get('assunto') or ""
-        corpo = email.get('corpo_email') or ""
-
-        # Extrai anexos
-        cur.execute("SELECT nome_arquivo, tipo_arquivo FROM anexos_email WHERE id_email = %s", (id_email,))
-        anexos = cur.fetchall()
-        nomes_anexos = [a["nome_arquivo"] for a in anexos]
-        textos_anexos = [""] * len(anexos)
-
-        # Usa utils para extrair campos relevantes
-        processo, opaj, identificador = extrair_campos(f"{assunto} {corpo}")
-        campos_extraidos = {
-            "processo": processo,
-            "opaj": opaj,
-            "identificador": identificador
-        }
-
-        # Validação formal IA
-        resultado_ia = validar_formal_ia(
-            assunto, corpo, nomes_anexos, textos_anexos, campos_extraidos
-        )
-        status = "pending" if resultado_ia.get("valido") else "invalid"
-        motivo_invalido = None if resultado_ia.get("valido") else resultado_ia.get("motivo")
-        observacao = resultado_ia.get("motivo")
-        coerente = resultado_ia.get("coerencia")
-        campos_faltantes = resultado_ia.get("campos_faltantes", [])  # <-- LISTA DIRETA!
-        acao_sugerida = resultado_ia.get("acao_sugerida")
-        status_validacao = resultado_ia.get("acao_sugerida")
-        resumo_ia = resultado_ia.get("motivo")
-
-        # Insere/atualiza em respostas
-        cur.execute("""
-            INSERT INTO respostas (
-                id_email, tipo_resposta, processo, opaj, coerente, erros,
-                identificador, status, status_validacao, validado,
-                data_chegada, nomes_anexos, resumo_ia, observacao
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW(), %s, %s, %s)
-            ON CONFLICT (id_email) DO UPDATE SET
-                tipo_resposta = EXCLUDED.tipo_resposta,
-                processo = EXCLUDED.processo,
-                opaj = EXCLUDED.opaj,
-                coerente = EXCLUDED.coerente,
-                erros = EXCLUDED.erros,
-                identificador = EXCLUDED.identificador,
-                status = EXCLUDED.status,
-                status_validacao = EXCLUDED.status_validacao,
-                validado = EXCLUDED.validado,
-                nomes_anexos = EXCLUDED.nomes_anexos,
-                resumo_ia = EXCLUDED.resumo_ia,
-                observacao = EXCLUDED.observacao,
-                data_chegada = EXCLUDED.data_chegada
-        """, (
-            id_email, acao_sugerida, processo, opaj, coerente, campos_faltantes,
-            identificador, status, status_validacao, resultado_ia.get("valido"),
-            nomes_anexos, resumo_ia, observacao
-        ))
-
-        # (Opcional: insere também em protocolos para controle/fluxo/fila)
-        cur.execute("""
-            INSERT INTO protocolos (
-                id_email, status, motivo_invalido, criado_em, ultima_atualizacao,
-                observacao, acao_usuario, hash_documento
-            ) VALUES (%s, %s, %s, NOW(), NOW(), %s, %s, %s)
-        """, (
-            id_email, status, motivo_invalido, observacao, acao_sugerida, identificador
-        ))
-
-        logger.info(f"Resposta IA salva e protocolo criado para e-mail {id_email} com status '{status}'.")
 
-    conn.commit()
-    cur.close()
-    conn.close()
-    logger.info("Pipeline finalizado.")
+    if cancelar is not None and cancelar.is_set():
+        logger.warning("Pipeline interrompido a pedido do usuário.")
+    if not processados:
+        logger.info("Nenhum e-mail novo para processar.")
+
+    cache_depois = cache_validacao_ia.estatisticas()
+    cache = {
+        "acertos": cache_depois["acertos"] - cache_antes["acertos"],
+        "faltas": cache_depois["faltas"] - cache_antes["faltas"],
+    }
+    cobertura = round(camadas[CAMADA_REGRAS] / processados, 4) if processados else None
+    logger.info(
+        f"Pipeline finalizado. Regras: {camadas[CAMADA_REGRAS]}, IA: {camadas[CAMADA_IA]}, "
+        f"falhas reagendadas: {falhas}, reivindicações perdidas: {perdidos} "
+        f"(cobertura das regras {cobertura}). Cache IA: {cache['acertos']} acertos, {cache['faltas']} faltas."
+    )
+    return {
+        "processados": processados,
+        "falhas": falhas,
+        "perdidos": perdidos,
+        "cancelado": bool(cancelar and cancelar.is_set()),
+        "camadas": camadas,
+        "cobertura_regras": cobertura,
+        "cache_ia": cache,
+    }
 
 # --- CONTROLE DE PAUSA DO PIPELINE ---
 @router.post("/pipeline/pausar")
@@ -185,15 +368,15 @@ def status_pipeline():
 # --- CAPTURA E VALIDAÇÃO IA ---
 @router.post("/captura-emails")
 def executar_captura():
-    from backend.captura_emails import capturar_emails
-    capturar_emails()
-    return {"status": "ok", "mensagem": "Captura de e-mails executada com sucesso."}
+    from backend.jobs import iniciar_captura
+    job = iniciar_captura()
+    return {"status": "iniciado", "id_job": job["id_job"], "mensagem": "Captura de e-mails iniciada."}
 
 @router.post("/validar-ia")
 def executar_validacao_ia(limite: Optional[int] = Query(None)):
-    from backend.pipeline import pipeline
-    pipeline(limite=limite)
-    return {"status": "ok", "mensagem": f"Validação IA executada com sucesso (limite={limite or 'sem limite'})"}
+    from backend.jobs import iniciar_validacao_ia
+    job = iniciar_validacao_ia(limite=limite)
+    return {"status": "iniciado", "id_job": job["id_job"], "mensagem": f"Validação IA iniciada (limite={limite or 'sem limite'})"}
 
 # --- CONTAGEM CASOS E ESTEIRA --- 
 @router.get("/painel-controle/contagem-casos")
@@ -251,20 +434,21 @@ def esteira_protocolos(
         query += " AND p.status = %s"
         params.append(status)
     if data:
-        query += " AND DATE(e.recebido_em) = %s"
-        params.append(data)
+        filtro_data, params_data = filtro_dia("e.recebido_em", data)
+        query += filtro_data
+        params += params_data
     query += " ORDER BY COALESCE(p.criado_em, e.recebido_em) DESC"
     query += f" LIMIT {limite}"
     cur.execute(query, tuple(params))
     rows = cur.fetchall()
 
-    # Buscar os anexos de cada email:
+    # Anexos de todos os e-mails da página numa consulta só
+    anexos = buscar_anexos_emails(cur, [row['id_email'] for row in rows])
     for row in rows:
-        cur.execute("""
-            SELECT id_anexo, nome_arquivo, tipo_arquivo
-            FROM anexos_email WHERE id_email = %s
-        """, (row['id_email'],))
-        row['anexos'] = cur.fetchall()
+        row['anexos'] = [
+            {"id_anexo": a["id_anexo"], "nome_arquivo": a["nome_arquivo"], "tipo_arquivo": a["tipo_arquivo"]}
+            for a in anexos[row['id_email']]
+        ]
 
     cur.close()
     conn.close()
@@ -0,0 +1,244 @@
+import os
+import time
+import logging
+import threading
+from collections import deque
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import PoolError
+
+logger = logging.getLogger(__name__)
+
+# Tamanho do pool compartilhado (API, jobs e CLIs no mesmo processo)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+# Espera máxima por uma conexão livre antes de PoolError
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Conexões ociosas há mais que isso passam por um SELECT 1 antes de serem entregues
+DB_POOL_VERIFICAR_APOS = float(os.getenv("DB_POOL_VERIFICAR_APOS", "30"))
+# Conexões mais velhas que isso são recicladas na devolução (0 = sem limite)
+DB_POOL_VIDA_MAXIMA = float(os.getenv("DB_POOL_VIDA_MAXIMA", "1800"))
+
+class ConexaoPool:
+    """
+    Conexão emprestada do pool. Repassa tudo para a conexão psycopg2, mas
+    `close()` devolve ao pool em vez de fechar. Como gerenciador de contexto,
+    faz commit (ou rollback, se houve exceção) e devolve ao sair:
+
+        with get_conn() as conn:
+            ...
+
+    O código que faz `conn = get_conn()` ... `conn.close()` continua valendo;
+    se a conexão for perdida sem close (exceção no meio), ela volta ao pool
+    quando o objeto é coletado.
+    """
+
+    def __init__(self, pool, conexao):
+        self._pool = pool
+        self._conexao = conexao
+
+    def __getattr__(self, nome):
+        conexao = self.__dict__.get("_conexao")
+        if conexao is None:
+            raise psycopg2.InterfaceError("conexão já devolvida ao pool")
+        return getattr(conexao, nome)
+
+    @property
+    def closed(self):
+        return 1 if self._conexao is None else self._conexao.closed
+
+    def close(self):
+        conexao, self._conexao = self._conexao, None
+        if conexao is not None:
+            self._pool.devolver(conexao)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, tb):
+        try:
+            if self._conexao is not None and not self._conexao.closed:
+                if tipo is None:
+                    self._conexao.commit()
+                else:
+                    self._conexao.rollback()
+        finally:
+            self.close()
+
+    def __del__(self):
+        if self.__dict__.get("_conexao") is not None:
+            try:
+                logger.warning("Conexão do pool não devolvida; recuperada na coleta")
+                self.close()
+            except Exception:
+                pass
+
+class PoolConexoes:
+    """
+    Pool de conexões psycopg2 seguro para threads. Diferente do
+    ThreadedConnectionPool, espera (até `timeout`) por uma conexão livre em vez
+    de falhar na hora, verifica conexões ociosas antes de entregá-las e mede
+    tempo de espera e conexões em uso (ver `metricas`).
+    """
+
+    def __init__(self, fabrica, minimo=None, maximo=None, timeout=None,
+                 verificar_apos=None, vida_maxima=None):
+        self.fabrica = fabrica
+        self.minimo = DB_POOL_MIN if minimo is None else minimo
+        self.maximo = max(1, DB_POOL_MAX if maximo is None else maximo)
+        self.timeout = DB_POOL_TIMEOUT if timeout is None else timeout
+        self.verificar_apos = DB_POOL_VERIFICAR_APOS if verificar_apos is None else verificar_apos
+        self.vida_maxima = DB_POOL_VIDA_MAXIMA if vida_maxima is None else vida_maxima
+        self._cond = threading.Condition()
+        self._ociosas = deque()  # (conexao, devolvida_em)
+        self._criadas_em = {}  # id(conexao) -> instante de abertura
+        self._em_uso = 0
+        self._aguardando = 0
+        self._fechado = False
+        self._stats = {
+            "emprestimos": 0,
+            "criadas": 0,
+            "descartadas": 0,
+            "falhas_verificacao": 0,
+            "timeouts": 0,
+            "espera_total_s": 0.0,
+            "espera_max_s": 0.0,
+            "pico_em_uso": 0,
+        }
+        for _ in range(min(self.minimo, self.maximo)):
+            conexao = self._abrir()
+            self._ociosas.append((conexao, time.monotonic()))
+
+    def _abertas(self):
+        return self._em_uso + len(self._ociosas)
+
+    def _abrir(self):
+        conexao = self.fabrica()
+        self._criadas_em[id(conexao)] = time.monotonic()
+        self._stats["criadas"] += 1
+        return conexao
+
+    def _descartar(self, conexao):
+        self._criadas_em.pop(id(conexao), None)
+        self._stats["descartadas"] += 1
+        try:
+            conexao.close()
+        except Exception:
+            pass
+
+    def _saudavel(self, conexao, ociosa_desde):
+        if conexao.closed:
+            return False
+        if time.monotonic() - ociosa_desde < self.verificar_apos:
+            return True
+        try:
+            with conexao.cursor() as cur:
+                cur.execute("SELECT 1")
+            conexao.rollback()
+            return True
+        except psycopg2.Error:
+            self._stats["falhas_verificacao"] += 1
+            return False
+
+    def obter(self):
+        """Empresta uma conexão (ConexaoPool), esperando até `timeout` segundos."""
+        inicio = time.monotonic()
+        with self._cond:
+            if self._fechado:
+                raise PoolError("pool de conexões fechado")
+            self._aguardando += 1
+            try:
+                while not self._ociosas and self._abertas() >= self.maximo:
+                    restante = self.timeout - (time.monotonic() - inicio)
+                    if restante <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolError(f"nenhuma conexão livre em {self.timeout:g}s (máximo {self.maximo})")
+                    self._cond.wait(restante)
+                    if self._fechado:
+                        raise PoolError("pool de conexões fechado")
+            finally:
+                self._aguardando -= 1
+            item = self._ociosas.pop() if self._ociosas else None
+            self._em_uso += 1
+
+        # A verificação e a abertura rodam fora do lock; a vaga já está reservada em _em_uso
+        try:
+            conexao = None
+            if item is not None:
+                conexao, ociosa_desde = item
+                if not self._saudavel(conexao, ociosa_desde):
+                    with self._cond:
+                        self._descartar(conexao)
+                    conexao = None
+            if conexao is None:
+                conexao = self.fabrica()
+                with self._cond:
+                    self._criadas_em[id(conexao)] = time.monotonic()
+                    self._stats["criadas"] += 1
+        except Exception:
+            with self._cond:
+                self._em_uso -= 1
+                self._cond.notify()
+            raise
+
+        espera = time.monotonic() - inicio
+        with self._cond:
+            self._stats["emprestimos"] += 1
+            self._stats["espera_total_s"] += espera
+            self._stats["espera_max_s"] = max(self._stats["espera_max_s"], espera)
+            self._stats["pico_em_uso"] = max(self._stats["pico_em_uso"], self._em_uso)
+        return ConexaoPool(self, conexao)
+
+    def devolver(self, conexao):
+        """
+        Recebe a conexão de volta: desfaz transação pendente e restaura o
+        autocommit. Conexões quebradas, velhas demais (vida_maxima) ou devolvidas
+        depois do pool fechado são descartadas.
+        """
+        reaproveitar = not conexao.closed and not self._fechado
+        if reaproveitar:
+            try:
+                status = conexao.info.transaction_status
+                if status == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+                    reaproveitar = False
+                elif status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conexao.rollback()
+                if reaproveitar and conexao.autocommit:
+                    conexao.autocommit = False
+            except psycopg2.Error:
+                reaproveitar = False
+        with self._cond:
+            self._em_uso -= 1
+            criada_em = self._criadas_em.get(id(conexao), 0)
+            if reaproveitar and self.vida_maxima and time.monotonic() - criada_em > self.vida_maxima:
+                reaproveitar = False
+            if reaproveitar:
+                self._ociosas.append((conexao, time.monotonic()))
+            else:
+                self._descartar(conexao)
+            self._cond.notify()
+
+    def fechar(self):
+        """Fecha as conexões ociosas; as emprestadas são fechadas ao voltar."""
+        with self._cond:
+            self._fechado = True
+            while self._ociosas:
+                self._descartar(self._ociosas.popleft()[0])
+            self._cond.notify_all()
+
+    def metricas(self):
+        with self._cond:
+            stats = dict(self._stats)
+            emprestimos = stats["emprestimos"]
+            stats.update({
+                "minimo": self.minimo,
+                "maximo": self.maximo,
+                "abertas": self._abertas(),
+                "em_uso": self._em_uso,
+                "ociosas": len(self._ociosas),
+                "aguardando": self._aguardando,
+                "espera_media_ms": round(stats["espera_total_s"] / emprestimos * 1000, 2) if emprestimos else 0.0,
+                "espera_max_ms": round(stats.pop("espera_max_s") * 1000, 2),
+            })
+            stats["espera_total_s"] = round(stats["espera_total_s"], 3)
+            return stats
@@ -0,0 +1,93 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+from datetime import datetime
+
+# Intervalo mínimo (s) entre atualizações enviadas aos clientes SSE
+PROGRESSO_INTERVALO = float(os.getenv("PROGRESSO_INTERVALO", "0.5"))
+# Quantidade de eventos de log mantidos em memória por serviço
+PROGRESSO_MAX_EVENTOS = int(os.getenv("PROGRESSO_MAX_EVENTOS", "500"))
+HEARTBEAT_SEGUNDOS = 15
+
+class ServicoProgresso:
+    """
+    Estado de progresso e log de eventos de uma rotina, mantido em memória.
+    Substitui os arquivos progress_captura.json / log_captura_tmp.json: a rotina
+    só altera o estado e os clientes recebem as mudanças por SSE, com taxa limitada.
+    """
+
+    def __init__(self, nome):
+        self.nome = nome
+        self._lock = threading.Lock()
+        self._versao = 0
+        self._seq = 0
+        self._estado = {"total": 0, "atual": 0, "finalizado": False, "status": "ocioso"}
+        self._eventos = deque(maxlen=PROGRESSO_MAX_EVENTOS)
+
+    def iniciar(self, total=0):
+        with self._lock:
+            self._eventos.clear()
+            self._estado = {"total": total, "atual": 0, "finalizado": False, "status": "em_andamento"}
+            self._versao += 1
+
+    def atualizar(self, total=None, atual=None):
+        with self._lock:
+            if total is not None:
+                self._estado["total"] = total
+            if atual is not None:
+                self._estado["atual"] = atual
+            self._versao += 1
+
+    def registrar_evento(self, mensagem, tipo="INFO"):
+        with self._lock:
+            self._seq += 1
+            self._eventos.append({
+                "seq": self._seq,
+                "tipo": tipo,
+                "mensagem": mensagem,
+                "timestamp": datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            })
+            self._versao += 1
+
+    def finalizar(self, status="finalizado"):
+        with self._lock:
+            self._estado["finalizado"] = True
+            self._estado["status"] = status
+            self._versao += 1
+
+    def instantaneo(self, desde_seq=None):
+        with self._lock:
+            dados = dict(self._estado)
+            if desde_seq is not None:
+                dados["eventos"] = [e for e in self._eventos if e["seq"] > desde_seq]
+            return dados, self._versao
+
+    async def fluxo_sse(self, request=None, intervalo=None):
+        """
+        Gerador assíncrono de Server-Sent Events. Envia o estado e os eventos
+        novos sempre que algo muda, no máximo uma vez a cada `intervalo` segundos,
+        até o cliente desconectar (as execuções seguintes usam o mesmo fluxo).
+        """
+        intervalo = intervalo or PROGRESSO_INTERVALO
+        versao_enviada = None
+        ultimo_seq = 0
+        ultimo_envio = time.monotonic()
+        while True:
+            if request is not None and await request.is_disconnected():
+                break
+            dados, versao = self.instantaneo(desde_seq=ultimo_seq)
+            if versao != versao_enviada:
+                if dados["eventos"]:
+                    ultimo_seq = dados["eventos"][-1]["seq"]
+                versao_enviada = versao
+                ultimo_envio = time.monotonic()
+                yield f"event: progresso\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+            elif time.monotonic() - ultimo_envio > HEARTBEAT_SEGUNDOS:
+                ultimo_envio = time.monotonic()
+                yield ": heartbeat\n\n"
+            await asyncio.sleep(intervalo)
+
+progresso_captura = ServicoProgresso("captura")
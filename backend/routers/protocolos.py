@@ -1,9 +1,7 @@
 # backend/routers/protocolos.py
 
-from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query
-from fastapi.responses import StreamingResponse, JSONResponse
-import psycopg2
-import psycopg2.extras
+from fastapi import APIRouter, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 import os
 from datetime import datetime, date
 from typing import Optional
@@ -13,7 +11,16 @@ import re
 import logging
 from dotenv import load_dotenv
 from backend.dashboard_auth_utils import autenticar_usuario
-from backend.utils import get_conn
+from starlette.concurrency import run_in_threadpool
+from backend.utils import metricas_pool, SQL_ANEXOS_EMAILS, agrupar_anexos, filtro_periodo
+from backend.banco_async import conexao_async, buscar_todos, buscar_um, executar, metricas_pool_async
+from backend.armazenamento_anexos import get_armazenamento
+from backend.progresso import progresso_captura
+from backend.paginacao import PAGINA_PADRAO, PAGINA_MAX, CursorInvalido, filtro_keyset, paginar
+from backend.cache_ia import cache_validacao_ia
+from backend.jobs import (
+    gerenciador_jobs, iniciar_captura, iniciar_retomada_captura, iniciar_validacao_ia, JobEmExecucao
+)
 
 load_dotenv()
 
@@ -31,27 +38,76 @@ def extrair_opaj(texto: str) -> str:
     match = re.search(r"\b\d{7}\b", texto)
     return match.group(0) if match else ""
 
-def tem_zip(nome: str) -> bool:
-    return nome.endswith(".zip") if nome else False
+# Anexos do protocolo agregados numa linha só (metadados, sem o bytea), com tem_zip/tem_pdf
+LATERAL_ANEXOS = """
+    CROSS JOIN LATERAL (
+        SELECT
+            COALESCE(
+                json_agg(json_build_object(
+                    'id_anexo', a.id_anexo, 'nome_arquivo', a.nome_arquivo, 'tipo_arquivo', a.tipo_arquivo
+                ) ORDER BY a.id_anexo),
+                '[]'::json
+            ) AS anexos,
+            COALESCE(bool_or(LOWER(a.nome_arquivo) LIKE '%%.zip'), FALSE) AS tem_zip,
+            COALESCE(bool_or(LOWER(a.nome_arquivo) LIKE '%%.pdf'), FALSE) AS tem_pdf
+        FROM anexos_email a
+        WHERE a.id_email = p.id_email
+    ) ax
+"""
 
-def tem_pdf(nome: str) -> bool:
-    return nome.endswith(".pdf") if nome else False
+def _filtro_cursor(coluna_momento, coluna_id, cursor):
+    try:
+        return filtro_keyset(coluna_momento, coluna_id, cursor)
+    except CursorInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _filtro_periodo(coluna, inicio=None, fim=None):
+    try:
+        return filtro_periodo(coluna, inicio, fim)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Data inválida (use AAAA-MM-DD)")
 
 # --- LISTAGEM PRINCIPAL DE PROTOCOLOS (NOVA BASE: TABELA PROTOCOLOS) ---
 
 @router.get("/protocolos")
-def listar_protocolos(
+async def listar_protocolos(
     data: str = Query(None),
     status: str = Query(None),
     tipo_email: str = Query("protocolo"),
-    limite: int = Query(200)
+    limite: int = Query(PAGINA_PADRAO, ge=1, le=PAGINA_MAX),
+    cursor: str = Query(None)
 ):
     """
     Listagem principal, puxando protocolos, status, dados do e-mail, anexos etc.
+    Paginada por (criado_em, id_protocolo): a página vem com `proximo_cursor`,
+    que é passado em `cursor` para buscar a seguinte (None na última página).
     """
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    query = """
+    # Uma linha por protocolo: a página é recortada na CTE e só então os anexos
+    # são agregados (LATERAL), então o custo acompanha os protocolos da página
+    filtros = ""
+    params = []
+    if tipo_email:
+        filtros += " AND e.tipo_email = %s"
+        params.append(tipo_email)
+    if status:
+        filtros += " AND p.status = %s"
+        params.append(status)
+    filtro_data, params_data = _filtro_periodo("e.recebido_em", data, data)
+    filtros += filtro_data
+    params += params_data
+    filtro_cursor, params_cursor = _filtro_cursor("p.criado_em", "p.id_protocolo", cursor)
+    filtros += filtro_cursor
+    params += params_cursor
+    params.append(limite + 1)
+    query = f"""
+        WITH pagina AS (
+            SELECT p.id_protocolo
+            FROM protocolos p
+            JOIN emails e ON e.id_email = p.id_email
+            WHERE TRUE {filtros}
+            ORDER BY p.criado_em DESC, p.id_protocolo DESC
+            LIMIT %s
+        )
         SELECT 
             p.id_protocolo, p.id_email, p.id_resposta, p.status, p.acao_usuario,
             p.hash_documento, p.hash_email, p.observacao, p.motivo_invalido,
@@ -59,51 +115,37 @@ def listar_protocolos(
             e.assunto, e.remetente, e.recebido_em, e.corpo_email, e.tipo_email,
             r.tipo_resposta, r.processo, r.opaj, r.status_final,
             r.acao_sugerida, r.status_validacao, r.motivo_invalido,
-            a.id_anexo, a.nome_arquivo, a.tipo_arquivo
-        FROM protocolos p
+            ax.anexos, ax.tem_zip, ax.tem_pdf
+        FROM pagina
+        JOIN protocolos p ON p.id_protocolo = pagina.id_protocolo
         JOIN emails e ON e.id_email = p.id_email
         LEFT JOIN respostas r ON r.id_resposta = p.id_resposta
-        LEFT JOIN anexos_email a ON a.id_email = p.id_email
-        WHERE TRUE
+        {LATERAL_ANEXOS}
+        ORDER BY p.criado_em DESC, p.id_protocolo DESC
     """
-    params = []
-    if tipo_email:
-        query += " AND e.tipo_email = %s"
-        params.append(tipo_email)
-    if status:
-        query += " AND p.status = %s"
-        params.append(status)
-    if data:
-        query += " AND DATE(e.recebido_em) = %s"
-        params.append(data)
-    query += " ORDER BY p.criado_em DESC"
-    query += f" LIMIT {limite}"
 
     try:
-        cur.execute(query, tuple(params))
-        resultados = []
-        for row in cur.fetchall():
-            row["tem_zip"] = tem_zip(row["nome_arquivo"] or "")
-            row["tem_pdf"] = tem_pdf(row["nome_arquivo"] or "")
-            resultados.append(row)
+        rows = await buscar_todos(query, tuple(params))
+        resultados, proximo_cursor = paginar(rows, limite, "criado_em", "id_protocolo")
         logger.info("Lista de protocolos retornada com sucesso")
-        return {"protocolos": resultados}
+        return {"protocolos": resultados, "proximo_cursor": proximo_cursor, "limite": limite}
     except Exception as e:
         logger.error(f"Erro ao consultar protocolos: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Erro ao consultar protocolos: {str(e)}")
-    finally:
-        cur.close()
-        conn.close()
 
 
 # --- LISTAR SÓ PROTOCOLOS DE COMUNICAÇÕES / CANCELAMENTOS ---
 @router.get("/comunicacoes")
-def listar_comunicacoes(data: str = Query(None), tipo: str = Query(None)):
+async def listar_comunicacoes(
+    data: str = Query(None),
+    tipo: str = Query(None),
+    limite: int = Query(PAGINA_PADRAO, ge=1, le=PAGINA_MAX),
+    cursor: str = Query(None)
+):
     """
-    Lista comunicações e cancelamentos (tipo_email <> protocolo)
+    Lista comunicações e cancelamentos (tipo_email <> protocolo), paginada
+    por (recebido_em, id_email) com `cursor`/`proximo_cursor`.
     """
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     query = """
         SELECT e.id_email, e.assunto, e.remetente, e.recebido_em, e.tipo_email, e.corpo_email
         FROM emails e
@@ -113,33 +155,34 @@ def listar_comunicacoes(data: str = Query(None), tipo: str = Query(None)):
     if tipo:
         query += " AND e.tipo_email = %s"
         params.append(tipo)
-    if data:
-        query += " AND DATE(e.recebido_em) = %s"
-        params.append(data)
-    query += " ORDER BY e.recebido_em DESC LIMIT 200"
-    cur.execute(query, tuple(params))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return {"comunicacoes": rows}
+    filtro_data, params_data = _filtro_periodo("e.recebido_em", data, data)
+    query += filtro_data
+    params += params_data
+    filtro_cursor, params_cursor = _filtro_cursor("e.recebido_em", "e.id_email", cursor)
+    query += filtro_cursor + " ORDER BY e.recebido_em DESC, e.id_email DESC LIMIT %s"
+    params += params_cursor + [limite + 1]
+    rows, proximo_cursor = paginar(await buscar_todos(query, tuple(params)), limite, "recebido_em", "id_email")
+    return {"comunicacoes": rows, "proximo_cursor": proximo_cursor, "limite": limite}
 
 # --- DETALHE DO PROTOCOLO ---
 @router.get("/protocolos/{id_protocolo}")
-def detalhe_protocolo(id_protocolo: int):
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
-    cur.execute("""
-        SELECT p.*, e.assunto, e.remetente, e.corpo_email, e.recebido_em, r.*, a.*
+async def detalhe_protocolo(id_protocolo: int):
+    # Colunas de respostas listadas uma a uma: as homônimas de protocolos ganham alias
+    # para não sobrescrever as do protocolo (nem virar NULL quando não há resposta)
+    row = await buscar_um(f"""
+        SELECT p.*, e.assunto, e.remetente, e.corpo_email, e.recebido_em,
+               r.tipo_resposta, r.processo, r.opaj, r.identificador, r.coerente, r.erros,
+               r.status_validacao, r.validado, r.data_chegada, r.nomes_anexos, r.resumo_ia,
+               r.status_final, r.acao_sugerida, r.camada_validacao,
+               r.status AS status_resposta, r.observacao AS observacao_resposta,
+               r.motivo_invalido AS motivo_invalido_resposta,
+               ax.anexos, ax.tem_zip, ax.tem_pdf
         FROM protocolos p
         JOIN emails e ON e.id_email = p.id_email
         LEFT JOIN respostas r ON r.id_resposta = p.id_resposta
-        LEFT JOIN anexos_email a ON a.id_email = p.id_email
+        {LATERAL_ANEXOS}
         WHERE p.id_protocolo = %s
-        LIMIT 1
     """, (id_protocolo,))
-    row = cur.fetchone()
-    cur.close()
-    conn.close()
     if not row:
         raise HTTPException(status_code=404, detail="Protocolo não encontrado")
     return row
@@ -152,10 +195,8 @@ async def upload_recibo(
     file: UploadFile = File(...),
     observacao: str = Form("")
 ):
-    conn = get_conn()
-    cur = conn.cursor()
     contents = await file.read()
-    cur.execute("""
+    await executar("""
         UPDATE protocolos
         SET acao_usuario='protocolado', usuario_protocolo=%s, protocolado_em=NOW(),
             recibo_protocolo=%s, observacao=%s
@@ -163,9 +204,6 @@ async def upload_recibo(
     """, (
         usuario, file.filename, observacao, id_protocolo
     ))
-    conn.commit()
-    cur.close()
-    conn.close()
     return {"message": "Recibo protocolado com sucesso."}
 
 # --- REPORTAR DIVERGÊNCIA ---
@@ -176,51 +214,144 @@ async def registrar_divergencia(
     motivo_manual: str = Form(...),
     observacao: str = Form("")
 ):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
+    await executar("""
         INSERT INTO divergencias (id_protocolo, usuario, motivo_manual, observacao, data_registro)
         VALUES (%s, %s, %s, %s, NOW())
     """, (id_protocolo, usuario, motivo_manual, observacao))
-    conn.commit()
-    cur.close()
-    conn.close()
     return {"message": "Divergência registrada com sucesso"}
 
 # --- DOWNLOAD DE ANEXO ---
+# Bytes lidos do bytea por consulta (anexos ainda não migrados para o armazenamento)
+DOWNLOAD_BLOCO_BYTEA = 256 * 1024
+
+class RangeInvalido(Exception):
+    pass
+
+def _intervalo_range(cabecalho, tamanho):
+    """
+    Interpreta `Range: bytes=...` e retorna (inicio, fim) inclusivo, ou None para
+    servir o arquivo inteiro (sem Range, outra unidade ou vários intervalos).
+    RangeInvalido quando o intervalo não cabe no arquivo (416).
+    """
+    if not cabecalho or not cabecalho.startswith("bytes=") or "," in cabecalho:
+        return None
+    inicio_txt, _, fim_txt = cabecalho[len("bytes="):].strip().partition("-")
+    try:
+        if inicio_txt:
+            inicio = int(inicio_txt)
+            fim = int(fim_txt) if fim_txt else tamanho - 1
+        else:
+            sufixo = int(fim_txt)  # bytes=-N: os últimos N bytes
+            if sufixo <= 0:
+                raise RangeInvalido(cabecalho)
+            inicio, fim = max(0, tamanho - sufixo), tamanho - 1
+    except ValueError:
+        return None
+    if inicio >= tamanho or fim < inicio:
+        raise RangeInvalido(cabecalho)
+    return inicio, min(fim, tamanho - 1)
+
+def _etag_corresponde(cabecalho, etag):
+    if not cabecalho:
+        return False
+    if cabecalho.strip() == "*":
+        return True
+    # Comparação fraca (If-None-Match): ignora o prefixo W/
+    return etag.removeprefix("W/") in {t.strip().removeprefix("W/") for t in cabecalho.split(",")}
+
+async def _ler_bytea_em_blocos(id_anexo, inicio, fim):
+    """Lê o bytea legado por fatias (substring), uma consulta curta por bloco."""
+    posicao = inicio
+    while posicao <= fim:
+        quantidade = min(DOWNLOAD_BLOCO_BYTEA, fim - posicao + 1)
+        row = await buscar_um(
+            "SELECT substring(conteudo FROM %s FOR %s) AS bloco FROM anexos_email WHERE id_anexo = %s",
+            (posicao + 1, quantidade, id_anexo)
+        )
+        bloco = row and row["bloco"]
+        if not bloco:
+            break
+        yield bytes(bloco)
+        posicao += len(bloco)
+
 @router.get("/anexos/{id_anexo}/download")
-def download_anexo_publico(id_anexo: int):
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.DictCursor)
-    cur.execute("""
-        SELECT nome_arquivo, tipo_arquivo, conteudo
+async def download_anexo_publico(id_anexo: int, request: Request):
+    """
+    Download em streaming, sem carregar o anexo inteiro em memória. Suporta
+    Range (206/416), ETag pelo hash do conteúdo com If-None-Match (304) e
+    If-Range, e sempre informa Content-Length.
+    """
+    # O bytea nunca é lido aqui: só o tamanho, para anexos ainda não migrados
+    resultado = await buscar_um("""
+        SELECT nome_arquivo, tipo_arquivo, hash_conteudo, tamanho,
+               CASE WHEN hash_conteudo IS NULL THEN octet_length(conteudo) END AS tamanho_bytea
         FROM anexos_email
         WHERE id_anexo = %s
     """, (id_anexo,))
-    resultado = cur.fetchone()
-    cur.close()
-    conn.close()
     if not resultado:
         raise HTTPException(status_code=404, detail="Anexo não encontrado")
     nome_arquivo = resultado["nome_arquivo"]
     tipo_arquivo = resultado["tipo_arquivo"] or "application/octet-stream"
-    conteudo = resultado["conteudo"]
-    if not conteudo:
-        raise HTTPException(status_code=404, detail="Conteúdo do anexo está vazio")
-    return StreamingResponse(io.BytesIO(conteudo), media_type=tipo_arquivo, headers={
-        "Content-Disposition": f'attachment; filename="{nome_arquivo}"'
-    })
+    hash_conteudo = resultado["hash_conteudo"]
+    armazenamento = get_armazenamento()
+    if hash_conteudo:
+        if not await run_in_threadpool(armazenamento.existe, hash_conteudo):
+            raise HTTPException(status_code=404, detail="Conteúdo do anexo não encontrado no armazenamento")
+        tamanho = await run_in_threadpool(armazenamento.tamanho, hash_conteudo)
+        etag = f'"{hash_conteudo}"'
+    else:
+        tamanho = resultado["tamanho_bytea"]
+        if not tamanho:
+            raise HTTPException(status_code=404, detail="Conteúdo do anexo está vazio")
+        # Sem hash ainda: ETag fraco pelo id + tamanho (o anexo não muda depois de capturado)
+        etag = f'W/"bytea-{id_anexo}-{tamanho}"'
+
+    headers = {
+        "Content-Disposition": f'attachment; filename="{nome_arquivo}"',
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+    }
+    if _etag_corresponde(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    intervalo = None
+    if_range = request.headers.get("if-range")
+    # If-Range só vale com ETag forte: se o conteúdo mudou, manda o arquivo inteiro
+    if not if_range or (if_range.strip() == etag and not etag.startswith("W/")):
+        try:
+            intervalo = _intervalo_range(request.headers.get("range"), tamanho)
+        except RangeInvalido:
+            return Response(status_code=416, headers={"Content-Range": f"bytes */{tamanho}", "ETag": etag})
+    inicio, fim = intervalo or (0, tamanho - 1)
+    headers["Content-Length"] = str(fim - inicio + 1)
+    status_http = 200
+    if intervalo:
+        status_http = 206
+        headers["Content-Range"] = f"bytes {inicio}-{fim}/{tamanho}"
+
+    if hash_conteudo:
+        blocos = armazenamento.ler_em_blocos(hash_conteudo, inicio=inicio, fim=fim)
+    else:
+        blocos = _ler_bytea_em_blocos(id_anexo, inicio, fim)
+    return StreamingResponse(blocos, status_code=status_http, media_type=tipo_arquivo, headers=headers)
 
 # --- RELATÓRIO EM EXCEL ---
+def _planilha_protocolos(rows):
+    df = pd.DataFrame(rows)
+    stream = io.BytesIO()
+    with pd.ExcelWriter(stream, engine="xlsxwriter") as writer:
+        df.to_excel(writer, sheet_name="Protocolos", index=False)
+        writer.sheets["Protocolos"].autofilter(0, 0, len(df), len(df.columns) - 1)
+    stream.seek(0)
+    return stream
+
 @router.get("/protocolos/relatorio")
-def gerar_relatorio_protocolos(
+async def gerar_relatorio_protocolos(
     data_inicio: str = Query(None),
     data_fim: str = Query(None),
     status: str = Query(None),
     tipo_email: str = Query("protocolo"),
 ):
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
     query = """
         SELECT
             p.*, e.assunto, e.remetente, e.recebido_em, e.tipo_email, r.tipo_resposta, r.processo, r.opaj
@@ -236,86 +367,122 @@ def gerar_relatorio_protocolos(
     if status:
         query += " AND p.status = %s"
         params.append(status)
-    if data_inicio:
-        query += " AND e.recebido_em::date >= %s"
-        params.append(data_inicio)
-    if data_fim:
-        query += " AND e.recebido_em::date <= %s"
-        params.append(data_fim)
+    filtro_data, params_data = _filtro_periodo("e.recebido_em", data_inicio, data_fim)
+    query += filtro_data
+    params += params_data
     query += " ORDER BY p.criado_em DESC"
-    cur.execute(query, tuple(params))
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
+    rows = await buscar_todos(query, tuple(params))
     if not rows:
         raise HTTPException(status_code=400, detail="Nenhum protocolo encontrado.")
-    df = pd.DataFrame(rows)
-    stream = io.BytesIO()
-    with pd.ExcelWriter(stream, engine="xlsxwriter") as writer:
-        df.to_excel(writer, sheet_name="Protocolos", index=False)
-        writer.sheets["Protocolos"].autofilter(0, 0, len(df), len(df.columns) - 1)
-    stream.seek(0)
+    # A montagem da planilha é CPU-bound: roda fora do event loop
+    stream = await run_in_threadpool(_planilha_protocolos, rows)
     return StreamingResponse(stream, media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
                             headers={"Content-Disposition": "attachment; filename=protocolos.xlsx"})
 
 # --- CONTROLE DE PAUSA DO PIPELINE (SEM ALTERAÇÃO) ---
 @router.post("/pipeline/pausar")
-def pausar_pipeline():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("""
+async def pausar_pipeline():
+    await executar("""
         INSERT INTO controle_pipeline (chave, valor)
         VALUES ('pausar_pipeline', 'true')
         ON CONFLICT (chave) DO UPDATE SET valor = 'true'
     """)
-    conn.commit()
-    cur.close()
-    conn.close()
     return {"mensagem": "⛔ Pipeline pausado com sucesso."}
 
 @router.post("/pipeline/retomar")
-def retomar_pipeline():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE controle_pipeline SET valor = 'false' WHERE chave = 'pausar_pipeline'")
-    conn.commit()
-    cur.close()
-    conn.close()
+async def retomar_pipeline():
+    await executar("UPDATE controle_pipeline SET valor = 'false' WHERE chave = 'pausar_pipeline'")
     return {"mensagem": "✅ Pipeline retomado com sucesso."}
 
 @router.get("/pipeline/status")
-def status_pipeline():
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT valor FROM controle_pipeline WHERE chave = 'pausar_pipeline'")
-    valor = cur.fetchone()
-    cur.close()
-    conn.close()
-    return {"pausado": (valor and valor[0] == "true")}
-
-# --- CAPTURA E VALIDAÇÃO IA (SEM ALTERAÇÃO) ---
-@router.post("/captura-emails")
+async def status_pipeline():
+    valor = await buscar_um("SELECT valor FROM controle_pipeline WHERE chave = 'pausar_pipeline'")
+    return {"pausado": bool(valor and valor["valor"] == "true")}
+
+# --- CAPTURA E VALIDAÇÃO IA (JOBS EM SEGUNDO PLANO) ---
+def _job_em_execucao(e: JobEmExecucao):
+    return JSONResponse(status_code=409, content={
+        "status": "em_execucao", "id_job": e.id_job, "mensagem": str(e)
+    })
+
+@router.post("/captura-emails", status_code=202)
 def executar_captura():
-    from backend.captura_emails import capturar_emails
-    capturar_emails()
-    return {"status": "ok", "mensagem": "Captura de e-mails executada com sucesso."}
+    try:
+        job = iniciar_captura()
+    except JobEmExecucao as e:
+        return _job_em_execucao(e)
+    return {"status": "iniciado", "id_job": job["id_job"], "mensagem": "Captura de e-mails iniciada."}
+
+@router.post("/captura-emails/retomar", status_code=202)
+def retomar_captura_emails():
+    try:
+        job = iniciar_retomada_captura()
+    except JobEmExecucao as e:
+        return _job_em_execucao(e)
+    return {"status": "iniciado", "id_job": job["id_job"], "mensagem": "Retomada da última captura iniciada."}
+
+@router.post("/validar-ia", status_code=202)
+def executar_validacao_ia(
+    limite: Optional[int] = Query(None),
+    data: Optional[str] = Query(None),
+    concorrencia: Optional[int] = Query(None, ge=1, le=32)
+):
+    try:
+        job = iniciar_validacao_ia(limite=limite, data=data, concorrencia=concorrencia)
+    except JobEmExecucao as e:
+        return _job_em_execucao(e)
+    return {"status": "iniciado", "id_job": job["id_job"], "mensagem": f"Validação IA iniciada (limite={limite or 'sem limite'})"}
+
+@router.get("/validar-ia/cache")
+def estatisticas_cache_ia():
+    return cache_validacao_ia.estatisticas()
+
+@router.get("/validar-ia/dead-letter")
+async def listar_dead_letter(limite: int = Query(100, le=1000)):
+    emails = await buscar_todos(
+        "SELECT * FROM validacao_dead_letter ORDER BY atualizado_em DESC LIMIT %s", (limite,)
+    )
+    return {"emails": emails}
+
+@router.post("/validar-ia/dead-letter/{id_email}/reprocessar")
+async def reprocessar_dead_letter(id_email: int):
+    removido = await executar(
+        "DELETE FROM tentativas_validacao WHERE id_email = %s AND status = 'dead'", (id_email,)
+    )
+    if not removido:
+        raise HTTPException(status_code=404, detail="E-mail não está no dead-letter")
+    return {"status": "reenfileirado", "id_email": id_email}
 
-@router.post("/validar-ia")
-def executar_validacao_ia(limite: Optional[int] = Query(None)):
-    from backend.pipeline import pipeline
-    pipeline(limite=limite)
-    return {"status": "ok", "mensagem": f"Validação IA executada com sucesso (limite={limite or 'sem limite'})"}
+@router.get("/banco/pool")
+def estatisticas_pool_banco():
+    return {"api": metricas_pool_async(), "jobs": metricas_pool()}
+
+@router.get("/jobs")
+def historico_jobs(tipo: str = Query(None), limite: int = Query(20, le=200)):
+    return {"jobs": gerenciador_jobs.historico(tipo=tipo, limite=limite)}
+
+@router.get("/jobs/{id_job}")
+def status_job(id_job: str):
+    job = gerenciador_jobs.status(id_job)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@router.post("/jobs/{id_job}/cancelar")
+def cancelar_job(id_job: str):
+    job = gerenciador_jobs.cancelar(id_job=id_job)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não está em execução")
+    return {"status": "cancelando", "id_job": job["id_job"]}
 
 # --- CONTAGEM CASOS E ESTEIRA (EXEMPLO) ---
 @router.get("/painel-controle/contagem-casos")
-def contagem_casos_em_processamento(
+async def contagem_casos_em_processamento(
     tipo_email: str = Query("protocolo"),
     status: str = Query(None)
 ):
-    conn = get_conn()
-    cur = conn.cursor()
     query = """
-        SELECT COUNT(DISTINCT p.id_protocolo)
+        SELECT COUNT(DISTINCT p.id_protocolo) AS total
         FROM protocolos p
         JOIN emails e ON e.id_email = p.id_email
         WHERE TRUE
@@ -329,22 +496,22 @@ def contagem_casos_em_processamento(
         params.append(status)
     else:
         query += " AND p.status NOT IN ('protocolado', 'cancelado')"
-    cur.execute(query, tuple(params))
-    total = cur.fetchone()[0]
-    cur.close()
-    conn.close()
-    return {"total": total}
+    row = await buscar_um(query, tuple(params))
+    return {"total": row["total"]}
 
 
 @router.get("/esteira")
-def esteira_protocolos(
+async def esteira_protocolos(
     data: str = Query(None),
     status: str = Query(None),
     tipo_email: str = Query("protocolo"),
-    limite: int = Query(100)
+    limite: int = Query(PAGINA_PADRAO, ge=1, le=PAGINA_MAX),
+    cursor: str = Query(None)
 ):
-    conn = get_conn()
-    cur = conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+    """
+    Esteira de e-mails com protocolo e anexos, paginada por (recebido_em, id_email)
+    com `cursor`/`proximo_cursor`.
+    """
     query = """
         SELECT 
             e.id_email, e.assunto, e.recebido_em, e.tipo_email, e.corpo_email,
@@ -362,41 +529,50 @@ def esteira_protocolos(
     if status:
         query += " AND p.status = %s"
         params.append(status)
-    if data:
-        query += " AND DATE(e.recebido_em) = %s"
-        params.append(data)
-    query += " ORDER BY COALESCE(p.criado_em, e.recebido_em) DESC"
-    query += f" LIMIT {limite}"
-    cur.execute(query, tuple(params))
-    rows = cur.fetchall()
-
-    # Buscar os anexos de cada email:
+    filtro_data, params_data = _filtro_periodo("e.recebido_em", data, data)
+    query += filtro_data
+    params += params_data
+    filtro_cursor, params_cursor = _filtro_cursor("e.recebido_em", "e.id_email", cursor)
+    query += filtro_cursor + " ORDER BY e.recebido_em DESC, e.id_email DESC LIMIT %s"
+    params += params_cursor + [limite + 1]
+    async with conexao_async() as conn:
+        cur = await conn.execute(query, tuple(params))
+        rows, proximo_cursor = paginar(await cur.fetchall(), limite, "recebido_em", "id_email")
+
+        # Anexos de todos os e-mails da página numa consulta só
+        ids = [row['id_email'] for row in rows]
+        anexos = {}
+        if ids:
+            cur = await conn.execute(SQL_ANEXOS_EMAILS, (ids,))
+            anexos = agrupar_anexos(await cur.fetchall(), ids)
     for row in rows:
-        cur.execute("""
-            SELECT id_anexo, nome_arquivo, tipo_arquivo
-            FROM anexos_email WHERE id_email = %s
-        """, (row['id_email'],))
-        row['anexos'] = cur.fetchall()
+        row['anexos'] = [
+            {"id_anexo": a["id_anexo"], "nome_arquivo": a["nome_arquivo"], "tipo_arquivo": a["tipo_arquivo"]}
+            for a in anexos[row['id_email']]
+        ]
 
-    cur.close()
-    conn.close()
-    return {"esteira": rows}
+    return {"esteira": rows, "proximo_cursor": proximo_cursor, "limite": limite}
 
 
 @router.get("/captura-emails/progresso")
-def progresso_captura():
-    progress_file = "progress_captura.json"
-    if os.path.exists(progress_file):
-        with open(progress_file, "r", encoding="utf-8") as f:
-            try:
-                data = json.load(f)
-                return data
-            except Exception:
-                return {"total": 0, "atual": 0, "finalizado": False, "erro": "Arquivo corrompido"}
-    return {"total": 0, "atual": 0, "finalizado": False, "erro": "Sem progresso disponível"}
+def progresso_captura_atual():
+    estado, _ = progresso_captura.instantaneo()
+    return estado
+
+@router.get("/captura-emails/eventos")
+async def eventos_captura(request: Request):
+    """
+    Server-Sent Events com o progresso e o log da captura (substitui o polling).
+    """
+    return StreamingResponse(
+        progresso_captura.fluxo_sse(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.post("/captura-emails/stop")
 def stop_captura():
-    with open("progress_captura.json", "w") as f:
-        json.dump({"status": "cancelado"}, f)
-    return {"status": "cancelado"}
+    job = gerenciador_jobs.cancelar(tipo="captura")
+    if not job:
+        return {"status": "sem_execucao", "mensagem": "Nenhuma captura em execução."}
+    return {"status": "cancelando", "id_job": job["id_job"], "mensagem": "⛔ Cancelamento solicitado. A captura para após a mensagem atual."}
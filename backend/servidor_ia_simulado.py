@@ -0,0 +1,155 @@
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VEREDITOS_PADRAO = [
+    {
+        "valido": True,
+        "campos_faltantes": [],
+        "coerencia": True,
+        "motivo": "AÇÃO: Protocolar. Minuta e comprovante de assinatura presentes; identificadores conferem. O banco informa o cumprimento da ordem.",
+        "acao_sugerida": "protocolar",
+    },
+    {
+        "valido": False,
+        "campos_faltantes": ["assinatura"],
+        "coerencia": True,
+        "motivo": "AÇÃO: Revisar. Comprovante de assinatura não identificado. O banco presta informações sobre o processo.",
+        "acao_sugerida": "revisar",
+    },
+    {
+        "valido": False,
+        "campos_faltantes": ["minuta", "assinatura"],
+        "coerencia": False,
+        "motivo": "AÇÃO: Rejeitar. Não há minuta de resposta nem comprovante de assinatura.",
+        "acao_sugerida": "rejeitar",
+    },
+]
+
+class ConfiguracaoSimulador:
+    """
+    Comportamento do servidor simulado: latência (média + desvio, distribuição
+    normal truncada em zero), taxa de erro (metade 429, metade 500) e os
+    vereditos devolvidos, sorteados com os pesos informados.
+    """
+
+    def __init__(self, latencia=1.0, desvio=0.3, taxa_erro=0.0, vereditos=None, pesos=None, semente=None):
+        self.latencia = latencia
+        self.desvio = desvio
+        self.taxa_erro = taxa_erro
+        self.vereditos = vereditos or VEREDITOS_PADRAO
+        self.pesos = pesos
+        self.aleatorio = random.Random(semente)
+        self._lock = threading.Lock()
+        self.requisicoes = 0
+        self.erros = 0
+
+    def sortear(self):
+        with self._lock:
+            self.requisicoes += 1
+            espera = max(0.0, self.aleatorio.gauss(self.latencia, self.desvio))
+            erro = None
+            if self.aleatorio.random() < self.taxa_erro:
+                self.erros += 1
+                erro = self.aleatorio.choice((429, 500))
+            veredito = self.aleatorio.choices(self.vereditos, weights=self.pesos)[0]
+        return espera, erro, veredito
+
+def _tokens(texto):
+    return max(1, len(texto) // 4)
+
+def _criar_handler(config):
+    class HandlerSimulado(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _responder(self, status, corpo):
+            dados = json.dumps(corpo, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def do_GET(self):
+            if self.path.rstrip("/").endswith("/models"):
+                self._responder(200, {"object": "list", "data": [{"id": "gpt-4o", "object": "model"}]})
+            else:
+                self._responder(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            tamanho = int(self.headers.get("Content-Length") or 0)
+            requisicao = json.loads(self.rfile.read(tamanho) or b"{}")
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._responder(404, {"error": {"message": "not found"}})
+                return
+
+            espera, erro, veredito = config.sortear()
+            time.sleep(espera)
+            if erro == 429:
+                self._responder(429, {"error": {"message": "Rate limit simulado", "type": "rate_limit_error"}})
+                return
+            if erro:
+                self._responder(500, {"error": {"message": "Erro interno simulado", "type": "server_error"}})
+                return
+
+            conteudo = json.dumps(veredito, ensure_ascii=False)
+            prompt_tokens = sum(_tokens(m.get("content") or "") for m in requisicao.get("messages", []))
+            self._responder(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": requisicao.get("model", "gpt-4o"),
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": conteudo, "refusal": None},
+                    "finish_reason": "stop",
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": _tokens(conteudo),
+                    "total_tokens": prompt_tokens + _tokens(conteudo),
+                },
+            })
+
+        def log_message(self, formato, *args):
+            pass
+
+    return HandlerSimulado
+
+def iniciar_servidor(config=None, host="127.0.0.1", porta=0):
+    """
+    Sobe o servidor simulado numa thread e retorna (servidor, base_url).
+    Com porta 0 o sistema escolhe uma porta livre.
+    """
+    servidor = ThreadingHTTPServer((host, porta), _criar_handler(config or ConfiguracaoSimulador()))
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    host, porta = servidor.server_address[:2]
+    return servidor, f"http://{host}:{porta}/v1"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servidor local compatível com a API de chat da OpenAI, para testes offline.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8089)
+    parser.add_argument("--latencia", type=float, default=1.0, help="latência média em segundos")
+    parser.add_argument("--desvio", type=float, default=0.3, help="desvio padrão da latência")
+    parser.add_argument("--taxa-erro", type=float, default=0.0, help="fração de respostas 429/500")
+    parser.add_argument("--vereditos", help="arquivo JSON com a lista de vereditos")
+    parser.add_argument("--semente", type=int, default=None)
+    args = parser.parse_args()
+
+    vereditos = None
+    if args.vereditos:
+        with open(args.vereditos, encoding="utf-8") as f:
+            vereditos = json.load(f)
+    config = ConfiguracaoSimulador(args.latencia, args.desvio, args.taxa_erro, vereditos, semente=args.semente)
+    servidor, base_url = iniciar_servidor(config, args.host, args.porta)
+    print(f"Servidor IA simulado em {base_url} (use IA_BASE_URL={base_url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
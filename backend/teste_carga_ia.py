@@ -0,0 +1,100 @@
+import time
+import random
+import argparse
+import threading
+from collections import Counter
+from backend import ia_validador
+from backend.backends_ia import BackendOpenAI, definir_backend_ia
+from backend.limitador_taxa import LimitadorTaxa
+from backend.pipeline import validar_em_paralelo
+from backend.servidor_ia_simulado import ConfiguracaoSimulador, iniciar_servidor
+
+def gerar_entradas(quantidade, semente=None):
+    """E-mails sintéticos com tamanhos variados de corpo e anexos."""
+    aleatorio = random.Random(semente)
+    entradas = []
+    for i in range(1, quantidade + 1):
+        anexos = aleatorio.randint(0, 4)
+        entradas.append({
+            "id_email": i,
+            "assunto": f"RESPOSTA FINAL - Ofício FNDA-{1000000 + i} - Processo {i:07d}-12.2024.8.26.0100",
+            "corpo": "Prezados, segue resposta ao ofício em referência. " * aleatorio.randint(1, 40),
+            "nomes_anexos": [f"anexo_{i}_{n}.pdf" for n in range(anexos)],
+            "textos_anexos": ["Texto extraído do anexo. " * aleatorio.randint(10, 200) for _ in range(anexos)],
+            "campos_extraidos": {"processo": f"{i:07d}-12.2024.8.26.0100", "opaj": None, "identificador": f"FNDA-{1000000 + i}"},
+        })
+    return entradas
+
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    indice = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[indice]
+
+def executar_teste(entradas, concorrencia, modelo="gpt-4o"):
+    """
+    Passa as entradas pelo mesmo motor de validação do pipeline
+    (validar_em_paralelo + limitador + validar_formal_ia, sem cache e sem banco)
+    e mede vazão e latência por chamada.
+    """
+    latencias = []
+    lock = threading.Lock()
+
+    def validar(entrada):
+        inicio = time.monotonic()
+        resultado = ia_validador.validar_formal_ia(
+            entrada["assunto"], entrada["corpo"], entrada["nomes_anexos"],
+            entrada["textos_anexos"], entrada["campos_extraidos"], model=modelo, usar_cache=False
+        )
+        with lock:
+            latencias.append(time.monotonic() - inicio)
+        return resultado
+
+    inicio = time.monotonic()
+    acoes = Counter()
+    erros = 0
+    for _, resultado in validar_em_paralelo(entradas, concorrencia, validar=validar):
+        acoes[resultado.get("acao_sugerida")] += 1
+        erros += bool(resultado.get("erro_ia"))
+    duracao = time.monotonic() - inicio
+    return {
+        "emails": len(entradas),
+        "concorrencia": concorrencia,
+        "duracao_s": round(duracao, 2),
+        "vazao_emails_s": round(len(entradas) / duracao, 2) if duracao else None,
+        "latencia_p50_s": round(percentil(latencias, 50), 3),
+        "latencia_p95_s": round(percentil(latencias, 95), 3),
+        "latencia_p99_s": round(percentil(latencias, 99), 3),
+        "latencia_max_s": round(max(latencias), 3),
+        "erros": erros,
+        "acoes": dict(acoes),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga da validação IA contra o servidor simulado ou um endpoint compatível.")
+    parser.add_argument("--emails", type=int, default=100)
+    parser.add_argument("--concorrencia", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--base-url", help="endpoint compatível já em execução (padrão: sobe o simulado)")
+    parser.add_argument("--latencia", type=float, default=1.0)
+    parser.add_argument("--desvio", type=float, default=0.3)
+    parser.add_argument("--taxa-erro", type=float, default=0.02)
+    parser.add_argument("--rpm", type=int, default=0, help="limite de requisições/min (0 = sem limite)")
+    parser.add_argument("--tpm", type=int, default=0, help="limite de tokens/min (0 = sem limite)")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    servidor = None
+    base_url = args.base_url
+    if not base_url:
+        config = ConfiguracaoSimulador(args.latencia, args.desvio, args.taxa_erro, semente=args.semente)
+        servidor, base_url = iniciar_servidor(config)
+    definir_backend_ia(BackendOpenAI(base_url=base_url, api_key="teste-carga"))
+    ia_validador.limitador_ia = LimitadorTaxa(requisicoes_minuto=args.rpm, tokens_minuto=args.tpm)
+
+    entradas = gerar_entradas(args.emails, args.semente)
+    print(f"Endpoint: {base_url}")
+    for concorrencia in args.concorrencia:
+        print(executar_teste(entradas, concorrencia))
+    if servidor:
+        servidor.shutdown()
@@ -1,11 +1,13 @@
 import re
 import psycopg2
 import os
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from dotenv import load_dotenv
 from pathlib import Path
 import logging
 import hashlib
+import threading
+from backend.pool_conexoes import PoolConexoes
 
 def calcular_hash_documento(conteudo):
     """
@@ -24,21 +26,61 @@ load_dotenv(dotenv_path=env_path)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def get_conn():
+DB_CONFIG = {
+    "host": os.getenv("DB_HOST", "localhost"),
+    "port": os.getenv("DB_PORT", "5433"),
+    "dbname": os.getenv("DB_NAME", "esteira_protocolo"),
+    "user": os.getenv("DB_USER", "postgres"),
+    # Sem padrão: a senha vem só do ambiente/.env (DB_PASS vazio = autenticação sem senha)
+    "password": os.getenv("DB_PASS"),
+}
+
+def config_banco():
+    """DB_CONFIG validado: falha na hora, com mensagem clara, se DB_PASS não foi definido."""
+    if DB_CONFIG["password"] is None:
+        raise RuntimeError("DB_PASS não definido: configure a senha do banco no ambiente ou no .env")
+    return DB_CONFIG
+
+def nova_conexao():
+    """
+    Abre uma conexão própria, fora do pool. Só para quem segura a sessão por
+    muito tempo ou depende de estado de sessão (ex.: advisory lock dos jobs).
+    """
     try:
-        conn = psycopg2.connect(
-            host=os.getenv("DB_HOST"),
-            port=os.getenv("DB_PORT"),
-            dbname=os.getenv("DB_NAME"),
-            user=os.getenv("DB_USER"),
-            password=os.getenv("DB_PASS")
-        )
-        logger.info("Conexão com o banco estabelecida")
-        return conn
+        return psycopg2.connect(**config_banco())
     except psycopg2.Error as e:
         logger.critical(f"Erro na conexão com banco de dados: {e}")
         raise
 
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexoes(nova_conexao)
+                logger.info(f"Pool de conexões criado (mín. {_pool.minimo}, máx. {_pool.maximo})")
+    return _pool
+
+def get_conn():
+    """
+    Empresta uma conexão do pool compartilhado. `conn.close()` devolve ao
+    pool; `with get_conn() as conn:` faz commit/rollback e devolve ao sair.
+    """
+    return get_pool().obter()
+
+def metricas_pool():
+    return get_pool().metricas() if _pool is not None else {"abertas": 0, "em_uso": 0, "emprestimos": 0}
+
+def fechar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.fechar()
+            _pool = None
+
 def log(msg, tipo="INFO"):
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     tipo = tipo.upper()
@@ -98,6 +140,54 @@ def get_id_resposta_by_id_anexo(cur, id_anexo):
         logger.error(f"Erro ao buscar id_resposta pelo id_anexo {id_anexo}: {e}")
         return None
 
+def filtro_periodo(coluna, inicio=None, fim=None):
+    """
+    Filtro por dias como intervalo semiaberto [inicio 00:00, fim + 1 dia 00:00).
+    Diferente de DATE(coluna) = %s ou coluna::date >= %s, usa índice em `coluna`.
+    `inicio`/`fim` são date ou 'AAAA-MM-DD', ambos opcionais e fim inclusivo.
+    Retorna (" AND ...", params); ValueError se a data for inválida.
+    """
+    sql = ""
+    params = []
+    if inicio:
+        if isinstance(inicio, str):
+            inicio = date.fromisoformat(inicio)
+        sql += f" AND {coluna} >= %s"
+        params.append(datetime.combine(inicio, datetime.min.time()))
+    if fim:
+        if isinstance(fim, str):
+            fim = date.fromisoformat(fim)
+        sql += f" AND {coluna} < %s"
+        params.append(datetime.combine(fim + timedelta(days=1), datetime.min.time()))
+    return sql, params
+
+def filtro_dia(coluna, dia):
+    """Equivalente indexável de DATE(coluna) = dia (ver filtro_periodo)."""
+    return filtro_periodo(coluna, dia, dia)
+
+# Metadados dos anexos de vários e-mails numa consulta só (nunca lê o bytea `conteudo`)
+SQL_ANEXOS_EMAILS = """
+    SELECT id_email, id_anexo, nome_arquivo, tipo_arquivo, hash_conteudo
+    FROM anexos_email
+    WHERE id_email = ANY(%s)
+    ORDER BY id_email, id_anexo
+"""
+
+def agrupar_anexos(rows, ids_email):
+    """Agrupa as linhas de SQL_ANEXOS_EMAILS (dicts) em {id_email: [anexos]}."""
+    anexos = {id_email: [] for id_email in ids_email}
+    for row in rows:
+        anexos.setdefault(row["id_email"], []).append(row)
+    return anexos
+
+def buscar_anexos_emails(cur, ids_email):
+    """Anexos de todos os e-mails de `ids_email` (cursor de dicts), sem uma consulta por e-mail."""
+    ids_email = list(ids_email)
+    if not ids_email:
+        return {}
+    cur.execute(SQL_ANEXOS_EMAILS, (ids_email,))
+    return agrupar_anexos(cur.fetchall(), ids_email)
+
 def log_query(cur, query, params=None):
     try:
         cur.execute(query, params)
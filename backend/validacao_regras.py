@@ -0,0 +1,106 @@
+import re
+from backend.utils import validar_contexto_email, CNJ_RE
+
+CAMADA_REGRAS = "regras"
+CAMADA_IA = "ia"
+
+# Menções a documentos além de minuta/assinatura: só a IA consegue conferir
+DOCUMENTOS_ADICIONAIS_RE = re.compile(
+    r"extrato|contrato|termo|comprovante|planilha|fatura|procura[cç][aã]o|segue[m]? (?:em )?anexo",
+    re.IGNORECASE
+)
+TIPOS_DOCUMENTO = ("application/pdf", "application/zip", "application/x-zip-compressed")
+
+def _resultado(valido, acao, motivo, faltantes=None, coerencia=None):
+    return {
+        "valido": valido,
+        "campos_faltantes": faltantes or [],
+        "coerencia": coerencia,
+        "motivo": motivo,
+        "acao_sugerida": acao,
+        "camada": CAMADA_REGRAS,
+    }
+
+def _digitos(valor):
+    return re.sub(r"\D", "", valor)
+
+def _identificadores(campos_extraidos):
+    """
+    Identificadores inequívocos do e-mail, como (valor original, só os dígitos):
+    número CNJ, OPAJ e FNDA. O `processo` que não é CNJ (qualquer número de 6+
+    dígitos achado no texto) não basta para aprovar sem a IA.
+    """
+    processo = campos_extraidos.get("processo")
+    opaj = campos_extraidos.get("opaj")
+    identificador = campos_extraidos.get("identificador")
+    valores = []
+    if processo and CNJ_RE.fullmatch(processo):
+        valores.append(processo)
+    if opaj:
+        valores.append(f"OPAJ {opaj}")
+    if identificador and identificador.upper().startswith("FNDA-"):
+        valores.append(identificador)
+    return [(valor, _digitos(valor)) for valor in valores if _digitos(valor)]
+
+def _numeros_arquivo(nome):
+    """Números do nome do arquivo: cada sequência de dígitos e cada CNJ pontuado inteiro."""
+    return set(re.findall(r"\d+", nome)) | {_digitos(m.group(0)) for m in CNJ_RE.finditer(nome)}
+
+def pre_validar(entrada):
+    """
+    Camada determinística da validação formal, aplicada antes da IA.
+    Retorna um resultado no mesmo formato de validar_formal_ia quando o caso
+    é inequívoco, ou None quando precisa ir para o modelo.
+
+    Rejeita: e-mail sem anexo (marcado 'sem_anexo' na captura) e e-mail fora do
+    padrão sem minuta nem assinatura. Aprova: minuta e assinatura presentes,
+    número CNJ, OPAJ ou FNDA do e-mail igual (todos os dígitos) a um número do
+    nome da minuta e nenhum documento adicional citado.
+    """
+    anexos = entrada["anexos"]
+    assunto = entrada["assunto"]
+    corpo = entrada["corpo"]
+    status_captura = entrada.get("status_captura")
+
+    if not anexos or status_captura == "sem_anexo":
+        return _resultado(
+            False, "rejeitar",
+            "AÇÃO: Rejeitar. E-mail sem anexos: não há minuta de resposta nem comprovante de assinatura.",
+            ["minuta", "assinatura"], False
+        )
+
+    status, faltantes = validar_contexto_email(anexos, assunto, corpo)
+
+    if status_captura == "fora_do_padrao" and {"minuta", "assinatura"} <= set(faltantes):
+        return _resultado(
+            False, "rejeitar",
+            "AÇÃO: Rejeitar. Corpo do e-mail fora do padrão e nenhum anexo identificado como minuta ou assinatura.",
+            faltantes, False
+        )
+
+    if status != "completo" or status_captura == "fora_do_padrao":
+        return None
+    if DOCUMENTOS_ADICIONAIS_RE.search(f"{assunto} {corpo}"):
+        return None
+    if not all(a.get("tipo") in TIPOS_DOCUMENTO for a in anexos):
+        return None
+
+    identificadores = _identificadores(entrada["campos_extraidos"])
+    minutas = [
+        a["nome_arquivo"].lower() for a in anexos
+        if any(p in a["nome_arquivo"].lower() for p in ("minuta", "resposta", "oficio"))
+    ]
+    conferido = next(
+        (valor for valor, digitos in identificadores
+         if any(digitos in _numeros_arquivo(n) for n in minutas)),
+        None
+    )
+    if not conferido:
+        return None
+
+    return _resultado(
+        True, "protocolar",
+        f"AÇÃO: Protocolar. Minuta de resposta e comprovante de assinatura anexos; "
+        f"identificador {conferido} confere com o nome da minuta.",
+        [], True
+    )
@@ -36,15 +36,13 @@ const PainelControle = () => {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
-      setLog(data.mensagem || "Captura finalizada.");
+      setLog(data.mensagem || "Captura iniciada.");
+      // A captura roda em segundo plano; o fim chega pelo fluxo SSE
+      if (!res.ok && res.status !== 409) setCapturaAtiva(false);
     } catch (e) {
       setLog("❌ Erro ao iniciar captura.");
+      setCapturaAtiva(false);
     }
-
-    await delay(2000);
-    verificarProgresso();
-    carregarCasos();
-    setCapturaAtiva(false);
   };
 
   const pararCaptura = async () => {
@@ -74,12 +72,23 @@ const PainelControle = () => {
         headers: { Authorization: `Bearer ${token}` },
       });
       const data = await res.json();
-      setLog(data.mensagem || "Validação finalizada.");
+      setLog(data.mensagem || "Validação iniciada.");
+
+      // A validação roda como job; acompanha o status até terminar
+      let job = data;
+      while (job.id_job && ["pendente", "em_execucao", "cancelando", "iniciado"].includes(job.status)) {
+        await delay(3000);
+        const r = await fetch(`/api/jobs/${job.id_job}`, {
+          headers: { Authorization: `Bearer ${token}` },
+        });
+        job = await r.json();
+      }
+      if (job.status === "concluido") setLog(`✅ Validação IA concluída (${job.resultado?.processados ?? 0} e-mails).`);
+      else if (job.status === "erro") setLog(`❌ Validação IA falhou: ${job.erro}`);
     } catch (e) {
       setLog("❌ Erro ao rodar IA.");
     }
 
-    await delay(1000);
     carregarCasos();
     setExecutandoIA(false);
   };
@@ -151,13 +160,27 @@ const PainelControle = () => {
     atualizarStatusPipeline();
   }, []);
 
+  // Progresso e log da captura chegam por SSE enquanto ela estiver ativa
   useEffect(() => {
-    if (!progresso) return;
-    const interval = setInterval(() => {
-      verificarProgresso();
-    }, 2000);
-    return () => clearInterval(interval);
-  }, [progresso]);
+    if (!capturaAtiva) return;
+    const fonte = new EventSource("/api/captura-emails/eventos");
+    let emAndamento = false;
+    fonte.addEventListener("progresso", (ev) => {
+      const data = JSON.parse(ev.data);
+      const eventos = data.eventos || [];
+      if (eventos.length) setLog(eventos[eventos.length - 1].mensagem);
+      if (!data.finalizado) {
+        emAndamento = true;
+        setProgresso(data);
+      } else if (emAndamento) {
+        // Estado final de uma execução anterior é ignorado
+        setProgresso(null);
+        setCapturaAtiva(false);
+        carregarCasos();
+      }
+    });
+    return () => fonte.close();
+  }, [capturaAtiva]);
 
   // STYLE SHORTCUT
   const fullBtn =
@@ -34,6 +34,8 @@ function TabelaEsteira() {
   const [reciboModal, setReciboModal] = useState(null);
   const [reportarModal, setReportarModal] = useState(null);
   const [expandido, setExpandido] = useState(null);
+  const [proximoCursor, setProximoCursor] = useState(null);
+  const [carregandoMais, setCarregandoMais] = useState(false);
 
   const [filtroData, setFiltroData] = useState("");
   const [filtroStatus, setFiltroStatus] = useState("");
@@ -41,31 +43,49 @@ function TabelaEsteira() {
   const [filtroIa, setFiltroIa] = useState("");
   const { token } = useAuth();
 
-  // Fetch protocolos da esteira
-  useEffect(() => {
-    if (!token) return;
-
-    setLoading(true);
-    setErro("");
-
+  // Fetch protocolos da esteira (paginada: `cursor` busca a página seguinte)
+  const buscarEsteira = cursor => {
     let url = `${API_BASE}/api/esteira?`;
     if (filtroData) url += `data=${filtroData}&`;
     if (filtroStatus) url += `status=${filtroStatus}&`;
     if (filtroTipoEmail) url += `tipo_email=${filtroTipoEmail}&`;
     if (filtroIa) url += `acao_ia=${filtroIa}&`;
+    if (cursor) url += `cursor=${encodeURIComponent(cursor)}&`;
 
-    fetch(url, {
+    return fetch(url, {
       headers: { Authorization: `Bearer ${token}` },
-    })
-      .then(res => {
-        if (!res.ok) throw new Error("Erro ao buscar dados");
-        return res.json();
+    }).then(res => {
+      if (!res.ok) throw new Error("Erro ao buscar dados");
+      return res.json();
+    });
+  };
+
+  useEffect(() => {
+    if (!token) return;
+
+    setLoading(true);
+    setErro("");
+
+    buscarEsteira(null)
+      .then(data => {
+        setProtocolos(data.esteira || []);
+        setProximoCursor(data.proximo_cursor || null);
       })
-      .then(data => setProtocolos(data.esteira || []))
       .catch(() => setErro("Erro ao buscar protocolos da esteira."))
       .finally(() => setLoading(false));
   }, [token, filtroData, filtroStatus, filtroTipoEmail, filtroIa]);
 
+  const carregarMais = () => {
+    setCarregandoMais(true);
+    buscarEsteira(proximoCursor)
+      .then(data => {
+        setProtocolos(atuais => [...atuais, ...(data.esteira || [])]);
+        setProximoCursor(data.proximo_cursor || null);
+      })
+      .catch(() => setErro("Erro ao buscar protocolos da esteira."))
+      .finally(() => setCarregandoMais(false));
+  };
+
   const iaAcoes = Array.from(new Set(protocolos.map(o => o.acao_sugerida).filter(Boolean)));
   const tiposEmail = Array.from(new Set(protocolos.map(o => o.tipo_email).filter(Boolean)));
 
@@ -204,6 +224,15 @@ function TabelaEsteira() {
               )}
             </div>
           ))}
+          {proximoCursor && (
+            <button
+              onClick={carregarMais}
+              disabled={carregandoMais}
+              className="self-center bg-gray-100 hover:bg-gray-200 text-sm rounded px-4 py-2"
+            >
+              {carregandoMais ? "⏳ Carregando..." : "Carregar mais"}
+            </button>
+          )}
         </div>
       )}
 
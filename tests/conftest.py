@@ -0,0 +1,23 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+# Os testes importam o pacote `backend` a partir da raiz do repositório
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Testes que tocam o PostgreSQL só rodam com DB_TESTES=true (aplicam migrações na base de DB_CONFIG)
+DB_TESTES = os.getenv("DB_TESTES", "false").lower() == "true"
+
+@pytest.fixture
+def banco():
+    """Pula o teste se não houver base de testes configurada e acessível."""
+    if not DB_TESTES:
+        pytest.skip("sem base de testes (defina DB_TESTES=true e DB_HOST/DB_NAME/...)")
+    import psycopg2
+    from backend.utils import nova_conexao
+    try:
+        nova_conexao().close()
+    except psycopg2.Error as e:
+        pytest.skip(f"base de testes inacessível: {e}")
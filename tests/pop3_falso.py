@@ -0,0 +1,105 @@
+"""
+Caixa POP3 falsa para os testes da captura. Rodado como script, executa
+captura_emails contra a caixa falsa (o teste usa um subprocesso para poder
+matar a captura no meio, sem finally nem commit, como numa queda real).
+"""
+import os
+import sys
+import json
+import argparse
+from email.message import EmailMessage
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+REMETENTE = "respostaoficios@santander.com.br"
+# Código de saída usado para simular o processo morto (SIGKILL)
+SAIDA_MORTO = 137
+
+def montar_mensagens(prefixo, quantidade):
+    """Mensagens do remetente alvo, cada uma com uma minuta em PDF."""
+    mensagens = []
+    for i in range(1, quantidade + 1):
+        msg = EmailMessage()
+        msg["From"] = REMETENTE
+        msg["To"] = "protocolo@exemplo"
+        msg["Subject"] = f"RESPOSTA FINAL - Ofício {prefixo} {i}"
+        msg["Date"] = "Mon, 06 Jan 2025 10:00:00 -0300"
+        msg["Message-ID"] = f"<{prefixo}-{i}@teste>"
+        msg.set_content(f"Segue a resposta ao ofício {i}, com minuta e assinatura em anexo.")
+        msg.add_attachment(
+            f"%PDF-1.4 minuta {prefixo} {i}".encode(), maintype="application", subtype="pdf",
+            filename=f"minuta_{i}.pdf",
+        )
+        mensagens.append(msg.as_bytes().replace(b"\r\n", b"\n").split(b"\n"))
+    return mensagens
+
+class POP3Falso:
+    """
+    Imita poplib.POP3_SSL sobre uma lista de mensagens (linhas em bytes).
+    Com `morrer_em`, o processo sai na hora (os._exit) ao pedir essa mensagem.
+    """
+
+    def __init__(self, mensagens, prefixo, morrer_em=None):
+        self.mensagens = mensagens
+        self.prefixo = prefixo
+        self.morrer_em = morrer_em
+        self._pendentes = []
+
+    def user(self, usuario):
+        return b"+OK"
+
+    def pass_(self, senha):
+        return b"+OK"
+
+    def list(self):
+        linhas = [f"{n} {sum(len(l) + 2 for l in m)}".encode() for n, m in enumerate(self.mensagens, 1)]
+        return b"+OK", linhas, 0
+
+    def uidl(self):
+        return b"+OK", [f"{n} {self.prefixo}-uid-{n}".encode() for n in range(1, len(self.mensagens) + 1)], 0
+
+    def _mensagem(self, numero):
+        if numero == self.morrer_em:
+            os._exit(SAIDA_MORTO)
+        return self.mensagens[numero - 1]
+
+    def top(self, numero, linhas):
+        mensagem = self.mensagens[numero - 1]
+        cabecalho = mensagem[:mensagem.index(b"")]
+        return b"+OK", cabecalho, sum(len(l) + 2 for l in cabecalho)
+
+    def retr(self, numero):
+        mensagem = self._mensagem(numero)
+        return b"+OK", list(mensagem), sum(len(l) + 2 for l in mensagem)
+
+    # RETR em fluxo (captura_emails.retr_em_fluxo) usa os métodos internos do poplib
+    def _shortcmd(self, comando):
+        numero = int(comando.split()[1])
+        self._pendentes = [b"." + l if l.startswith(b".") else l for l in self._mensagem(numero)] + [b"."]
+        return b"+OK"
+
+    def _getline(self):
+        linha = self._pendentes.pop(0)
+        return linha, len(linha) + 2
+
+    def quit(self):
+        return b"+OK"
+
+def executar_captura(prefixo, quantidade, morrer_em=None, retomar=False):
+    from backend import captura_emails
+    mensagens = montar_mensagens(prefixo, quantidade)
+    captura_emails.poplib.POP3_SSL = lambda host, porta: POP3Falso(mensagens, prefixo, morrer_em)
+    if retomar:
+        return captura_emails.retomar_captura()
+    return captura_emails.capturar_emails()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--prefixo", required=True)
+    parser.add_argument("--quantidade", type=int, required=True)
+    parser.add_argument("--morrer-em", type=int, default=None)
+    parser.add_argument("--retomar", action="store_true")
+    args = parser.parse_args()
+    resultado = executar_captura(args.prefixo, args.quantidade, args.morrer_em, args.retomar)
+    print(json.dumps(resultado, default=str))
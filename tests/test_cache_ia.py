@@ -0,0 +1,157 @@
+"""
+Cache da validação IA: só respostas definitivas são gravadas (erros e
+'aguardar' sempre voltam à IA) e um acerto no cache não chama a IA.
+"""
+import json
+import uuid
+
+import pytest
+
+from backend import backends_ia, cache_ia, ia_validador
+from backend.backends_ia import BackendIA, RespostaIA
+from backend.cache_ia import CacheValidacaoIA, resultado_cacheavel
+from backend.limitador_taxa import LimitadorTaxa
+
+VALIDO = {"valido": True, "campos_faltantes": [], "coerencia": True, "motivo": "ok", "acao_sugerida": "protocolar"}
+INVALIDO = {**VALIDO, "valido": False, "motivo": "sem assinatura", "acao_sugerida": "rejeitar"}
+
+@pytest.mark.parametrize("resultado, esperado", [
+    (VALIDO, True),
+    (INVALIDO, True),
+    ({**VALIDO, "acao_sugerida": "aguardar"}, False),
+    ({**VALIDO, "acao_sugerida": "AGUARDAR"}, False),
+    ({**VALIDO, "valido": None}, False),
+    ({**VALIDO, "erro_ia": "json_decode_error"}, False),
+    (ia_validador.resultado_erro("timeout", "IA não executada"), False),
+    (None, False),
+    ("texto", False),
+])
+def test_resultado_cacheavel(resultado, esperado):
+    assert resultado_cacheavel(resultado) is esperado
+
+def test_gravar_nao_cacheavel_nem_abre_conexao(monkeypatch):
+    def sem_banco():
+        raise AssertionError("não deveria acessar o banco")
+
+    monkeypatch.setattr(cache_ia, "get_conn", sem_banco)
+    cache = CacheValidacaoIA()
+    assert cache.gravar("chave", "gpt-4o", "v1", {**VALIDO, "acao_sugerida": "aguardar"}) is False
+    assert cache.gravar("chave", "gpt-4o", "v1", ia_validador.resultado_erro("timeout", "erro")) is False
+
+class BackendContador(BackendIA):
+    """Conta as chamadas; devolve `resultado` ou levanta `erro`."""
+
+    def __init__(self, resultado=None, erro=None):
+        self.resultado = resultado
+        self.erro = erro
+        self.chamadas = 0
+
+    def completar(self, mensagens, modelo, formato_resposta=None):
+        self.chamadas += 1
+        if self.erro:
+            raise self.erro
+        return RespostaIA(conteudo=json.dumps(self.resultado), prompt_tokens=10, completion_tokens=5)
+
+@pytest.fixture
+def ia(monkeypatch):
+    monkeypatch.setattr(ia_validador, "IA_CACHE", True)
+    monkeypatch.setattr(ia_validador, "limitador_ia", LimitadorTaxa())
+
+    def definir(resultado=None, erro=None):
+        backend = BackendContador(resultado, erro)
+        monkeypatch.setattr(backends_ia, "_backend_ia", backend)
+        return backend
+
+    return definir
+
+def _validar(assunto="RESPOSTA FINAL - Ofício 1"):
+    return ia_validador.validar_formal_ia(
+        assunto, "Segue a resposta.", ["minuta.pdf"], {},
+        {"processo": None, "opaj": None, "identificador": None},
+    )
+
+def test_acerto_no_cache_nao_chama_a_ia(ia, monkeypatch):
+    backend = ia(resultado=INVALIDO)
+    cache = ia_validador.cache_validacao_ia
+    monkeypatch.setattr(cache, "obter", lambda chave: VALIDO)
+    monkeypatch.setattr(cache, "gravar", lambda *args: pytest.fail("acerto não deve regravar"))
+    assert _validar() == VALIDO
+    assert backend.chamadas == 0
+
+def test_falta_no_cache_chama_a_ia_e_grava(ia, monkeypatch):
+    backend = ia(resultado=INVALIDO)
+    cache = ia_validador.cache_validacao_ia
+    gravados = []
+    monkeypatch.setattr(cache, "obter", lambda chave: None)
+    monkeypatch.setattr(cache, "gravar", lambda chave, modelo, versao, resultado: gravados.append(resultado))
+    assert _validar() == INVALIDO
+    assert backend.chamadas == 1
+    assert gravados == [INVALIDO]
+
+def test_cache_indisponivel_ainda_valida(ia, monkeypatch):
+    backend = ia(resultado=VALIDO)
+
+    def indisponivel(chave):
+        raise ConnectionError("banco fora")
+
+    monkeypatch.setattr(ia_validador.cache_validacao_ia, "obter", indisponivel)
+    assert _validar() == VALIDO
+    assert backend.chamadas == 1
+
+def _linhas_cache(assunto):
+    from backend.utils import nova_conexao
+    chave = ia_validador.cache_validacao_ia.chave(
+        "gpt-4o", ia_validador.PROMPT_VERSAO,
+        ia_validador.SISTEMA_VALIDADOR + ia_validador.prompt_formal_ia(
+            assunto, "Segue a resposta.", ["minuta.pdf"], {},
+            {"processo": None, "opaj": None, "identificador": None},
+        ),
+    )
+    conn = nova_conexao()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COUNT(*) FROM cache_validacao_ia WHERE chave = %s", (chave,))
+        return chave, cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+
+def _apagar(chave):
+    from backend.utils import nova_conexao
+    conn = nova_conexao()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM cache_validacao_ia WHERE chave = %s", (chave,))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+@pytest.mark.parametrize("resposta", [
+    {"erro": TimeoutError("timeout")},
+    {"resultado": {**VALIDO, "acao_sugerida": "aguardar"}},
+    {"resultado": {**VALIDO, "valido": None}},
+])
+def test_erro_e_aguardar_nunca_vao_ao_cache(banco, ia, resposta):
+    from backend.migracoes import aplicar_migracoes
+    aplicar_migracoes()
+    backend = ia(**resposta)
+    assunto = f"RESPOSTA FINAL - Ofício {uuid.uuid4().hex[:10]}"
+
+    primeiro = _validar(assunto)
+    segundo = _validar(assunto)
+
+    assert backend.chamadas == 2  # refeito na segunda vez
+    assert not resultado_cacheavel(primeiro) and not resultado_cacheavel(segundo)
+    assert _linhas_cache(assunto)[1] == 0
+
+def test_resposta_definitiva_e_reaproveitada(banco, ia):
+    from backend.migracoes import aplicar_migracoes
+    aplicar_migracoes()
+    backend = ia(resultado=INVALIDO)
+    assunto = f"RESPOSTA FINAL - Ofício {uuid.uuid4().hex[:10]}"
+    try:
+        assert _validar(assunto) == INVALIDO
+        assert _validar(assunto) == INVALIDO
+        assert backend.chamadas == 1
+        assert _linhas_cache(assunto)[1] == 1
+    finally:
+        _apagar(_linhas_cache(assunto)[0])
@@ -0,0 +1,89 @@
+import os
+import sys
+import json
+import uuid
+import subprocess
+from pathlib import Path
+
+import pytest
+
+from pop3_falso import SAIDA_MORTO
+
+SCRIPT = Path(__file__).resolve().parent / "pop3_falso.py"
+MENSAGENS = 12
+# Lotes de 2 e commit a cada 4 mensagens: morrendo no RETR da 7ª, só as 4 primeiras estão commitadas
+MORRER_EM = 7
+
+@pytest.fixture
+def conta(banco, tmp_path):
+    """Conta POP3 e prefixo de Message-ID exclusivos do teste; apaga o que a captura gravou."""
+    from backend.utils import nova_conexao
+    prefixo = f"teste-{uuid.uuid4().hex[:10]}"
+    yield prefixo
+    conn = nova_conexao()
+    with conn, conn.cursor() as cur:
+        padrao = f"<{prefixo}-%"
+        cur.execute("DELETE FROM respostas WHERE id_email IN (SELECT id_email FROM emails WHERE message_id LIKE %s)", (padrao,))
+        cur.execute("DELETE FROM anexos_email WHERE id_email IN (SELECT id_email FROM emails WHERE message_id LIKE %s)", (padrao,))
+        cur.execute("DELETE FROM emails WHERE message_id LIKE %s", (padrao,))
+        cur.execute("DELETE FROM emails_uidl WHERE conta = %s", (prefixo,))
+        cur.execute("DELETE FROM capturas_execucao WHERE conta = %s", (prefixo,))
+    conn.close()
+
+def _capturar(prefixo, tmp_path, *argumentos):
+    env = {
+        **os.environ,
+        "IMAP_USER": prefixo,
+        "ANEXOS_DIR": str(tmp_path / "anexos"),
+        "POP3_SESSOES": "1",
+        "CAPTURA_LOTE": "2",
+        "CAPTURA_CHECKPOINT": "4",
+    }
+    return subprocess.run(
+        [sys.executable, str(SCRIPT), "--prefixo", prefixo, "--quantidade", str(MENSAGENS), *argumentos],
+        env=env, capture_output=True, text=True, timeout=120,
+    )
+
+def _estado(prefixo):
+    from backend.utils import nova_conexao
+    conn = nova_conexao()
+    with conn, conn.cursor() as cur:
+        cur.execute("""
+            SELECT message_id, COUNT(*) FROM emails WHERE message_id LIKE %s GROUP BY message_id
+        """, (f"<{prefixo}-%",))
+        emails = dict(cur.fetchall())
+        cur.execute("SELECT COUNT(*) FROM emails_uidl WHERE conta = %s", (prefixo,))
+        uidls = cur.fetchone()[0]
+        cur.execute("""
+            SELECT status FROM capturas_execucao WHERE conta = %s ORDER BY id_execucao DESC LIMIT 1
+        """, (prefixo,))
+        status = cur.fetchone()[0]
+    conn.close()
+    return emails, uidls, status
+
+@pytest.mark.parametrize("streaming", ["true", "false"])
+def test_captura_morta_retoma_sem_duplicar(conta, tmp_path, monkeypatch, streaming):
+    from backend.migracoes import aplicar_migracoes
+    aplicar_migracoes()
+    monkeypatch.setenv("CAPTURA_STREAMING", streaming)
+
+    morta = _capturar(conta, tmp_path, "--morrer-em", str(MORRER_EM))
+    assert morta.returncode == SAIDA_MORTO, morta.stderr
+    emails, uidls, status = _estado(conta)
+    assert len(emails) == 4
+    assert uidls == 4
+    assert status == "em_andamento"  # morreu sem marcar a execução como interrompida
+
+    retomada = _capturar(conta, tmp_path, "--retomar")
+    assert retomada.returncode == 0, retomada.stderr
+    resultado = json.loads(retomada.stdout.strip().splitlines()[-1])
+    assert resultado["conhecidos"] == 4  # puladas pelo checkpoint de UIDL, sem novo RETR
+    assert resultado["salvos"] == MENSAGENS - 4
+    assert resultado["duplicados"] == 0
+    assert resultado["falhas"] == 0
+
+    emails, uidls, status = _estado(conta)
+    assert len(emails) == MENSAGENS
+    assert all(total == 1 for total in emails.values())
+    assert uidls == MENSAGENS
+    assert status == "concluida"
@@ -0,0 +1,14 @@
+import pytest
+
+from backend import utils
+
+def test_sem_db_pass_falha_antes_de_conectar(monkeypatch):
+    monkeypatch.setitem(utils.DB_CONFIG, "password", None)
+    monkeypatch.setattr(utils.psycopg2, "connect", lambda **kw: pytest.fail("não deveria conectar"))
+    with pytest.raises(RuntimeError, match="DB_PASS"):
+        utils.nova_conexao()
+
+def test_db_pass_vazio_e_aceito(monkeypatch):
+    monkeypatch.setitem(utils.DB_CONFIG, "password", "")
+    monkeypatch.setattr(utils.psycopg2, "connect", lambda **kw: kw)
+    assert utils.nova_conexao()["password"] == ""
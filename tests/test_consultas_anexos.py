@@ -0,0 +1,114 @@
+"""
+Regressão do N+1 nos anexos: a preparação do lote da validação e a página da
+esteira fazem uma consulta de anexos por lote/página, nunca uma por e-mail.
+"""
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from backend import pipeline
+from backend.routers import protocolos
+
+ANEXOS_POR_EMAIL = 2
+
+def _anexos(ids_email):
+    return [
+        {"id_email": id_email, "id_anexo": id_email * 10 + k, "nome_arquivo": f"anexo_{k}.pdf",
+         "tipo_arquivo": "application/pdf", "hash_conteudo": None}
+        for id_email in ids_email for k in range(ANEXOS_POR_EMAIL)
+    ]
+
+def _consultas_anexos(consultas):
+    return [q for q, _ in consultas if "anexos_email" in q]
+
+class CursorContador:
+    """Cursor de dicts que registra cada execute e responde às consultas de anexos."""
+
+    def __init__(self, linhas=None):
+        self.consultas = []
+        self.linhas = linhas or []
+        self._resultado = []
+
+    def execute(self, query, params=None):
+        self.consultas.append((query, params))
+        self._resultado = _anexos(params[0]) if "anexos_email" in query else list(self.linhas)
+
+    def fetchall(self):
+        return self._resultado
+
+    def close(self):
+        pass
+
+def _emails(quantidade):
+    agora = datetime(2025, 1, 6, 12, 0)
+    return [
+        {"id_email": i, "assunto": f"RESPOSTA FINAL - Ofício {i}", "corpo_email": "corpo",
+         "recebido_em": agora - timedelta(minutes=i), "tipo_email": "protocolo"}
+        for i in range(1, quantidade + 1)
+    ]
+
+def test_preparar_emails_uma_consulta_de_anexos_por_lote():
+    cur = CursorContador()
+    entradas = pipeline.preparar_emails(cur, _emails(50))
+
+    assert len(_consultas_anexos(cur.consultas)) == 1
+    assert len(cur.consultas) == 1
+    assert sorted(cur.consultas[0][1][0]) == list(range(1, 51))
+    assert len(entradas) == 50
+    assert all(len(e["anexos"]) == ANEXOS_POR_EMAIL for e in entradas)
+    assert entradas[4]["nomes_anexos"] == ["anexo_0.pdf", "anexo_1.pdf"]
+
+def test_preparar_emails_sem_emails_nao_consulta():
+    cur = CursorContador()
+    assert pipeline.preparar_emails(cur, []) == []
+    assert cur.consultas == []
+
+def test_esteira_legada_uma_consulta_de_anexos_por_pagina(monkeypatch):
+    cur = CursorContador(_emails(30))
+
+    class Conexao:
+        def cursor(self, cursor_factory=None):
+            return cur
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(pipeline, "get_conn", Conexao)
+    resposta = pipeline.esteira_protocolos(data=None, status=None, tipo_email="protocolo", limite=30)
+
+    assert len(_consultas_anexos(cur.consultas)) == 1
+    assert len(resposta["esteira"]) == 30
+    assert all(len(row["anexos"]) == ANEXOS_POR_EMAIL for row in resposta["esteira"])
+
+def test_esteira_uma_consulta_de_anexos_por_pagina(monkeypatch):
+    consultas = []
+    emails = _emails(51)  # limite + 1: há próxima página
+
+    class CursorAsync:
+        def __init__(self, linhas):
+            self.linhas = linhas
+
+        async def fetchall(self):
+            return self.linhas
+
+    class ConexaoAsync:
+        async def execute(self, query, params=None):
+            consultas.append((query, params))
+            if "anexos_email" in query:
+                return CursorAsync(_anexos(params[0]))
+            return CursorAsync([dict(e) for e in emails])
+
+    @asynccontextmanager
+    async def conexao_falsa():
+        yield ConexaoAsync()
+
+    monkeypatch.setattr(protocolos, "conexao_async", conexao_falsa)
+    resposta = asyncio.run(protocolos.esteira_protocolos(
+        data=None, status=None, tipo_email="protocolo", limite=50, cursor=None
+    ))
+
+    assert len(consultas) == 2
+    assert len(_consultas_anexos(consultas)) == 1
+    assert len(resposta["esteira"]) == 50
+    assert resposta["proximo_cursor"]
+    assert all(len(row["anexos"]) == ANEXOS_POR_EMAIL for row in resposta["esteira"])
@@ -0,0 +1,119 @@
+"""
+Range/ETag do download de anexos: interpretação dos cabeçalhos e as
+respostas 200/206/304/416 do endpoint, sem banco (armazenamento local em tmp).
+"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from backend.armazenamento_anexos import ArmazenamentoLocal
+from backend.routers import protocolos
+from backend.routers.protocolos import RangeInvalido, _etag_corresponde, _intervalo_range
+
+TAMANHO = 1000
+CONTEUDO = bytes(i % 251 for i in range(TAMANHO))
+
+@pytest.mark.parametrize("cabecalho, esperado", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, TAMANHO - 1)),           # aberto: até o fim
+    ("bytes=-100", (TAMANHO - 100, TAMANHO - 1)),  # sufixo: os últimos 100
+    ("bytes=-5000", (0, TAMANHO - 1)),            # sufixo maior que o arquivo
+    ("bytes=900-5000", (900, TAMANHO - 1)),       # fim além do arquivo é cortado
+    ("bytes=999-999", (999, 999)),
+])
+def test_intervalo_range(cabecalho, esperado):
+    assert _intervalo_range(cabecalho, TAMANHO) == esperado
+
+@pytest.mark.parametrize("cabecalho", [
+    None, "", "items=0-10", "bytes=0-10,20-30", "bytes=abc-", "bytes=-",
+])
+def test_range_ignorado_serve_o_arquivo_inteiro(cabecalho):
+    assert _intervalo_range(cabecalho, TAMANHO) is None
+
+@pytest.mark.parametrize("cabecalho", ["bytes=1000-", "bytes=5000-6000", "bytes=50-10", "bytes=-0"])
+def test_range_fora_do_arquivo(cabecalho):
+    with pytest.raises(RangeInvalido):
+        _intervalo_range(cabecalho, TAMANHO)
+
+@pytest.mark.parametrize("cabecalho, etag, esperado", [
+    ('"abc"', '"abc"', True),
+    ('"x", "abc"', '"abc"', True),
+    ("*", '"abc"', True),
+    ('W/"abc"', '"abc"', True),          # comparação fraca ignora W/
+    ('"abc"', 'W/"abc"', True),
+    ('W/"bytea-1-10"', 'W/"bytea-1-10"', True),
+    ('"outro"', '"abc"', False),
+    (None, '"abc"', False),
+    ("", '"abc"', False),
+])
+def test_etag_corresponde(cabecalho, etag, esperado):
+    assert _etag_corresponde(cabecalho, etag) is esperado
+
+@pytest.fixture
+def cliente(tmp_path, monkeypatch):
+    armazenamento = ArmazenamentoLocal(tmp_path)
+    hash_conteudo = armazenamento.salvar(CONTEUDO)
+
+    async def buscar_um(query, params=None):
+        return {
+            "nome_arquivo": "minuta.pdf", "tipo_arquivo": "application/pdf",
+            "hash_conteudo": hash_conteudo, "tamanho": TAMANHO, "tamanho_bytea": None,
+        }
+
+    monkeypatch.setattr(protocolos, "buscar_um", buscar_um)
+    monkeypatch.setattr(protocolos, "get_armazenamento", lambda: armazenamento)
+    app = FastAPI()
+    app.include_router(protocolos.router)
+    with TestClient(app) as cliente:
+        cliente.etag = f'"{hash_conteudo}"'
+        yield cliente
+
+URL = "/anexos/1/download"
+
+def test_download_inteiro(cliente):
+    resposta = cliente.get(URL)
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+    assert resposta.headers["content-length"] == str(TAMANHO)
+    assert resposta.headers["etag"] == cliente.etag
+    assert resposta.headers["accept-ranges"] == "bytes"
+
+@pytest.mark.parametrize("cabecalho, inicio, fim", [
+    ("bytes=-100", TAMANHO - 100, TAMANHO - 1),
+    ("bytes=500-", 500, TAMANHO - 1),
+    ("bytes=10-19", 10, 19),
+])
+def test_download_parcial(cliente, cabecalho, inicio, fim):
+    resposta = cliente.get(URL, headers={"Range": cabecalho})
+    assert resposta.status_code == 206
+    assert resposta.content == CONTEUDO[inicio:fim + 1]
+    assert resposta.headers["content-range"] == f"bytes {inicio}-{fim}/{TAMANHO}"
+    assert resposta.headers["content-length"] == str(fim - inicio + 1)
+
+def test_inicio_alem_do_arquivo_416(cliente):
+    resposta = cliente.get(URL, headers={"Range": f"bytes={TAMANHO}-"})
+    assert resposta.status_code == 416
+    assert resposta.headers["content-range"] == f"bytes */{TAMANHO}"
+
+def test_varios_intervalos_servem_o_arquivo_inteiro(cliente):
+    resposta = cliente.get(URL, headers={"Range": "bytes=0-9,20-29"})
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+
+def test_if_range_com_etag_antigo_serve_o_arquivo_inteiro(cliente):
+    resposta = cliente.get(URL, headers={"Range": "bytes=0-9", "If-Range": '"etag-antigo"'})
+    assert resposta.status_code == 200
+    assert resposta.content == CONTEUDO
+    atual = cliente.get(URL, headers={"Range": "bytes=0-9", "If-Range": cliente.etag})
+    assert atual.status_code == 206
+    assert atual.content == CONTEUDO[:10]
+
+def test_if_range_com_etag_fraco_serve_o_arquivo_inteiro(cliente):
+    resposta = cliente.get(URL, headers={"Range": "bytes=0-9", "If-Range": f"W/{cliente.etag}"})
+    assert resposta.status_code == 200
+
+@pytest.mark.parametrize("if_none_match", ["{etag}", "W/{etag}", '"x", {etag}', "*"])
+def test_if_none_match_304(cliente, if_none_match):
+    resposta = cliente.get(URL, headers={"If-None-Match": if_none_match.format(etag=cliente.etag)})
+    assert resposta.status_code == 304
+    assert resposta.content == b""
@@ -0,0 +1,46 @@
+"""
+Extração de textos no pool de processos: um arquivo que derruba o processo
+(falta de memória, falha do leitor) não aborta o lote.
+"""
+import os
+
+from backend import extracao_textos
+
+ARQUIVO_FATAL = "fatal"
+
+def extrair_ou_morrer(hash_conteudo, nome, tipo):
+    # Roda no processo do pool (spawn): importada pelo nome deste módulo
+    if hash_conteudo == ARQUIVO_FATAL:
+        os._exit(1)
+    return hash_conteudo, f"texto de {nome}", 1, "txt", None
+
+def test_processo_morto_nao_aborta_o_lote():
+    pendentes = {
+        "a": ("a.txt", "text/plain"),
+        ARQUIVO_FATAL: ("fatal.pdf", "application/pdf"),
+        "b": ("b.txt", "text/plain"),
+    }
+    try:
+        resultados = extracao_textos._extrair_em_pool(pendentes, extrair_ou_morrer)
+        assert [r[0] for r in resultados] == ["a", ARQUIVO_FATAL, "b"]
+        assert resultados[0] == ("a", "texto de a.txt", 1, "txt", None)
+        assert resultados[2] == ("b", "texto de b.txt", 1, "txt", None)
+        assert resultados[1] == (ARQUIVO_FATAL, "", 0, "pdf", extracao_textos.ERRO_PROCESSO_MORTO)
+
+        # O pool foi recriado e continua atendendo os lotes seguintes
+        resultados = extracao_textos._extrair_em_pool({"c": ("c.txt", "text/plain")}, extrair_ou_morrer)
+        assert resultados == [("c", "texto de c.txt", 1, "txt", None)]
+    finally:
+        extracao_textos.fechar_pool_extracao()
+
+def test_extrair_texto_txt_e_zip():
+    import io
+    import zipfile
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as z:
+        z.writestr("minuta.txt", "Minuta   da\n\n\nresposta")
+        z.writestr("imagem.png", b"\\x89PNG")
+    texto, paginas, extrator = extracao_textos.extrair_texto(buffer.getvalue(), "docs.zip", None)
+    assert extrator == "zip"
+    assert texto == "[minuta.txt]\nMinuta da\nresposta"
+    assert extracao_textos.extrair_texto(b"x", "foto.png", "image/png") == ("", 0, None)
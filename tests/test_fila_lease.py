@@ -0,0 +1,126 @@
+"""
+Leases da fila de validação: o heartbeat renova as reivindicações pendentes
+enquanto o lote é processado, e a gravação só acontece se a reivindicação
+ainda for deste worker (índice único em protocolos.id_email como garantia).
+"""
+import time
+import uuid
+
+from backend import fila_validacao, pipeline
+
+class ConexaoFalsa:
+    def __init__(self, consultas=None):
+        self.consultas = consultas if consultas is not None else []
+
+    def cursor(self, cursor_factory=None):
+        return self
+
+    def execute(self, query, params=None):
+        self.consultas.append(params)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+def test_heartbeat_renova_so_os_pendentes(monkeypatch):
+    consultas = []
+    monkeypatch.setattr(fila_validacao, "get_conn", lambda: ConexaoFalsa(consultas))
+
+    with fila_validacao.RenovadorClaims("w1", [1, 2, 3], intervalo=0.01, lease=60) as renovador:
+        renovador.concluir(1)
+        time.sleep(0.1)
+        renovador.concluir(2)
+        renovador.concluir(3)
+        time.sleep(0.05)
+        renovacoes = renovador.renovacoes
+
+    assert renovacoes >= 2
+    # Cada renovação leva (lease, worker, ids pendentes); sem pendentes não há UPDATE
+    assert all(lease == 60 and worker == "w1" for lease, worker, _ in consultas)
+    assert sorted(consultas[0][2]) == [2, 3]
+    assert len(consultas) == renovacoes
+    time.sleep(0.05)
+    assert len(consultas) == renovacoes  # parou ao sair do with
+
+def _rodar(monkeypatch, donos):
+    """Pipeline com um lote de 3 e-mails; `donos` diz se a reivindicação de cada um ainda é do worker."""
+    gravados = []
+    lotes = [[{"id_email": i} for i in (1, 2, 3)], []]
+
+    class RenovadorFalso:
+        def __init__(self, worker, ids):
+            self.concluidos = []
+
+        def concluir(self, id_email):
+            self.concluidos.append(id_email)
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    monkeypatch.setattr(pipeline, "get_conn", ConexaoFalsa)
+    monkeypatch.setattr(pipeline, "RenovadorClaims", RenovadorFalso)
+    monkeypatch.setattr(pipeline, "reivindicar_emails", lambda cur, worker, quantidade, data: lotes.pop(0))
+    monkeypatch.setattr(pipeline, "preparar_emails", lambda cur, emails: [dict(e) for e in emails])
+    monkeypatch.setattr(pipeline, "anexar_textos", lambda conn, entradas: None)
+    monkeypatch.setattr(pipeline, "validar_em_paralelo",
+                        lambda entradas, concorrencia, cancelar: ((e, {"camada": pipeline.CAMADA_IA}) for e in entradas))
+    monkeypatch.setattr(pipeline, "confirmar_claim", lambda cur, worker, id_email: donos[id_email])
+    monkeypatch.setattr(pipeline, "gravar_ou_reagendar",
+                        lambda cur, entrada, resultado_ia: gravados.append(entrada["id_email"]) or True)
+    monkeypatch.setattr(pipeline, "liberar_emails", lambda cur, worker, ids: None)
+    return pipeline.pipeline(tamanho_lote=3), gravados
+
+def test_nao_grava_email_com_reivindicacao_perdida(monkeypatch):
+    resultado, gravados = _rodar(monkeypatch, {1: True, 2: False, 3: True})
+    assert gravados == [1, 3]
+    assert resultado["processados"] == 2
+    assert resultado["perdidos"] == 1
+
+def _email(cur, prefixo):
+    cur.execute("""
+        INSERT INTO emails (remetente, assunto, recebido_em, message_id, corpo_email, tipo_email)
+        VALUES ('teste@exemplo', 'RESPOSTA FINAL - Ofício 1', NOW(), %s, 'corpo', 'protocolo')
+        RETURNING id_email
+    """, (f"<{prefixo}@teste>",))
+    return cur.fetchone()[0]
+
+def test_claim_tomado_por_outro_worker_e_protocolo_unico(banco):
+    from backend.migracoes import aplicar_migracoes
+    from backend.utils import nova_conexao
+    aplicar_migracoes()
+    conn = nova_conexao()
+    cur = conn.cursor()
+    try:
+        id_email = _email(cur, f"lease-{uuid.uuid4().hex[:10]}")
+        # O lease de w1 expirou e w2 reivindicou o e-mail
+        cur.execute("""
+            INSERT INTO claims_validacao (id_email, worker, expira_em) VALUES (%s, 'w2', NOW() + INTERVAL '1 minute')
+        """, (id_email,))
+        assert not fila_validacao.confirmar_claim(cur, "w1", id_email)
+        assert fila_validacao.confirmar_claim(cur, "w2", id_email)
+        assert not fila_validacao.confirmar_claim(cur, "w2", id_email)  # já consumida
+
+        entrada = {
+            "id_email": id_email, "nomes_anexos": ["minuta.pdf"],
+            "campos_extraidos": {"processo": None, "opaj": None, "identificador": None},
+        }
+        resultado = {"valido": True, "motivo": "ok", "acao_sugerida": "protocolar", "camada": pipeline.CAMADA_IA}
+        assert pipeline.gravar_ou_reagendar(cur, entrada, resultado)
+        # Segunda gravação (ex.: worker atrasado ou ingestão de lote): barrada pelo índice único
+        assert not pipeline.gravar_ou_reagendar(cur, entrada, resultado)
+        cur.execute("SELECT COUNT(*) FROM protocolos WHERE id_email = %s", (id_email,))
+        assert cur.fetchone()[0] == 1
+        cur.execute("SELECT COUNT(*) FROM tentativas_validacao WHERE id_email = %s", (id_email,))
+        assert cur.fetchone()[0] == 0  # não foi reagendado
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
@@ -0,0 +1,304 @@
+"""
+O LeitorMime (captura em streaming) tem de extrair o mesmo corpo e os mesmos
+anexos que o parser completo do stdlib usado em interpretar_mensagem
+(BytesParser + get_body/iter_attachments).
+"""
+import base64
+from email import policy
+from email.parser import BytesParser
+
+import pytest
+
+from pop3_falso import POP3Falso
+from backend.captura_emails import retr_em_fluxo
+from backend.leitor_mime import LeitorMime
+
+PDF = b"%PDF-1.4\n" + bytes(range(256)) * 3 + b"\n%%EOF"
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(200))
+
+def _b64(conteudo):
+    texto = base64.b64encode(conteudo).decode()
+    return "\n".join(texto[i:i + 76] for i in range(0, len(texto), 76))
+
+CABECALHO = """From: respostaoficios@santander.com.br
+To: protocolo@exemplo
+Subject: RESPOSTA FINAL - Oficio 123
+Date: Mon, 06 Jan 2025 10:00:00 -0300
+Message-ID: <teste@exemplo>
+MIME-Version: 1.0
+"""
+
+MENSAGENS = {
+    # Corpo alternative com HTML related (logo inline) + PDF: a logo não é anexo
+    "related_inline": CABECALHO + f"""Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: multipart/alternative; boundary="alt"
+
+--alt
+Content-Type: text/plain; charset=utf-8
+
+Segue a minuta.
+--alt
+Content-Type: multipart/related; boundary="rel"
+
+--rel
+Content-Type: text/html; charset=utf-8
+
+<p>Segue a minuta.</p><img src="cid:logo@exemplo">
+--rel
+Content-Type: image/png
+Content-Transfer-Encoding: base64
+Content-ID: <logo@exemplo>
+Content-Disposition: inline
+
+{_b64(PNG)}
+--rel--
+--alt--
+--mix
+Content-Type: application/pdf; name="minuta.pdf"
+Content-Disposition: attachment; filename="minuta.pdf"
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+--mix--
+""",
+    # multipart/related no topo com start: tudo menos a raiz é anexo
+    "related_start": CABECALHO + f"""Content-Type: multipart/related; boundary="rel"; start="<raiz@exemplo>"
+
+--rel
+Content-Type: image/png; name="logo.png"
+Content-Transfer-Encoding: base64
+Content-ID: <logo@exemplo>
+
+{_b64(PNG)}
+--rel
+Content-Type: text/html; charset=utf-8
+Content-ID: <raiz@exemplo>
+
+<p>Corpo em HTML</p>
+--rel--
+""",
+    # Imagem inline com nome num multipart/mixed: o stdlib a trata como anexo
+    "inline_mixed": CABECALHO + f"""Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: text/plain
+
+Corpo.
+--mix
+Content-Type: image/png; name="foto.png"
+Content-Disposition: inline; filename="foto.png"
+Content-Transfer-Encoding: base64
+
+{_b64(PNG)}
+--mix--
+""",
+    # Multipart aninhado: o mixed interno não é anexo (só os filhos diretos do principal)
+    "aninhado": CABECALHO + f"""Content-Type: multipart/mixed; boundary="externo"
+
+preâmbulo ignorado
+--externo
+Content-Type: multipart/mixed; boundary="interno"
+
+--interno
+Content-Type: text/plain; charset=iso-8859-1
+Content-Transfer-Encoding: quoted-printable
+
+Of=EDcio respondido.
+--interno
+Content-Type: application/pdf; name="interno.pdf"
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+--interno--
+--externo
+Content-Type: text/csv; name="planilha.csv"
+Content-Disposition: attachment; filename="planilha.csv"
+
+processo;valor
+0001234-56.2024.8.26.0100;10
+--externo--
+epílogo ignorado
+""",
+    # Quoted-printable com quebras suaves, =3D e UTF-8
+    "quoted_printable": CABECALHO + """Content-Type: text/plain; charset=utf-8
+Content-Transfer-Encoding: quoted-printable
+
+Informamos que a resposta ao of=C3=ADcio foi enviada e que a linha longa cont=
+inua aqui, com sinal de igual =3D no meio.
+Segunda linha=20
+""",
+    # Corpo em base64 e anexo base64 com linhas de tamanhos irregulares (fora de múltiplos de 4)
+    "base64": CABECALHO + f"""Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: text/plain; charset=utf-8
+Content-Transfer-Encoding: base64
+
+{_b64("Corpo codificado em base64 com acentuação.".encode())}
+--mix
+Content-Type: application/pdf
+Content-Disposition: attachment; filename="quebrado.pdf"
+Content-Transfer-Encoding: base64
+
+{base64.b64encode(PDF).decode()[:57]}
+{base64.b64encode(PDF).decode()[57:130]}
+{base64.b64encode(PDF).decode()[130:]}
+--mix--
+""",
+    # E-mail encaminhado (message/rfc822): não vira anexo, nem os anexos dele
+    "encaminhado": CABECALHO + f"""Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: text/plain
+
+Encaminho a mensagem original.
+--mix
+Content-Type: message/rfc822
+
+From: outro@exemplo
+Subject: original
+Content-Type: multipart/mixed; boundary="orig"
+
+--orig
+Content-Type: text/plain
+
+corpo original
+--orig
+Content-Type: application/pdf; name="original.pdf"
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+--orig--
+--mix
+Content-Type: application/pdf; name="minuta.pdf"
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+--mix--
+""",
+    # Nomes RFC 2231: codificado e com continuação
+    "rfc2231": CABECALHO + f"""Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: text/plain
+
+Corpo.
+--mix
+Content-Type: application/pdf
+Content-Disposition: attachment; filename*=utf-8''rela%C3%A7%C3%A3o%20final.pdf
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+--mix
+Content-Type: application/pdf
+Content-Disposition: attachment;
+ filename*0*=utf-8''of%C3%ADcio%20;
+ filename*1*=n%C2%BA%20123.pdf
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+--mix--
+""",
+    # Linhas começadas por ponto (dot-stuffing no POP3) no corpo e num anexo texto
+    "dot_stuffing": CABECALHO + """Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: text/plain
+
+.
+..linha com dois pontos
+.linha com um ponto
+--mix
+Content-Type: text/plain; name="notas.txt"
+Content-Disposition: attachment; filename="notas.txt"
+
+.primeira
+...
+--mix--
+""",
+    # Segundo text/plain sem disposition: é corpo candidato e anexo ao mesmo tempo
+    "dois_textos": CABECALHO + """Content-Type: multipart/mixed; boundary="mix"
+
+--mix
+Content-Type: text/html
+
+<p>html primeiro</p>
+--mix
+Content-Type: text/plain
+
+texto puro
+--mix
+Content-Type: text/plain
+
+outro texto
+--mix--
+""",
+    "so_texto": CABECALHO + """Content-Type: text/plain; charset=utf-8
+
+Mensagem simples, sem anexos.
+""",
+    # Mensagem de parte única não multipart: o stdlib não lista anexos
+    "so_pdf": CABECALHO + f"""Content-Type: application/pdf; name="minuta.pdf"
+Content-Disposition: attachment; filename="minuta.pdf"
+Content-Transfer-Encoding: base64
+
+{_b64(PDF)}
+""",
+}
+
+def _linhas(texto):
+    return texto.encode("utf-8").split(b"\n")
+
+def _stdlib(linhas):
+    msg = BytesParser(policy=policy.default).parsebytes(b"\n".join(linhas))
+    corpo = msg.get_body(preferencelist=("plain", "html"))
+    anexos = []
+    for part in msg.iter_attachments():
+        conteudo = part.get_payload(decode=True)
+        if conteudo:
+            anexos.append((part.get_filename() or "sem_nome", part.get_content_type(), conteudo))
+    return corpo.get_content().strip() if corpo else None, anexos
+
+def _streaming(linhas):
+    leitor = LeitorMime()
+    try:
+        retr_em_fluxo(POP3Falso([linhas], "teste"), 1, leitor.alimentar)
+        resultado = leitor.finalizar()
+        anexos = []
+        for anexo in resultado["anexos"]:
+            with open(anexo.caminho, "rb") as f:
+                anexos.append((anexo.nome, anexo.tipo, f.read()))
+        return resultado["corpo_texto"], anexos
+    finally:
+        leitor.descartar_anexos()
+
+@pytest.mark.parametrize("nome", sorted(MENSAGENS))
+def test_leitor_igual_ao_parser_completo(nome):
+    linhas = _linhas(MENSAGENS[nome])
+    assert _streaming(linhas) == _stdlib(linhas)
+
+def test_logo_inline_nao_vira_anexo():
+    corpo, anexos = _streaming(_linhas(MENSAGENS["related_inline"]))
+    assert corpo == "Segue a minuta."
+    assert [(n, t) for n, t, _ in anexos] == [("minuta.pdf", "application/pdf")]
+    assert anexos[0][2] == PDF
+
+def test_nomes_rfc2231():
+    _, anexos = _streaming(_linhas(MENSAGENS["rfc2231"]))
+    assert [n for n, _, _ in anexos] == ["relação final.pdf", "ofício nº 123.pdf"]
+
+def test_dot_stuffing_desfeito():
+    corpo, anexos = _streaming(_linhas(MENSAGENS["dot_stuffing"]))
+    assert corpo == ".\n..linha com dois pontos\n.linha com um ponto"
+    assert anexos[0][2] == b".primeira\n..."
+
+def test_filtro_de_cabecalho_descarta_mensagem():
+    leitor = LeitorMime(filtro_cabecalho=lambda cabecalho: False)
+    for linha in _linhas(MENSAGENS["related_inline"]):
+        leitor.alimentar(linha)
+    resultado = leitor.finalizar()
+    assert leitor.descartar
+    assert resultado["anexos"] == []
+    assert resultado["cabecalho"]["Subject"] == "RESPOSTA FINAL - Oficio 123"
@@ -0,0 +1,70 @@
+import json
+
+from backend.lote_ia import BackendArquivoLocal, escrever_requisicoes, ler_resultados
+
+def _entrada(id_email):
+    return {
+        "id_email": id_email,
+        "assunto": f"RESPOSTA FINAL - Ofício {id_email}",
+        "corpo": "Segue a minuta de resposta e o comprovante de assinatura.",
+        "nomes_anexos": ["minuta.pdf", "assinatura.pdf"],
+        "textos_anexos": ["", ""],
+        "campos_extraidos": {"processo": None, "opaj": None, "identificador": None},
+    }
+
+def _veredito(body):
+    # Aprova só o e-mail 1, para conferir que cada resultado volta para o custom_id certo
+    valido = "Ofício 1" in body["messages"][-1]["content"]
+    return json.dumps({
+        "valido": valido, "campos_faltantes": [], "coerencia": valido,
+        "motivo": "ok" if valido else "revisar", "acao_sugerida": "protocolar" if valido else "revisar",
+    })
+
+def test_ida_e_volta_backend_local(tmp_path):
+    requisicoes = tmp_path / "requisicoes.jsonl"
+    escrever_requisicoes(requisicoes, [_entrada(1), _entrada(2)], modelo="modelo-teste")
+
+    linhas = [json.loads(l) for l in requisicoes.read_text(encoding="utf-8").splitlines()]
+    assert [l["custom_id"] for l in linhas] == ["email-1", "email-2"]
+    assert all(l["body"]["model"] == "modelo-teste" for l in linhas)
+
+    backend = BackendArquivoLocal(tmp_path / "local", responder=_veredito)
+    id_externo = backend.enviar(requisicoes)
+    assert backend.consultar(id_externo) == "concluido"
+    assert backend.consultar("local-inexistente") == "erro"
+
+    resultados_jsonl = tmp_path / "resultados.jsonl"
+    backend.baixar_resultados(id_externo, resultados_jsonl)
+    resultados = ler_resultados(resultados_jsonl)
+
+    assert set(resultados) == {"email-1", "email-2"}
+    assert resultados["email-1"]["acao_sugerida"] == "protocolar"
+    assert resultados["email-2"]["acao_sugerida"] == "revisar"
+
+def test_linhas_com_erro_e_custom_id_desconhecido_ou_ausente(tmp_path):
+    ok = {"choices": [{"message": {"role": "assistant", "content": json.dumps({"valido": True, "acao_sugerida": "protocolar"})}}]}
+    linhas = [
+        {"custom_id": "email-1", "response": {"status_code": 200, "body": ok}, "error": None},
+        # Erro da requisição (arquivo de erros da Batch API)
+        {"custom_id": "email-2", "response": None, "error": {"code": "server_error", "message": "falhou"}},
+        # Resposta HTTP com erro no corpo
+        {"custom_id": "email-3", "response": {"status_code": 429, "body": {"error": {"message": "limite"}}}, "error": None},
+        # Conteúdo que não é JSON
+        {"custom_id": "email-4", "response": {"status_code": 200, "body": {"choices": [{"message": {"content": "talvez"}}]}}, "error": None},
+        # custom_id que não pertence ao lote e linha sem custom_id
+        {"custom_id": "email-999", "response": {"status_code": 200, "body": ok}, "error": None},
+        {"response": {"status_code": 200, "body": ok}, "error": None},
+    ]
+    arquivo = tmp_path / "resultados.jsonl"
+    arquivo.write_text("\n".join(json.dumps(l) for l in linhas) + "\n\n", encoding="utf-8")
+
+    resultados = ler_resultados(arquivo)
+
+    assert set(resultados) == {"email-1", "email-2", "email-3", "email-4", "email-999"}
+    assert resultados["email-1"] == {"valido": True, "acao_sugerida": "protocolar"}
+    for custom_id in ("email-2", "email-3"):
+        assert resultados[custom_id]["valido"] is None
+        assert resultados[custom_id]["acao_sugerida"] == "aguardar"
+    assert "falhou" in resultados["email-2"]["motivo"]
+    assert "limite" in resultados["email-3"]["motivo"]
+    assert resultados["email-4"]["erro_ia"] == "json_decode_error"
@@ -0,0 +1,45 @@
+import os
+import uuid
+
+import psycopg2
+import pytest
+
+from backend.migracoes import CONSULTAS_QUENTES, aplicar_migracoes, remover_indice_invalido, verificar_planos
+
+# E-mails sintéticos inseridos antes do EXPLAIN (desfeitos com rollback no fim)
+SEMEAR = int(os.getenv("DB_TESTES_SEMEAR", "20000"))
+
+def test_consultas_quentes_sem_seq_scan(banco):
+    aplicar_migracoes()
+    planos = verificar_planos(semear=SEMEAR)
+    assert set(planos) == set(CONSULTAS_QUENTES)
+    assert {nome: tabelas for nome, tabelas in planos.items() if tabelas} == {}
+
+def test_indice_concorrente_invalido_e_recriado(banco):
+    from backend.utils import nova_conexao
+    tabela = f"teste_indice_{uuid.uuid4().hex[:8]}"
+    comando = f"CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_{tabela} ON {tabela} (valor)"
+    conn = nova_conexao()
+    conn.autocommit = True
+    cur = conn.cursor()
+    try:
+        cur.execute(f"CREATE TABLE {tabela} (valor INTEGER)")
+        cur.execute(f"INSERT INTO {tabela} VALUES (1), (1)")
+        # A criação falha no meio e deixa o índice INVALID
+        with pytest.raises(psycopg2.errors.UniqueViolation):
+            cur.execute(comando)
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (f"uq_{tabela}",))
+        assert cur.fetchone() == (False,)
+
+        cur.execute(f"DELETE FROM {tabela}")
+        assert remover_indice_invalido(cur, comando)
+        cur.execute(comando)
+        cur.execute("SELECT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)", (f"uq_{tabela}",))
+        assert cur.fetchone() == (True,)
+        # Índice válido ou comando sem índice concorrente: nada a fazer
+        assert not remover_indice_invalido(cur, comando)
+        assert not remover_indice_invalido(cur, f"ALTER TABLE {tabela} ADD COLUMN x INTEGER")
+    finally:
+        cur.execute(f"DROP TABLE IF EXISTS {tabela}")
+        cur.close()
+        conn.close()
@@ -0,0 +1,92 @@
+"""
+Orçamento de tokens do prompt: divisão entre os campos e entre os anexos,
+corte com marca e prompt dentro do orçamento mesmo com entradas enormes.
+Vale com tiktoken ou com a estimativa de ~4 caracteres por token.
+"""
+import pytest
+
+from backend.ia_validador import INSTRUCOES_VALIDACAO, prompt_formal_ia
+from backend.orcamento_prompt import contar_tokens, distribuir_orcamento, truncar_tokens
+
+CAMPOS = {"processo": None, "opaj": None, "identificador": None}
+SUFIXO = " […]"
+
+def test_campos_curtos_ficam_inteiros_e_a_sobra_e_redistribuida():
+    limites = distribuir_orcamento({"a": 10, "b": 1000, "c": 1000}, {"a": 1, "b": 1, "c": 1}, 300)
+    assert limites == {"a": 10, "b": 145, "c": 145}
+
+def test_pesos():
+    limites = distribuir_orcamento({"corpo": 1000, "assunto": 1000}, {"corpo": 4, "assunto": 1}, 500)
+    assert limites == {"corpo": 400, "assunto": 100}
+
+def test_tudo_cabe():
+    tamanhos = {"a": 10, "b": 20, "vazio": 0}
+    assert distribuir_orcamento(tamanhos, {"a": 1, "b": 1, "vazio": 1}, 1000) == tamanhos
+
+@pytest.mark.parametrize("total", [0, 1, 7, 100, 5000])
+@pytest.mark.parametrize("tamanhos", [
+    {i: 200 for i in range(40)},                     # muitos anexos do mesmo tamanho
+    {0: 10, 1: 100_000, 2: 25},                      # um anexo enorme
+    {i: (i * 37) % 500 for i in range(25)},
+])
+def test_nunca_passa_do_total(tamanhos, total):
+    limites = distribuir_orcamento(tamanhos, {c: 1 for c in tamanhos}, total)
+    assert set(limites) == set(tamanhos)
+    assert sum(limites.values()) <= total
+    assert all(0 <= limites[c] <= tamanhos[c] for c in tamanhos)
+
+def test_muitos_anexos_dividem_igualmente():
+    limites = distribuir_orcamento({i: 200 for i in range(30)}, {i: 1 for i in range(30)}, 600)
+    assert set(limites.values()) == {20}
+
+def test_anexo_enorme_nao_tira_espaco_dos_pequenos():
+    limites = distribuir_orcamento({0: 10, 1: 100_000, 2: 25}, {0: 1, 1: 1, 2: 1}, 300)
+    assert limites == {0: 10, 1: 265, 2: 25}
+
+def test_truncar_tokens():
+    texto = "palavra " * 500
+    assert truncar_tokens("curto", 10) == "curto"
+    assert truncar_tokens(None, 10) == ""
+    assert truncar_tokens(texto, 0) == ""
+    cortado = truncar_tokens(texto, 20)
+    assert cortado.endswith(SUFIXO)
+    assert texto.startswith(cortado[:-len(SUFIXO)])
+    assert contar_tokens(cortado) <= 20 + contar_tokens(SUFIXO)
+
+def _variavel(prompt):
+    """Tokens do prompt além da parte fixa (instruções e títulos)."""
+    return contar_tokens(prompt) - contar_tokens(prompt_formal_ia("", "", [], [], CAMPOS))
+
+def test_muitos_anexos_compartilham_o_orcamento():
+    nomes = [f"anexo_{i:02d}.pdf" for i in range(30)]
+    textos = [f"documento {i} " + "conteúdo do anexo " * 300 for i in range(30)]
+    prompt = prompt_formal_ia("RESPOSTA FINAL - Ofício 1", "Segue a resposta.", nomes, textos, CAMPOS, 3000)
+
+    # Rótulos "n. nome / Prévia:" e marcas de corte não entram no orçamento
+    assert _variavel(prompt) <= 3000 + 30 * 10
+    for i, nome in enumerate(nomes):
+        assert nome in prompt
+        assert f"Prévia: documento {i} " in prompt
+
+def test_anexo_enorme_e_cortado_e_os_pequenos_ficam_inteiros():
+    textos = ["assinatura digital válida", "extrato " * 50_000, "minuta do processo 123"]
+    prompt = prompt_formal_ia(
+        "RESPOSTA FINAL", "Segue.", ["assinatura.pdf", "extrato.pdf", "minuta.pdf"], textos, CAMPOS, 1000
+    )
+    assert "Prévia: assinatura digital válida\n" in prompt
+    assert "Prévia: minuta do processo 123\n" in prompt
+    assert "extrato extrato" in prompt and "extrato " * 1000 not in prompt
+    assert _variavel(prompt) <= 1000 + 30
+
+@pytest.mark.parametrize("orcamento", [1, 10, 50])
+def test_orcamento_menor_que_a_parte_fixa(orcamento):
+    assert orcamento < contar_tokens(INSTRUCOES_VALIDACAO)
+    prompt = prompt_formal_ia(
+        "A" * 4000, "palavra " * 5000, [f"anexo_{i}.pdf" for i in range(5)],
+        ["texto longo " * 3000] * 5, CAMPOS, orcamento,
+    )
+    # A parte fixa nunca é cortada; os campos variáveis encolhem até quase nada
+    assert prompt.startswith(INSTRUCOES_VALIDACAO)
+    for titulo in ("### Dados recebidos:", "### Anexos recebidos (5):", "### Campos extraídos"):
+        assert titulo in prompt
+    assert _variavel(prompt) <= orcamento + 30
@@ -0,0 +1,32 @@
+from datetime import datetime
+
+import pytest
+
+from backend.paginacao import CursorInvalido, decodificar_cursor, filtro_keyset, paginar
+
+def test_cursor_com_momento_nulo():
+    rows = [{"criado_em": None, "id_protocolo": i} for i in (9, 8, 7)]
+    pagina, cursor = paginar(rows, 2, "criado_em", "id_protocolo")
+    assert [r["id_protocolo"] for r in pagina] == [9, 8]
+    assert decodificar_cursor(cursor) == (None, 8)
+
+    filtro, params = filtro_keyset("p.criado_em", "p.id_protocolo", cursor)
+    assert "p.criado_em IS NULL AND p.id_protocolo < %s" in filtro
+    assert "p.criado_em IS NOT NULL" in filtro
+    assert params == [8]
+
+def test_cursor_com_momento():
+    momento = datetime(2025, 1, 6, 10, 30)
+    rows = [{"recebido_em": momento, "id_email": 5}, {"recebido_em": momento, "id_email": 4}]
+    _, cursor = paginar(rows, 1, "recebido_em", "id_email")
+    assert decodificar_cursor(cursor) == (momento, 5)
+    assert filtro_keyset("e.recebido_em", "e.id_email", cursor) == (
+        " AND (e.recebido_em, e.id_email) < (%s, %s)", [momento, 5]
+    )
+
+def test_ultima_pagina_sem_cursor():
+    assert paginar([{"m": None, "id": 1}], 1, "m", "id") == ([{"m": None, "id": 1}], None)
+
+def test_cursor_invalido():
+    with pytest.raises(CursorInvalido):
+        decodificar_cursor("nao-e-um-cursor")
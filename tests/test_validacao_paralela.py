@@ -0,0 +1,162 @@
+"""
+Validação paralela (pipeline.validar_em_paralelo) contra um backend de IA
+falso: mesmos resultados do modo serial, na ordem de entrada, inclusive
+quando parte das chamadas falha.
+"""
+import json
+import re
+import threading
+import time
+
+import pytest
+
+from backend import backends_ia, ia_validador, pipeline
+from backend.backends_ia import BackendIA, RespostaIA
+from backend.limitador_taxa import LimitadorTaxa
+
+OFICIO_RE = re.compile(r"Ofício (\d+)")
+
+class BackendFalso(BackendIA):
+    """
+    Responde conforme o número do ofício no assunto. Os primeiros demoram
+    mais, para as respostas chegarem fora da ordem de envio; os números em
+    `falhas` levantam exceção como um erro de API.
+    """
+
+    def __init__(self, falhas=(), demora=0.02):
+        self.falhas = set(falhas)
+        self.demora = demora
+        self.chamadas = []
+        self._lock = threading.Lock()
+
+    def completar(self, mensagens, modelo, formato_resposta=None):
+        numero = int(OFICIO_RE.search(mensagens[-1]["content"]).group(1))
+        with self._lock:
+            self.chamadas.append(numero)
+        time.sleep(self.demora / (numero + 1))
+        if numero in self.falhas:
+            raise RuntimeError(f"timeout no ofício {numero}")
+        valido = numero % 3 != 0
+        return RespostaIA(
+            conteudo=json.dumps({
+                "valido": valido,
+                "campos_faltantes": [] if valido else ["assinatura"],
+                "coerencia": valido,
+                "motivo": f"ofício {numero}",
+                "acao_sugerida": "protocolar" if valido else "rejeitar",
+            }),
+            prompt_tokens=100,
+            completion_tokens=20,
+        )
+
+def _entrada(numero):
+    # Sem identificadores: as regras não decidem e o e-mail vai à IA
+    return {
+        "id_email": numero,
+        "assunto": f"RESPOSTA FINAL - Ofício {numero}",
+        "corpo": "Segue a resposta.",
+        "anexos": [{"nome_arquivo": "minuta.pdf", "tipo": "application/pdf"}],
+        "nomes_anexos": ["minuta.pdf"],
+        "textos_anexos": {},
+        "status_captura": None,
+        "campos_extraidos": {"processo": None, "opaj": None, "identificador": None},
+    }
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(ia_validador, "IA_CACHE", False)
+    monkeypatch.setattr(ia_validador, "limitador_ia", LimitadorTaxa())
+
+    def definir(falhas=()):
+        falso = BackendFalso(falhas)
+        monkeypatch.setattr(backends_ia, "_backend_ia", falso)
+        return falso
+
+    return definir
+
+ENTRADAS = [_entrada(i) for i in range(12)]
+
+@pytest.mark.parametrize("concorrencia", [1, 4, 12, 32])
+def test_paralelo_igual_ao_serial_e_na_ordem(backend, concorrencia):
+    backend()
+    serial = [pipeline.validar_email(e) for e in ENTRADAS]
+    paralelo = list(pipeline.validar_em_paralelo(ENTRADAS, concorrencia))
+
+    assert [e["id_email"] for e, _ in paralelo] == list(range(12))
+    assert [r for _, r in paralelo] == serial
+    assert [r["motivo"] for r in serial] == [f"ofício {i}" for i in range(12)]
+    assert all(r["camada"] == pipeline.CAMADA_IA for r in serial)
+
+def test_falha_parcial_nao_afeta_os_demais(backend):
+    falso = backend(falhas={2, 7})
+    paralelo = list(pipeline.validar_em_paralelo(ENTRADAS, 4))
+
+    assert [e["id_email"] for e, _ in paralelo] == list(range(12))
+    assert sorted(falso.chamadas) == list(range(12))
+    for entrada, resultado in paralelo:
+        numero = entrada["id_email"]
+        if numero in (2, 7):
+            assert resultado["erro_ia"] == f"timeout no ofício {numero}"
+            assert resultado["valido"] is None
+            assert resultado["acao_sugerida"] == "aguardar"
+        else:
+            assert "erro_ia" not in resultado
+            assert resultado["motivo"] == f"ofício {numero}"
+            assert resultado["valido"] is (numero % 3 != 0)
+
+def test_pipeline_reagenda_so_as_falhas(backend, monkeypatch):
+    backend(falhas={2, 7})
+    lotes = [[{"id_email": i} for i in range(12)], []]
+    gravados, reagendados = [], []
+
+    class Conexao:
+        def cursor(self, cursor_factory=None):
+            return self
+
+        def execute(self, query, params=None):
+            pass
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    class Renovador:
+        def __init__(self, worker, ids):
+            pass
+
+        def concluir(self, id_email):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    def gravar_ou_reagendar(cur, entrada, resultado_ia):
+        if resultado_ia.get("erro_ia"):
+            reagendados.append(entrada["id_email"])
+            return False
+        gravados.append(entrada["id_email"])
+        return True
+
+    monkeypatch.setattr(pipeline, "get_conn", Conexao)
+    monkeypatch.setattr(pipeline, "RenovadorClaims", Renovador)
+    monkeypatch.setattr(pipeline, "reivindicar_emails", lambda cur, worker, quantidade, data: lotes.pop(0))
+    monkeypatch.setattr(pipeline, "preparar_emails", lambda cur, emails: [_entrada(e["id_email"]) for e in emails])
+    monkeypatch.setattr(pipeline, "anexar_textos", lambda conn, entradas: None)
+    monkeypatch.setattr(pipeline, "confirmar_claim", lambda cur, worker, id_email: True)
+    monkeypatch.setattr(pipeline, "gravar_ou_reagendar", gravar_ou_reagendar)
+    monkeypatch.setattr(pipeline, "liberar_emails", lambda cur, worker, ids: None)
+
+    resultado = pipeline.pipeline(tamanho_lote=12, concorrencia=4)
+
+    assert gravados == [i for i in range(12) if i not in (2, 7)]
+    assert reagendados == [2, 7]
+    assert resultado["processados"] == 10
+    assert resultado["falhas"] == 2
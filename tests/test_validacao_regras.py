@@ -0,0 +1,98 @@
+import pytest
+
+from backend.validacao_regras import CAMADA_REGRAS, pre_validar
+
+CNJ = "0001234-56.2024.8.26.0100"
+CNJ_DIGITOS = "00012345620248260100"
+
+def _anexo(nome, tipo="application/pdf"):
+    return {"nome_arquivo": nome, "tipo": tipo}
+
+def _entrada(anexos=None, assunto="RESPOSTA FINAL", corpo="Segue a resposta ao ofício.",
+             processo=None, opaj=None, identificador=None, status_captura=None):
+    return {
+        "anexos": anexos if anexos is not None else [
+            _anexo(f"minuta_{CNJ_DIGITOS}.pdf"), _anexo("assinatura.pdf")
+        ],
+        "assunto": assunto,
+        "corpo": corpo,
+        "status_captura": status_captura,
+        "campos_extraidos": {"processo": processo, "opaj": opaj, "identificador": identificador},
+    }
+
+def _aprovado(resultado):
+    return resultado is not None and resultado["valido"] is True and resultado["acao_sugerida"] == "protocolar"
+
+@pytest.mark.parametrize("minuta", [f"minuta_{CNJ}.pdf", f"minuta_{CNJ_DIGITOS}.pdf", f"Resposta Oficio {CNJ}.PDF"])
+def test_aprova_cnj_igual_ao_nome_da_minuta(minuta):
+    resultado = pre_validar(_entrada([_anexo(minuta), _anexo("assinatura.pdf")], processo=CNJ))
+    assert _aprovado(resultado)
+    assert resultado["camada"] == CAMADA_REGRAS
+    assert CNJ in resultado["motivo"]
+
+def test_cnj_diferente_ou_parcial_vai_para_ia():
+    outro = _entrada([_anexo("minuta_0009999-56.2024.8.26.0100.pdf"), _anexo("assinatura.pdf")], processo=CNJ)
+    assert pre_validar(outro) is None
+    # Só um trecho dos dígitos do CNJ no nome da minuta não basta
+    parcial = _entrada([_anexo("minuta_0001234.pdf"), _anexo("assinatura.pdf")], processo=CNJ)
+    assert pre_validar(parcial) is None
+
+def test_processo_que_nao_e_cnj_vai_para_ia():
+    # Número administrativo de 6+ dígitos: mesmo igual ao nome da minuta, não aprova sozinho
+    entrada = _entrada([_anexo("minuta_123456.pdf"), _anexo("assinatura.pdf")], processo="123456")
+    assert pre_validar(entrada) is None
+
+def test_opaj_exato_aprova_e_substring_nao():
+    exato = _entrada([_anexo("minuta_opaj_98765.pdf"), _anexo("assinatura.pdf")], opaj="98765")
+    assert _aprovado(pre_validar(exato))
+    substring = _entrada([_anexo("minuta_opaj_1987650.pdf"), _anexo("assinatura.pdf")], opaj="98765")
+    assert pre_validar(substring) is None
+
+def test_fnda_aprova_e_dila_nao():
+    fnda = _entrada([_anexo("minuta FNDA-2024001.pdf"), _anexo("assinatura.pdf")], identificador="FNDA-2024001")
+    assert _aprovado(pre_validar(fnda))
+    dila = _entrada([_anexo("minuta DILA-2024001.pdf"), _anexo("assinatura.pdf")], identificador="DILA-2024001")
+    assert pre_validar(dila) is None
+
+def test_identificador_so_em_anexo_que_nao_e_minuta_vai_para_ia():
+    entrada = _entrada([_anexo("minuta.pdf"), _anexo(f"assinatura_{CNJ_DIGITOS}.pdf")], processo=CNJ)
+    assert pre_validar(entrada) is None
+
+@pytest.mark.parametrize("texto", [
+    "Segue extrato do período", "Encaminho o contrato", "Termo de ciência", "comprovante de depósito",
+    "planilha de cálculo", "fatura em aberto", "procuração anexa", "Seguem em anexo os documentos",
+    "SEGUE ANEXO",
+])
+def test_documento_adicional_citado_vai_para_ia(texto):
+    assert pre_validar(_entrada(corpo=texto, processo=CNJ)) is None
+    assert pre_validar(_entrada(assunto=f"RESPOSTA FINAL - {texto}", processo=CNJ)) is None
+
+def test_anexo_que_nao_e_documento_vai_para_ia():
+    anexos = [_anexo(f"minuta_{CNJ_DIGITOS}.pdf"), _anexo("assinatura.pdf"), _anexo("logo.png", "image/png")]
+    assert pre_validar(_entrada(anexos, processo=CNJ)) is None
+
+@pytest.mark.parametrize("anexos, status_captura", [([], None), ([_anexo("minuta.pdf")], "sem_anexo")])
+def test_rejeita_sem_anexo(anexos, status_captura):
+    resultado = pre_validar(_entrada(anexos, status_captura=status_captura, processo=CNJ))
+    assert resultado["valido"] is False
+    assert resultado["acao_sugerida"] == "rejeitar"
+    assert resultado["campos_faltantes"] == ["minuta", "assinatura"]
+    assert resultado["camada"] == CAMADA_REGRAS
+
+def test_rejeita_fora_do_padrao_sem_minuta_nem_assinatura():
+    resultado = pre_validar(_entrada([_anexo("documento.pdf")], status_captura="fora_do_padrao", processo=CNJ))
+    assert resultado["valido"] is False
+    assert resultado["acao_sugerida"] == "rejeitar"
+    assert {"minuta", "assinatura"} <= set(resultado["campos_faltantes"])
+
+def test_fora_do_padrao_com_minuta_vai_para_ia():
+    # Tem os documentos, mas o corpo fora do padrão precisa da leitura da IA
+    assert pre_validar(_entrada(status_captura="fora_do_padrao", processo=CNJ)) is None
+
+def test_incompleto_vai_para_ia():
+    assert pre_validar(_entrada([_anexo(f"minuta_{CNJ_DIGITOS}.pdf")], processo=CNJ)) is None
+    # Bloqueio citado sem documento de bloqueio anexo
+    assert pre_validar(_entrada(corpo="Resposta ao bloqueio judicial.", processo=CNJ)) is None
+
+def test_sem_identificador_vai_para_ia():
+    assert pre_validar(_entrada()) is None